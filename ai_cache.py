@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so prompts that differ only in spacing share an entry."""
+    return " ".join(prompt.split())
+
+
+def cache_key(prompt, model_name, params=None):
+    payload = json.dumps(
+        {"model": model_name, "prompt": normalize_prompt(prompt), "params": params or {}},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Two-tier cache of generated text: an in-memory LRU in front of an optional SQLite file.
+
+    Entries expire after `ttl` seconds. Each tier is capped at its own number
+    of entries, dropping the least recently used.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, path=None, disk_entries=None):
+        self.max_entries = max_entries or config.AI_CACHE_SIZE
+        self.ttl = ttl or config.AI_CACHE_TTL_SECONDS
+        self.disk_entries = disk_entries or config.AI_CACHE_DISK_SIZE
+        self._memory = OrderedDict()  # key -> (expires, text), most recently used last
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "bypasses": 0, "evictions": 0}
+
+        self._db = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._db:
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS generations (
+                        key TEXT PRIMARY KEY,
+                        text TEXT NOT NULL,
+                        expires REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                """)
+                self._db.execute("DELETE FROM generations WHERE expires < ?", (time.time(),))
+
+    def get(self, key):
+        """Return the cached text for a key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT text, expires FROM generations WHERE key = ? AND expires > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    with self._db:
+                        self._db.execute("UPDATE generations SET last_used = ? WHERE key = ?", (now, key))
+                    self._remember(key, row[1], row[0])
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, text):
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._remember(key, expires, text)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO generations (key, text, expires, last_used) VALUES (?, ?, ?, ?)",
+                        (key, text, expires, now)
+                    )
+                    self._db.execute("""
+                        DELETE FROM generations WHERE key IN (
+                            SELECT key FROM generations ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.disk_entries,))
+
+    def _remember(self, key, expires, text):
+        self._memory[key] = (expires, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def bypass(self):
+        """Count a lookup that skipped the cache on purpose."""
+        with self._lock:
+            self.stats["bypasses"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM generations")
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
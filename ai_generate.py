@@ -0,0 +1,276 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+from ai_cache import GenerationCache, cache_key
+from ai_quota import estimate_tokens, get_rate_limiter
+
+_cache = None
+_cache_lock = threading.Lock()
+_models = {}
+_models_lock = threading.Lock()
+_genai = None
+
+
+def load_genai():
+    """Import and configure the Gemini SDK on first use; the import alone takes about a second."""
+    global _genai
+    with _models_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if config.GEMINI_API_ENDPOINT:
+                genai.configure(api_key=config.GOOGLE_API_KEY, transport="rest",
+                                client_options={"api_endpoint": config.GEMINI_API_ENDPOINT})
+            else:
+                genai.configure(api_key=config.GOOGLE_API_KEY)
+            _genai = genai
+    return _genai
+
+
+def retryable_errors():
+    """Rate limiting (429) and server-side (5xx) failures are worth another try."""
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServerError,
+    )
+
+
+def build_prompt(sender_name, receiver_name, description):
+    """Compose the prompt (we ask Gemini to start with a subject on first line)."""
+    return (
+        f"Write a professional email from {sender_name} to {receiver_name}. "
+        f"The email should be about: {description}. "
+        "Start the email with a subject line on the first line, then a blank line, followed by the body."
+    )
+
+
+def extract_subject_and_body(content):
+    """Split generated text into (subject, body); the first non-empty line is the subject."""
+    lines = content.split("\n")
+    subject = ""
+    body_lines = []
+
+    for i, line in enumerate(lines):
+        if line.strip() and not subject:  # First non-empty line is subject
+            subject = line.strip()
+            continue
+        if subject and line.strip():  # Everything else is body
+            body_lines = lines[i:]
+            break
+
+    body = "\n".join(body_lines).strip()
+    if not subject:
+        subject = "Generated Email"
+
+    return subject[9:], body
+
+
+def get_model(model_name=None, generation_config=None):
+    """Return a shared GenerativeModel for a model name and settings."""
+    model_name = model_name or config.GEMINI_MODEL
+    key = (model_name, json.dumps(generation_config or {}, sort_keys=True, default=str))
+    genai = load_genai()
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = genai.GenerativeModel(model_name, generation_config=generation_config)
+    return model
+
+
+def with_retries(call, retries=None, base_delay=None, cancelled=None):
+    """Run call(), retrying 429 and 5xx errors with exponential backoff and full jitter."""
+    retries = config.AI_MAX_RETRIES if retries is None else retries
+    base_delay = config.AI_RETRY_BASE_SECONDS if base_delay is None else base_delay
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except retryable_errors() as e:
+            if attempt == retries:
+                raise
+            metrics.count("gemini_retries_total", error=e.__class__.__name__)
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            print(f"⚠️ Gemini busy ({e.__class__.__name__}), retrying in {delay:.1f} s...")
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise
+            else:
+                time.sleep(delay)
+
+
+def call_gemini(model, model_name, prompt, generation_config=None, stream=False, on_wait=None, cancelled=None):
+    """Send one generate_content request through the shared rate limiter, with retries.
+
+    Returns (response, reserved tokens); pass both to settle_usage() once the
+    response has been read. on_wait(seconds) is told about any queueing.
+    """
+    limiter = get_rate_limiter()
+    reserved = estimate_tokens(prompt, generation_config)
+
+    def attempt():
+        queued = time.perf_counter()
+        limiter.acquire(reserved, on_wait=on_wait, cancelled=cancelled)
+        metrics.observe("gemini_queue_seconds", time.perf_counter() - queued)
+        if stream:
+            return model.generate_content(prompt, stream=True)
+        return model.generate_content(prompt)
+
+    return with_retries(attempt, cancelled=cancelled), reserved
+
+
+def settle_usage(model_name, reserved, response, estimate=0):
+    usage = getattr(response, "usage_metadata", None)
+    get_rate_limiter().settle(model_name, reserved, usage, estimate)
+    if usage is not None:
+        metrics.count("gemini_tokens_total", getattr(usage, "prompt_token_count", 0) or 0, kind="prompt")
+        metrics.count("gemini_tokens_total", getattr(usage, "candidates_token_count", 0) or 0, kind="output")
+
+
+def get_cache():
+    """Return the process-wide generation cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GenerationCache(path=config.AI_CACHE_PATH if config.AI_CACHE_DISK else None)
+    return _cache
+
+
+def generate_text(prompt, model_name=None, generation_config=None, force=False, cancelled=None, on_wait=None):
+    """Return Gemini's text for a prompt, or None if it gave no text.
+
+    Identical prompts for the same model and settings are answered from the
+    cache; force=True always asks the model and refreshes the cached answer.
+    Calls wait their turn under the Gemini rate limits (see ai_quota), and
+    rate-limit and server errors are retried with backoff.
+    """
+    model_name = model_name or config.GEMINI_MODEL
+    cache = get_cache()
+    key = cache_key(prompt, model_name, generation_config)
+
+    if force:
+        cache.bypass()
+        metrics.count("ai_cache_lookups_total", result="bypass")
+    else:
+        text = cache.get(key)
+        metrics.count("ai_cache_lookups_total", result="miss" if text is None else "hit")
+        if text is not None:
+            print(f"⚡ AI cache hit (hits: {cache.stats['hits']}, misses: {cache.stats['misses']})")
+            return text
+
+    start = time.perf_counter()
+    model = get_model(model_name, generation_config)
+    response, reserved = call_gemini(model, model_name, prompt, generation_config,
+                                     on_wait=on_wait, cancelled=cancelled)
+    settle_usage(model_name, reserved, response)
+    elapsed = time.perf_counter() - start
+    metrics.observe("gemini_request_seconds", elapsed, stream="false")
+    print(f"✅ Gemini answered in {elapsed * 1000:.0f} ms")
+
+    if not response or not hasattr(response, "text"):
+        return None
+    text = response.text.strip()
+    cache.put(key, text)
+    return text
+
+
+def stream_text(prompt, on_chunk, cancelled=None, model_name=None, generation_config=None, force=False,
+                on_wait=None):
+    """Like generate_text, but calls on_chunk(text) with each piece as Gemini streams it.
+
+    A cached answer arrives as a single chunk. If the `cancelled` event is set
+    the stream is abandoned, nothing is cached and None is returned.
+    """
+    model_name = model_name or config.GEMINI_MODEL
+    cache = get_cache()
+    key = cache_key(prompt, model_name, generation_config)
+
+    if force:
+        cache.bypass()
+        metrics.count("ai_cache_lookups_total", result="bypass")
+    else:
+        text = cache.get(key)
+        metrics.count("ai_cache_lookups_total", result="miss" if text is None else "hit")
+        if text is not None:
+            print(f"⚡ AI cache hit (hits: {cache.stats['hits']}, misses: {cache.stats['misses']})")
+            on_chunk(text)
+            return text
+
+    start = time.perf_counter()
+    model = get_model(model_name, generation_config)
+    response, reserved = call_gemini(model, model_name, prompt, generation_config, stream=True,
+                                     on_wait=on_wait, cancelled=cancelled)
+
+    chunks = []
+    try:
+        for chunk in response:
+            if cancelled is not None and cancelled.is_set():
+                print("⚠️ AI generation cancelled")
+                return None
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text (e.g. only safety ratings) are skipped
+                continue
+            if not chunks:
+                first_token = time.perf_counter() - start
+                metrics.observe("gemini_first_token_seconds", first_token)
+                print(f"✅ Gemini first token after {first_token * 1000:.0f} ms")
+            chunks.append(text)
+            on_chunk(text)
+    finally:
+        # Usage metadata is complete once the stream has been read to the end; if it was
+        # abandoned or broke off, charge the prompt and the text so far, not the whole reservation
+        settle_usage(model_name, reserved, response,
+                     estimate=(len(prompt) + sum(len(text) for text in chunks)) // 4 + 1)
+    metrics.observe("gemini_request_seconds", time.perf_counter() - start, stream="true")
+
+    if not chunks:
+        return None
+    text = "".join(chunks).strip()
+    cache.put(key, text)
+    return text
+
+
+def generate_drafts(rows, on_draft=None, concurrency=None, cancelled=None, force=False, on_wait=None):
+    """Generate one email draft per row, several at a time.
+
+    Each row needs `sender`, `receiver`, `description` and `email` (the To
+    address). on_draft(draft) is called from worker threads as each draft
+    finishes, in completion order. Requests share the Gemini rate limiter, so
+    a large batch queues rather than failing. Returns the drafts in row order.
+    """
+    concurrency = concurrency or config.AI_BATCH_CONCURRENCY
+
+    def draft(index, row):
+        result = {"index": index, "email": row["email"], "receiver": row.get("receiver", ""),
+                  "subject": "", "body": "", "ok": False, "error": ""}
+        if cancelled is not None and cancelled.is_set():
+            result["error"] = "Cancelled"
+            return result
+        try:
+            prompt = build_prompt(row.get("sender", ""), row.get("receiver", ""), row.get("description", ""))
+            text = generate_text(prompt, force=force, cancelled=cancelled, on_wait=on_wait)
+        except Exception as e:
+            result["error"] = str(e)
+        else:
+            if text:
+                result["subject"], result["body"] = extract_subject_and_body(text)
+                result["ok"] = True
+            else:
+                result["error"] = "No response from AI model"
+        if on_draft:
+            on_draft(result)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ai-draft") as executor:
+        drafts = list(executor.map(draft, range(len(rows)), rows))
+    elapsed = time.perf_counter() - start
+    print(f"✅ Generated {sum(d['ok'] for d in drafts)}/{len(drafts)} drafts in {elapsed:.1f} s "
+          f"with {concurrency} at a time")
+    return drafts
@@ -0,0 +1,222 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import config
+
+
+class QuotaWaitCancelled(Exception):
+    """Raised by GeminiRateLimiter.acquire() when the caller cancels while queued."""
+
+
+def estimate_tokens(prompt, generation_config=None):
+    """Rough token cost of a request: ~4 characters per prompt token plus the expected output."""
+    output = (generation_config or {}).get("max_output_tokens") or config.AI_EXPECTED_OUTPUT_TOKENS
+    return len(prompt) // 4 + 1 + output
+
+
+class TokenBucket:
+    """Holds up to `capacity` units, refilled continuously at `capacity` per minute.
+
+    The level may go negative when a request turns out to cost more than was
+    reserved; later callers then wait for the debt to be repaid.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, amount):
+        """Charge (or refund, if negative) units after the fact."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class UsageLog:
+    """Gemini requests and tokens per day and model, kept on disk for the last `days` days."""
+
+    def __init__(self, path=None, days=30):
+        self.path = path or config.AI_USAGE_PATH
+        self.days = days
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, usage):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(usage, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def record(self, model_name, prompt_tokens=0, output_tokens=0):
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            usage = self._load()
+            day = usage.setdefault(today, {}).setdefault(
+                model_name, {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+            )
+            day["requests"] += 1
+            day["prompt_tokens"] += prompt_tokens
+            day["output_tokens"] += output_tokens
+            # ISO dates sort chronologically, so the oldest days come first
+            for old in sorted(usage)[:-self.days]:
+                del usage[old]
+            self._save(usage)
+
+    def today(self):
+        """Totals for today across models: {requests, prompt_tokens, output_tokens}."""
+        totals = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+        with self._lock:
+            for counts in self._load().get(datetime.date.today().isoformat(), {}).values():
+                for name in totals:
+                    totals[name] += counts.get(name, 0)
+        return totals
+
+
+class GeminiRateLimiter:
+    """Keeps Gemini calls under requests-per-minute and tokens-per-minute limits.
+
+    Callers queue in arrival order rather than failing; acquire() blocks until
+    both buckets can cover the request. Token costs are estimates up front and
+    are corrected from the response's usage metadata in settle(). A limit of
+    0 turns that bucket off.
+    """
+
+    def __init__(self, rpm=None, tpm=None, usage=None):
+        rpm = config.GEMINI_RPM if rpm is None else rpm
+        tpm = config.GEMINI_TPM if tpm is None else tpm
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.usage = usage or UsageLog()
+        self._cond = threading.Condition()
+        self._queue = deque()  # [tokens] lists, one per waiting caller, in arrival order
+        self.stats = {"requests": 0, "queued": 0, "waited_seconds": 0.0, "max_wait": 0.0}
+
+    def _wait_for(self, requests, tokens, now):
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.wait_time(requests, now)
+        if self.tokens is not None:
+            # A request larger than the whole bucket only waits for a full one
+            wait = max(wait, self.tokens.wait_time(min(tokens, self.tokens.capacity), now))
+        return wait
+
+    def _wait_behind(self, entry, now):
+        """Expected wait for a queued entry, counting everyone ahead of it."""
+        ahead = 0
+        tokens = 0
+        for queued in self._queue:
+            ahead += 1
+            tokens += queued[0]
+            if queued is entry:
+                break
+        return self._wait_for(ahead, tokens, now)
+
+    def expected_wait(self, tokens):
+        """Seconds a request of `tokens` arriving now would wait."""
+        with self._cond:
+            now = time.monotonic()
+            return self._wait_for(len(self._queue) + 1, sum(q[0] for q in self._queue) + tokens, now)
+
+    def acquire(self, tokens, on_wait=None, cancelled=None):
+        """Block until a request of `tokens` may be sent; returns the seconds spent waiting.
+
+        on_wait(seconds) is called whenever the expected wait changes by a
+        second or more, so the caller can tell the user. If the `cancelled`
+        event is set while queued, QuotaWaitCancelled is raised.
+        """
+        entry = [tokens]
+        start = time.monotonic()
+        announced = None
+        queued = False
+        with self._cond:
+            self._queue.append(entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_behind(entry, now)
+                    if self._queue[0] is entry and wait <= 0:
+                        self._queue.popleft()
+                        if self.requests is not None:
+                            self.requests.take(1, now)
+                        if self.tokens is not None:
+                            self.tokens.take(tokens, now)
+                        break
+                    if cancelled is not None and cancelled.is_set():
+                        raise QuotaWaitCancelled("Cancelled while waiting for Gemini quota")
+                    queued = True
+                    if on_wait and (announced is None or abs(announced - wait) >= 1):
+                        announced = wait
+                        on_wait(wait)
+                    # Wake regularly to notice cancellation and a moving queue
+                    self._cond.wait(min(max(wait, 0.05), 0.5))
+            finally:
+                # Entries are compared by identity; two callers may ask for the same tokens
+                for i, queued_entry in enumerate(self._queue):
+                    if queued_entry is entry:
+                        del self._queue[i]
+                        break
+                self._cond.notify_all()
+
+            waited = now - start
+            self.stats["requests"] += 1
+            if queued:
+                self.stats["queued"] += 1
+                self.stats["waited_seconds"] += waited
+                self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        if queued:
+            print(f"⏳ Waited {waited:.1f} s for Gemini quota")
+            if announced is not None:
+                on_wait(0)
+        return waited
+
+    def settle(self, model_name, reserved, usage_metadata=None, estimate=0):
+        """Correct the token bucket with what a request really used and log it for today.
+
+        Without usage metadata (e.g. a stream that broke off) `estimate` tokens
+        are charged instead, if given.
+        """
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage_metadata, "candidates_token_count", 0) or 0
+        total = getattr(usage_metadata, "total_token_count", 0) or prompt_tokens + output_tokens or estimate
+        if total and self.tokens is not None:
+            with self._cond:
+                self.tokens.adjust(total - reserved)
+                self._cond.notify_all()
+        self.usage.record(model_name, prompt_tokens, output_tokens)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter every Gemini call goes through."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = GeminiRateLimiter()
+    return _limiter
@@ -0,0 +1,645 @@
+import asyncio
+import atexit
+import base64
+import imaplib
+import re
+import smtplib
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import config
+import metrics
+from imap_fetch import build_message_set, parse_fetch_response, parse_message_set
+from imap_pool import IMAPLoginError
+from mail_sync import FLAG_ITEMS, HEADER_ITEMS, SYNC_BATCH_SIZE, format_flags, headers_from_records
+from smtp_pool import message_envelope, prepare_message
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+_UNTAGGED_RE = re.compile(rb"\* (?:(\d+) )?([A-Za-z-]+)(?: (.*))?$", re.S)
+_CODE_RE = re.compile(rb"\[([A-Za-z-]+)(?: ([^\]]*))?\]")
+
+
+def _quote(value):
+    """Quote a LOGIN argument; literals would need a continuation round trip."""
+    if "\r" in value or "\n" in value or not value.isascii():
+        raise imaplib.IMAP4.error("Credentials with line breaks or non-ASCII characters need MAIL_BACKEND=sync")
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _transport_error(error):
+    """Whether an error means the connection itself can no longer be trusted."""
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        # smtplib's errors are OSErrors too, but these are ordinary server replies
+        return False
+    if not isinstance(error, Exception):
+        # Cancelled mid-command: the reply may still be on its way
+        return True
+    return isinstance(error, (OSError, EOFError, asyncio.TimeoutError, imaplib.IMAP4.abort))
+
+
+def _search_uids(response):
+    return [int(uid) for line in response.data("SEARCH") if isinstance(line, bytes) for uid in line.split()]
+
+
+class IMAPResponse:
+    """The tagged result of one command and the untagged responses that came with it."""
+
+    def __init__(self, status, text, untagged):
+        self.status = status
+        self.text = text
+        self.untagged = untagged
+
+    def data(self, name):
+        """Untagged data of one type, shaped like imaplib's (bytes and (head, literal) tuples)."""
+        return self.untagged.get(name.upper(), [])
+
+
+class AsyncIMAP:
+    """One IMAP session on an event loop, with any number of commands in flight.
+
+    Commands are written as soon as they are issued, so awaiting several at
+    once (asyncio.gather) pipelines them. A reader task hands each tagged
+    completion to its command; untagged responses go to the oldest command
+    still running, since servers answer pipelined commands in order. Errors
+    are raised as imaplib.IMAP4.error / abort like the imaplib path.
+    """
+
+    def __init__(self, host=None, port=None, use_ssl=None, timeout=None):
+        self.host = host or config.IMAP_HOST
+        self.port = port or config.IMAP_PORT
+        self.use_ssl = config.IMAP_SSL if use_ssl is None else use_ssl
+        self.timeout = timeout or config.MAIL_TIMEOUT_SECONDS
+        self.capabilities = set()
+        self.selected_mailbox = None
+        self.qresync = False
+        self.closed = False
+        self.unsolicited = {}
+        self.reader = self.writer = None
+        self._tag = 0
+        self._pending = deque()  # [tag, future, untagged] per command in flight, oldest first
+        self._reader_task = None
+
+    async def connect(self):
+        context = ssl.create_default_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context), self.timeout
+        )
+        greeting = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        if not greeting.startswith((b"* OK", b"* PREAUTH")):
+            self.writer.close()
+            raise imaplib.IMAP4.abort(f"Unexpected greeting: {greeting!r}")
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        await self.refresh_capabilities()
+
+    async def refresh_capabilities(self):
+        response = await self.check("CAPABILITY")
+        self.capabilities = {
+            word.upper() for line in response.data("CAPABILITY") if isinstance(line, bytes)
+            for word in line.decode("ascii", errors="replace").split()
+        }
+
+    async def login(self, user, password):
+        response = await self.command("LOGIN", _quote(user), _quote(password))
+        if response.status != "OK":
+            raise IMAPLoginError(response.text)
+        await self.refresh_capabilities()
+        # QRESYNC lets mailbox syncs learn about expunged messages without a full UID scan
+        if "QRESYNC" in self.capabilities:
+            self.qresync = (await self.command("ENABLE", "QRESYNC")).status == "OK"
+
+    async def select(self, mailbox):
+        """SELECT a mailbox; returns (message count, UIDVALIDITY, HIGHESTMODSEQ or 0 without CONDSTORE)."""
+        response = await self.check("SELECT", mailbox)
+        self.selected_mailbox = mailbox
+        exists = response.data("EXISTS")
+        uidvalidity = response.data("UIDVALIDITY")
+        highestmodseq = response.data("HIGHESTMODSEQ")
+        return (int(exists[-1]) if exists else 0, int(uidvalidity[-1]) if uidvalidity else 0,
+                int(highestmodseq[-1]) if highestmodseq else 0)
+
+    async def command(self, *words):
+        """Send a command and wait for its tagged response."""
+        if self.closed:
+            raise imaplib.IMAP4.abort("IMAP connection is closed")
+        self._tag += 1
+        tag = f"A{self._tag:04d}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append([tag.encode(), future, {}])
+        self.writer.write(f"{tag} {' '.join(words)}\r\n".encode("utf-8"))
+        verb = words[1] if words[0] == "UID" and len(words) > 1 else words[0]
+        try:
+            with metrics.span("imap_command_seconds", command=verb.lower(), backend="asyncio"):
+                await self.writer.drain()
+                return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # Responses can no longer be matched up reliably
+            self._fail(imaplib.IMAP4.abort(f"{words[0]} timed out"))
+            raise imaplib.IMAP4.abort(f"{words[0]} timed out after {self.timeout} s")
+        except OSError as e:
+            self._fail(e)
+            raise imaplib.IMAP4.abort(str(e))
+
+    async def check(self, *words):
+        """Like command(), but raises imaplib.IMAP4.error unless the server says OK."""
+        response = await self.command(*words)
+        if response.status != "OK":
+            raise imaplib.IMAP4.error(f"{' '.join(words[:2])} failed: {response.text}")
+        return response
+
+    async def _read_response(self):
+        """Read one response line and any literals it announces, as imaplib-style parts."""
+        parts = []
+        line = await self.reader.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed by the server")
+        line = line.rstrip(b"\r\n")
+        while True:
+            match = _LITERAL_RE.search(line)
+            if not match:
+                parts.append(line)
+                return parts
+            literal = await self.reader.readexactly(int(match.group(1)))
+            parts.append((line, literal))
+            line = (await self.reader.readline()).rstrip(b"\r\n")
+
+    def _untagged(self, parts):
+        first = parts[0][0] if isinstance(parts[0], tuple) else parts[0]
+        match = _UNTAGGED_RE.match(first)
+        if not match:
+            return
+        number, name, rest = match.groups()
+        # imaplib drops "* " and the type, keeping "n rest" for numbered responses
+        data = b" ".join(part for part in (number, rest) if part is not None)
+        parts[0] = (data, parts[0][1]) if isinstance(parts[0], tuple) else data
+        untagged = self._pending[0][2] if self._pending else self.unsolicited
+        untagged.setdefault(name.decode().upper(), []).extend(parts)
+        if name.upper() in (b"OK", b"NO", b"BAD"):
+            self._codes(rest or b"", untagged)
+
+    @staticmethod
+    def _codes(text, untagged):
+        """File response codes such as [UIDVALIDITY 7] under their own name, like imaplib."""
+        for code, value in _CODE_RE.findall(text):
+            untagged.setdefault(code.decode().upper(), []).append(value)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                parts = await self._read_response()
+                first = parts[0][0] if isinstance(parts[0], tuple) else parts[0]
+                if first.startswith(b"* "):
+                    self._untagged(parts)
+                    continue
+                if first.startswith(b"+"):
+                    continue
+                tag, _, rest = first.partition(b" ")
+                status, _, text = rest.partition(b" ")
+                for entry in self._pending:
+                    if entry[0] == tag:
+                        self._pending.remove(entry)
+                        self._codes(text, entry[2])
+                        if not entry[1].done():
+                            entry[1].set_result(IMAPResponse(
+                                status.decode().upper(), text.decode("utf-8", errors="replace"), entry[2]
+                            ))
+                        break
+        except asyncio.CancelledError:
+            self._fail(imaplib.IMAP4.abort("IMAP connection closed"))
+            raise
+        except (OSError, asyncio.IncompleteReadError, imaplib.IMAP4.abort, ValueError) as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        """Mark the session dead and fail every command still waiting on it."""
+        self.closed = True
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(imaplib.IMAP4.abort(str(error)))
+        if self.writer is not None:
+            self.writer.close()
+
+    async def close(self):
+        """Log out politely if the session still works, then drop the connection."""
+        if not self.closed:
+            try:
+                await asyncio.wait_for(self.command("LOGOUT"), 5)
+            except (imaplib.IMAP4.error, asyncio.TimeoutError, OSError):
+                pass
+        self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            # Wait for it, or the loop may be torn down with the task still pending
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+
+class AsyncSMTP:
+    """One SMTP session on an event loop; MAIL, RCPT and DATA go out together under PIPELINING.
+
+    Failures raise the smtplib exception the blocking path would, so callers
+    handle both the same way.
+    """
+
+    def __init__(self, host=None, port=None, timeout=None, starttls=None):
+        self.host = host or config.SMTP_HOST
+        self.port = port or config.SMTP_PORT
+        self.timeout = timeout or config.MAIL_TIMEOUT_SECONDS
+        self.starttls = config.SMTP_STARTTLS if starttls is None else starttls
+        self.extensions = {}
+        self.closed = False
+        self.reader = self.writer = None
+
+    async def connect(self):
+        context = ssl.create_default_context()
+        implicit_tls = self.port == 465
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context if implicit_tls else None), self.timeout
+        )
+        code, text = await self.reply()
+        if code != 220:
+            raise smtplib.SMTPConnectError(code, text)
+        await self.ehlo()
+        if not implicit_tls and self.starttls:
+            if "starttls" not in self.extensions:
+                raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+            code, text = await self.command("STARTTLS")
+            if code != 220:
+                raise smtplib.SMTPResponseException(code, text)
+            await self.writer.start_tls(context, server_hostname=self.host)
+            await self.ehlo()
+
+    async def reply(self):
+        """Read a (possibly multi-line) reply; returns (code, text)."""
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                self.closed = True
+                raise smtplib.SMTPServerDisconnected(f"No reply within {self.timeout} s")
+            if not line:
+                self.closed = True
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip().decode("utf-8", errors="replace"))
+            if line[3:4] != b"-":
+                try:
+                    return int(line[:3]), "\n".join(lines)
+                except ValueError:
+                    raise smtplib.SMTPResponseException(-1, line.decode("utf-8", errors="replace"))
+
+    async def command(self, line):
+        self.writer.write(f"{line}\r\n".encode("utf-8"))
+        await self.writer.drain()
+        return await self.reply()
+
+    async def ehlo(self):
+        code, text = await self.command(f"EHLO {socket.gethostname()}")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, text)
+        self.extensions = {}
+        for line in text.split("\n")[1:]:
+            name, _, params = line.partition(" ")
+            self.extensions[name.lower()] = params
+
+    async def login(self, user, password):
+        if "auth" not in self.extensions:
+            raise smtplib.SMTPNotSupportedError("SMTP AUTH extension not supported by server.")
+        token = base64.b64encode(f"\0{user}\0{password}".encode("utf-8")).decode("ascii")
+        code, text = await self.command(f"AUTH PLAIN {token}")
+        if code != 235:
+            raise smtplib.SMTPAuthenticationError(code, text)
+
+    async def send_message(self, msg):
+        """Send an EmailMessage; returns refused recipients like smtplib.SMTP.sendmail."""
+        from_addr, to_addrs = message_envelope(msg)
+        # Flattened up front so nothing but the server can fail halfway through a transaction
+        data, options, _ = prepare_message(msg, from_addr, to_addrs, self.extensions)
+
+        mail = f"MAIL FROM:<{from_addr}>" + "".join(f" {option}" for option in options)
+        lines = [mail] + [f"RCPT TO:<{addr}>" for addr in to_addrs]
+        if "pipelining" in self.extensions:
+            self.writer.write("".join(f"{line}\r\n" for line in lines + ["DATA"]).encode("utf-8"))
+            await self.writer.drain()
+            # Every pipelined command gets a reply, in order, even after a failure
+            replies = [await self.reply() for _ in lines]
+            data_reply = await self.reply()
+        else:
+            replies = [await self.command(lines[0])]
+            if replies[0][0] == 250:
+                replies += [await self.command(line) for line in lines[1:]]
+            accepted = any(code in (250, 251) for code, _ in replies[1:])
+            data_reply = await self.command("DATA") if accepted else (0, "")
+
+        mail_reply, rcpt_replies = replies[0], replies[1:]
+        refused = {addr: reply for addr, reply in zip(to_addrs, rcpt_replies) if reply[0] not in (250, 251)}
+        if mail_reply[0] != 250 or len(refused) == len(to_addrs) or data_reply[0] != 354:
+            if data_reply[0] == 354:
+                self.writer.write(b".\r\n")
+                await self.reply()
+            await self.command("RSET")
+            if mail_reply[0] != 250:
+                raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+            if len(refused) == len(to_addrs):
+                raise smtplib.SMTPRecipientsRefused(refused)
+            raise smtplib.SMTPDataError(*data_reply)
+
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+            code, text = await self.reply()
+        except OSError as e:
+            # The server may have accepted the message; see smtp_pool.send_pipelined
+            e.after_data = True
+            raise
+        metrics.count("smtp_sent_bytes_total", len(data), backend="asyncio")
+        if code != 250:
+            raise smtplib.SMTPDataError(code, text)
+        return refused
+
+    async def close(self):
+        if not self.closed:
+            try:
+                await asyncio.wait_for(self.command("QUIT"), 5)
+            except (smtplib.SMTPException, asyncio.TimeoutError, OSError):
+                pass
+        self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+
+
+class AsyncSessionPool:
+    """Idle logged-in sessions of one account, reused across operations on the backend loop.
+
+    At most `size` sessions are open at once, like the blocking pools; a
+    session whose connection failed is closed rather than reused.
+    """
+
+    def __init__(self, open_session, passkey, size, max_idle, kind):
+        self.open_session = open_session
+        self.kind = kind  # "imap" or "smtp", for metrics
+        self.passkey = passkey
+        self.size = size
+        self.max_idle = max_idle
+        self.idle = []  # (session, last used), most recent last
+        self.sessions = set()  # every open session, idle or in use
+        self.slots = asyncio.Semaphore(size)
+        self.stats = {"connects": 0, "reuses": 0}
+
+    @asynccontextmanager
+    async def session(self):
+        async with self.slots:
+            session = None
+            while self.idle and session is None:
+                candidate, last_used = self.idle.pop()
+                if not candidate.closed and time.monotonic() - last_used < self.max_idle:
+                    session = candidate
+                    self.stats["reuses"] += 1
+                    metrics.count("pool_checkouts_total", pool=self.kind, result="reused", backend="asyncio")
+                else:
+                    await self._drop(candidate)
+            if session is None:
+                session = await self.open_session()
+                self.sessions.add(session)
+                self.stats["connects"] += 1
+                metrics.count("pool_checkouts_total", pool=self.kind, result="opened", backend="asyncio")
+            try:
+                yield session
+            except BaseException as e:
+                # A refused recipient or an IMAP NO leaves the session usable
+                await self._put_back(session, broken=_transport_error(e))
+                raise
+            await self._put_back(session)
+
+    async def _put_back(self, session, broken=False):
+        if session.closed:
+            self.sessions.discard(session)
+        elif broken:
+            await self._drop(session)
+        else:
+            self.idle.append((session, time.monotonic()))
+
+    async def _drop(self, session):
+        self.sessions.discard(session)
+        await session.close()
+
+    async def close(self):
+        """Close every session, including ones still in use (e.g. on logout)."""
+        sessions, self.sessions, self.idle = self.sessions, set(), []
+        for session in sessions:
+            await session.close()
+
+
+async def sync_mailbox(imap, store, account, mailbox="INBOX", limit=15):
+    """Asyncio twin of mail_sync.sync_mailbox, with independent commands pipelined.
+
+    The flag check, the expunge check and the search for new UIDs go out in
+    one round trip, and so do all batches of new headers. As in
+    mail_sync.sync_changes, CONDSTORE limits the flag check to changed
+    messages and QRESYNC replaces the expunge check with VANISHED; without
+    them the cached UID range is diffed in full. Returns (UIDVALIDITY, number of new messages).
+    """
+    loop = asyncio.get_running_loop()
+
+    def db(fn, *args):
+        # MailStore is blocking SQLite; keep it off the event loop
+        return loop.run_in_executor(None, fn, *args)
+
+    exists, uidvalidity, highestmodseq = await imap.select(mailbox)
+    cached_uidvalidity, modseq = await db(store.get_mailbox, account, mailbox)
+    if cached_uidvalidity != uidvalidity:
+        print(f"♻️ UIDVALIDITY of {mailbox} is {uidvalidity}, starting a fresh cache")
+        await db(store.reset_mailbox, account, mailbox, uidvalidity)
+        modseq = 0
+
+    first_uid = await db(store.min_uid, account, mailbox, uidvalidity)
+    max_uid = await db(store.max_uid, account, mailbox, uidvalidity)
+    added = changed = removed = 0
+
+    if max_uid:
+        message_set = f"{first_uid}:{max_uid}"
+        # Without QRESYNC an expunge need not bump HIGHESTMODSEQ, so only trust it with QRESYNC
+        unchanged = imap.qresync and modseq and modseq == highestmodseq
+        vanished = imap.qresync and modseq and highestmodseq
+        commands = [imap.check("UID", "SEARCH", "UID", f"{max_uid + 1}:*")]
+        if not unchanged:
+            if modseq and highestmodseq:
+                modifiers = f"(CHANGEDSINCE {modseq}{' VANISHED' if imap.qresync else ''})"
+                commands.append(imap.check("UID", "FETCH", message_set, FLAG_ITEMS, modifiers))
+            else:
+                commands.append(imap.check("UID", "FETCH", message_set, FLAG_ITEMS))
+            if not vanished:
+                commands.append(imap.check("UID", "SEARCH", "UID", message_set))
+        new_response, *change_responses = await asyncio.gather(*commands)
+
+        if change_responses:
+            flags_response = change_responses[0]
+            cached = await db(store.cached_flags, account, mailbox, uidvalidity)
+            changed_flags = {}
+            for record in parse_fetch_response(flags_response.data("FETCH")).values():
+                uid, flags = record.get("UID"), format_flags(record.get("FLAGS"))
+                if uid in cached and cached[uid] != flags:
+                    changed_flags[uid] = flags
+            await db(store.update_flags, account, mailbox, uidvalidity, changed_flags)
+            changed = len(changed_flags)
+
+            if vanished:
+                gone = []
+                for line in flags_response.data("VANISHED"):
+                    if isinstance(line, bytes) and line:
+                        gone += parse_message_set(line.decode().replace("(EARLIER)", "").strip())
+            else:
+                present = set(_search_uids(change_responses[1]))
+                gone = [(uid, uid) for uid in cached if uid not in present]
+            if gone:
+                removed = await db(store.delete_uid_ranges, account, mailbox, uidvalidity, gone)
+
+        # n:* always matches the last message, even when its UID is below n
+        new_uids = [uid for uid in _search_uids(new_response) if uid > max_uid]
+        batches = [new_uids[i:i + SYNC_BATCH_SIZE] for i in range(0, len(new_uids), SYNC_BATCH_SIZE)]
+        responses = await asyncio.gather(*(
+            imap.check("UID", "FETCH", build_message_set(batch), HEADER_ITEMS) for batch in batches
+        ))
+        for response in responses:
+            emails_data = headers_from_records(list(parse_fetch_response(response.data("FETCH")).values()))
+            await db(store.save_headers, account, mailbox, uidvalidity, emails_data)
+            added += len(emails_data)
+
+    elif exists:
+        first = max(1, exists - limit + 1)
+        response = await imap.check("FETCH", f"{first}:{exists}", HEADER_ITEMS)
+        emails_data = headers_from_records(list(parse_fetch_response(response.data("FETCH")).values()))
+        await db(store.save_headers, account, mailbox, uidvalidity, emails_data)
+        added = len(emails_data)
+
+    await db(store.set_highestmodseq, account, mailbox, highestmodseq)
+    print(f"✅ Synced {mailbox}: {added} new, {changed} changed, {removed} removed (asyncio)")
+    return uidvalidity, added
+
+
+class AsyncMailBackend:
+    """The asyncio transport: one event loop thread shared by every session of every account.
+
+    Blocking callers hand it coroutines with run(); code already on another
+    event loop can await them through wrap().
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mail-asyncio", daemon=True)
+        self._thread.start()
+        self.imap_pools = {}
+        self.smtp_pools = {}
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the backend loop and wait for its result from another thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def wrap(self, coro):
+        """Run a coroutine on the backend loop; returns an awaitable for another event loop."""
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def _imap_pool(self, emailid, passkey, host, port):
+        key = (host or config.IMAP_HOST, port or config.IMAP_PORT, emailid)
+        pool = self.imap_pools.get(key)
+        if pool is None or pool.passkey != passkey:
+            async def open_session():
+                imap = AsyncIMAP(key[0], key[1])
+                with metrics.span("imap_connect_seconds", backend="asyncio"):
+                    await imap.connect()
+                try:
+                    with metrics.span("imap_login_seconds", backend="asyncio"):
+                        await imap.login(emailid, passkey)
+                except BaseException:
+                    await imap.close()
+                    raise
+                return imap
+            pool = self.imap_pools[key] = AsyncSessionPool(
+                open_session, passkey, config.IMAP_POOL_SIZE, config.IMAP_KEEPALIVE_SECONDS, "imap"
+            )
+        return pool
+
+    def _smtp_pool(self, emailid, passkey, host, port):
+        key = (host or config.SMTP_HOST, port or config.SMTP_PORT, emailid)
+        pool = self.smtp_pools.get(key)
+        if pool is None or pool.passkey != passkey:
+            async def open_session():
+                smtp = AsyncSMTP(key[0], key[1])
+                try:
+                    with metrics.span("smtp_connect_seconds", backend="asyncio"):
+                        await smtp.connect()
+                    with metrics.span("smtp_login_seconds", backend="asyncio"):
+                        await smtp.login(emailid, passkey)
+                except BaseException:
+                    await smtp.close()
+                    raise
+                return smtp
+            pool = self.smtp_pools[key] = AsyncSessionPool(
+                open_session, passkey, config.SMTP_POOL_SIZE, config.SMTP_MAX_IDLE_SECONDS, "smtp"
+            )
+        return pool
+
+    async def login_check(self, emailid, passkey, host=None, port=None):
+        """Log in over SMTP, keeping the session for the first send; raises on bad credentials."""
+        async with self._smtp_pool(emailid, passkey, host, port).session():
+            pass
+
+    async def send_message(self, emailid, passkey, msg, host=None, port=None):
+        async with self._smtp_pool(emailid, passkey, host, port).session() as smtp:
+            with metrics.span("smtp_send_seconds", backend="asyncio"):
+                return await smtp.send_message(msg)
+
+    async def sync_mailbox(self, emailid, passkey, store, mailbox="INBOX", limit=15, host=None, port=None):
+        async with self._imap_pool(emailid, passkey, host, port).session() as imap:
+            return await sync_mailbox(imap, store, emailid, mailbox, limit)
+
+    async def _close_pools(self, account=None):
+        pools = []
+        for pools_by_key in (self.imap_pools, self.smtp_pools):
+            for key in [key for key in pools_by_key if account is None or key[2] == account]:
+                pools.append(pools_by_key.pop(key))
+        for pool in pools:
+            await pool.close()
+
+    def close_sessions(self, account=None):
+        """Log out the sessions of one account, or of every account, e.g. on logout."""
+        self.run(self._close_pools(account))
+
+    def shutdown(self):
+        """Close every session and stop the loop; registered to run at exit."""
+        if self.loop.is_closed() or not self._thread.is_alive():
+            return
+        try:
+            self.run(self._close_pools(), timeout=10)
+        except Exception as e:
+            print(f"⚠️ Could not close mail sessions cleanly: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide asyncio mail backend, starting its loop on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = AsyncMailBackend()
+            atexit.register(_backend.shutdown)
+    return _backend
+
+
+def close_sessions(account=None):
+    """Log out the backend's sessions (of one account, or all), if it was ever started."""
+    if _backend is not None:
+        _backend.close_sessions(account)
@@ -0,0 +1,408 @@
+"""Benchmarks of the app's network paths against in-process fake IMAP, SMTP and Gemini servers.
+
+    python benchmark.py --messages 2000 --latency 20 --attachments 0.3 --json before.json
+    python benchmark.py --messages 2000 --latency 20 --attachments 0.3 --baseline before.json
+
+Drives InboxPage.latest_emails, SendEmail.send_email, AIGeneratePage.generate_email
+and the ScheduledSender headlessly (Qt's offscreen platform) and reports latency
+percentiles, throughput, bytes over the wire and peak RSS for each. Nothing
+talks to Gmail or Gemini, and all local data goes to a temporary directory.
+With --baseline the run exits with status 1 if it is slower or bigger than a
+saved --json result by more than --tolerance.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_servers
+
+try:
+    import resource
+except ImportError:
+    # Windows has no getrusage; peak RSS is then not reported
+    resource = None
+
+SCENARIOS = ("inbox", "send", "generate", "schedule")
+EMAIL = "benchmark@example.com"
+PASSWORD = "benchmark"
+# Compared against a baseline; lower is better for all of them
+COMPARED = ("p50_ms", "p90_ms", "peak_rss_mb")
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers (0 < p <= 100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, fake servers included."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Servers:
+    """The fake servers, run on their own event-loop thread like a remote host would be."""
+
+    def __init__(self, args):
+        self.host = args.host
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fake-servers", daemon=True)
+        self.thread.start()
+        self.imap, self.smtp, self.gemini = self.call(fake_servers.start_servers(args))
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def settings(self):
+        return fake_servers.settings(self.host, self.imap, self.smtp, self.gemini)
+
+    def deliver(self, mailbox, count):
+        """Generate `count` new messages in a mailbox, as if they had just arrived."""
+        async def add():
+            for _ in range(count):
+                self.imap.mailboxes[mailbox].add()
+        self.call(add())
+
+    def traffic(self):
+        """Bytes the app has sent to and received from all three servers so far."""
+        servers = (self.imap, self.smtp, self.gemini)
+        return (sum(s.stats["bytes_in"] for s in servers), sum(s.stats["bytes_out"] for s in servers))
+
+    def close(self):
+        async def close_all():
+            for server in (self.imap, self.smtp, self.gemini):
+                await server.close()
+        self.call(close_all())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class Recorder:
+    """Latencies, errors and traffic of one benchmarked operation."""
+
+    def __init__(self, name, servers):
+        self.name = name
+        self.servers = servers
+        self.latencies = []
+        self.errors = 0
+        self.seconds = 0.0
+        self.sent = self.received = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, ok=True):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.errors += not ok
+
+    @contextlib.contextmanager
+    def running(self):
+        """Count the wall time and traffic of a block towards this operation."""
+        sent, received = self.servers.traffic()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - start
+            now_sent, now_received = self.servers.traffic()
+            self.sent += now_sent - sent
+            self.received += now_received - received
+
+    def result(self):
+        ms = [seconds * 1000 for seconds in self.latencies]
+        return {
+            "name": self.name,
+            "count": len(ms),
+            "errors": self.errors,
+            "p50_ms": percentile(ms, 50),
+            "p90_ms": percentile(ms, 90),
+            "p99_ms": percentile(ms, 99),
+            "max_ms": max(ms) if ms else None,
+            "mean_ms": sum(ms) / len(ms) if ms else None,
+            "ops_per_s": len(ms) / self.seconds if self.seconds else None,
+            "sent_kb": self.sent / 1024,
+            "received_kb": self.received / 1024,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+class Headless:
+    """A QApplication on the offscreen platform whose message boxes never block."""
+
+    def __init__(self):
+        from PyQt5.QtWidgets import QApplication, QMessageBox
+
+        self.app = QApplication.instance() or QApplication(sys.argv[:1])
+        self.dialogs = []
+
+        def show(parent, title, text, *args, **kwargs):
+            self.dialogs.append((title, text))
+            print(f"💬 {title}: {text}")
+            return QMessageBox.Ok
+
+        for name in ("information", "warning", "critical"):
+            setattr(QMessageBox, name, staticmethod(show))
+
+    def wait(self, done, timeout=120):
+        """Run the event loop until done() is true, as the GUI thread would."""
+        deadline = time.perf_counter() + timeout
+        while not done():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Gave up waiting for a background job")
+            self.app.processEvents()
+            time.sleep(0.001)
+
+
+def bench_inbox(args, servers, gui):
+    """A first sync into an empty cache, then refreshes after new mail, and the body prefetch after each."""
+    from imap_pool import IMAPPool
+    from mail_store import MailStore
+    from main import InboxPage
+
+    first = Recorder("inbox.first_sync", servers)
+    refresh = Recorder("inbox.latest_emails", servers)
+    index = Recorder("inbox.index_bodies", servers)
+    pool = IMAPPool(EMAIL, PASSWORD)
+    for i in range(args.iterations):
+        store = MailStore(os.path.join(args.data_dir, f"inbox-{i}.db"))
+        dialogs = len(gui.dialogs)
+        with first.running():
+            start = time.perf_counter()
+            # Showing the page starts the first sync
+            page = InboxPage(EMAIL, PASSWORD, imap_pool=pool, mail_store=store, fetch_count=args.fetch_count)
+            gui.wait(lambda: page.refresh_job is None)
+            first.add(time.perf_counter() - start, len(gui.dialogs) == dialogs)
+        with index.running():
+            start = time.perf_counter()
+            gui.wait(lambda: page.index_job is None)
+            index.add(time.perf_counter() - start)
+
+        for _ in range(args.refreshes):
+            servers.deliver("INBOX", args.new_mail)
+            dialogs = len(gui.dialogs)
+            with refresh.running():
+                start = time.perf_counter()
+                page.latest_emails()
+                gui.wait(lambda: page.refresh_job is None)
+                refresh.add(time.perf_counter() - start, len(gui.dialogs) == dialogs)
+            with index.running():
+                start = time.perf_counter()
+                gui.wait(lambda: page.index_job is None)
+                index.add(time.perf_counter() - start)
+
+        page.stop_background_work()
+        page.deleteLater()
+        store.close()
+    pool.close()
+    return [first, refresh, index]
+
+
+def bench_send(args, servers, gui):
+    """Sends from --concurrency threads at once, like bulk and API sends."""
+    from mail_client import SendEmail
+
+    recorder = Recorder("send_email", servers)
+    sender = SendEmail(EMAIL, PASSWORD)
+    body = fake_servers.make_message("Drafts", 1, args.body_bytes).parts[0][1].decode()
+
+    def send(i):
+        start = time.perf_counter()
+        ok, _ = sender.send_email(f"recipient{i}@example.com", f"Benchmark {i}", body)
+        recorder.add(time.perf_counter() - start, ok)
+
+    with recorder.running():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(send, range(args.emails)))
+    return [recorder]
+
+
+def bench_generate(args, servers, gui):
+    """Streamed (or, with AI_STREAMING=0, whole) generations, skipping the cache."""
+    from main import AIGeneratePage
+
+    total = Recorder("generate_email", servers)
+    first_token = Recorder("generate_email.first_token", servers)
+    page = AIGeneratePage(EMAIL, PASSWORD)
+    page.sender_name_input.setText("Ann")
+    page.receiver_name_input.setText("Bob")
+    page.force_checkbox.setChecked(True)
+    for i in range(args.iterations):
+        page.description_input.setPlainText(f"the benchmark report number {i}")
+        dialogs = len(gui.dialogs)
+        first = None
+        with total.running():
+            start = time.perf_counter()
+            page.generate_email()
+            while page.generation_job is not None:
+                gui.wait(lambda: page.generation_job is None or (first is None and page.streamed_text))
+                if first is None and page.streamed_text:
+                    first = time.perf_counter() - start
+            ok = len(gui.dialogs) == dialogs and bool(page.subject_input.text())
+            total.add(time.perf_counter() - start, ok)
+        if first is not None:
+            first_token.add(first)
+    page.deleteLater()
+    return [total, first_token] if first_token.latencies else [total]
+
+
+def bench_schedule(args, servers, gui):
+    """A burst of scheduled emails all due at the same moment; latency is from due time to sent."""
+    from email_scheduler import ScheduledSender
+    from schedule_store import SENT, ScheduleStore
+
+    recorder = Recorder("scheduled_send", servers)
+    sent = {}
+
+    class TimedSender(ScheduledSender):
+        def send(self, email_id):
+            super().send(email_id)
+            sent[email_id] = time.time()
+
+    store = ScheduleStore(os.path.join(args.data_dir, "schedule-benchmark.db"))
+    sender = TimedSender(EMAIL, PASSWORD, store=store)
+    # Far enough ahead that storing the emails is not part of the measurement
+    due = datetime.datetime.now() + datetime.timedelta(seconds=1 + args.emails / 500)
+    ids = [sender.schedule(f"recipient{i}@example.com", f"Scheduled {i}", "Benchmark", due)
+           for i in range(args.emails)]
+
+    with recorder.running():
+        time.sleep(max(0.0, due.timestamp() - time.time()))
+        deadline = time.time() + 120
+        while len(sent) < len(ids) and time.time() < deadline:
+            time.sleep(0.005)
+    # Only the time after the due moment counts
+    recorder.seconds = max(sent.values(), default=due.timestamp()) - due.timestamp()
+    for email_id in ids:
+        if email_id in sent:
+            recorder.add(sent[email_id] - due.timestamp(), store.get(email_id)["status"] == SENT)
+        else:
+            recorder.errors += 1
+    sender.stop()
+    store.close()
+    return [recorder]
+
+
+BENCHMARKS = {"inbox": bench_inbox, "send": bench_send, "generate": bench_generate, "schedule": bench_schedule}
+
+
+def _cell(value, digits=1):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def report(results):
+    lines = [f"{'operation':<28}{'n':>5}{'err':>5}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+             f"{'ops/s':>9}{'sent KB':>10}{'recv KB':>10}{'RSS MB':>8}"]
+    for r in results:
+        lines.append(f"{r['name']:<28}{r['count']:>5}{r['errors']:>5}{_cell(r['p50_ms']):>10}{_cell(r['p90_ms']):>10}"
+                     f"{_cell(r['p99_ms']):>10}{_cell(r['max_ms']):>10}{_cell(r['ops_per_s']):>9}"
+                     f"{_cell(r['sent_kb']):>10}{_cell(r['received_kb']):>10}{_cell(r['peak_rss_mb'], 0):>8}")
+    return "\n".join(lines)
+
+
+def regressions(results, baseline, tolerance):
+    """Metrics that got worse than the baseline by more than `tolerance` (a fraction)."""
+    before = {r["name"]: r for r in baseline["results"]}
+    found = []
+    for r in results:
+        old = before.get(r["name"])
+        if old is None:
+            continue
+        for metric in COMPARED:
+            new_value, old_value = r.get(metric), old.get(metric)
+            if new_value is None or old_value is None:
+                continue
+            # Differences under one unit (ms or MB) are noise whatever the ratio
+            if new_value > old_value * (1 + tolerance) and new_value - old_value >= 1:
+                found.append(f"{r['name']} {metric}: {old_value:.1f} -> {new_value:.1f}")
+        if r["errors"] > old.get("errors", 0):
+            found.append(f"{r['name']} errors: {old.get('errors', 0)} -> {r['errors']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    fake_servers.add_arguments(parser)
+    parser.add_argument("scenarios", nargs="*", help=f"what to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--backend", choices=("sync", "asyncio"), default="sync", help="MAIL_BACKEND to use")
+    parser.add_argument("--iterations", type=int, default=5, help="inbox first syncs and AI generations")
+    parser.add_argument("--refreshes", type=int, default=5, help="inbox refreshes after each first sync")
+    parser.add_argument("--new-mail", type=int, default=5, help="messages delivered before each refresh")
+    parser.add_argument("--fetch-count", type=int, default=50, help="headers fetched by a first sync")
+    parser.add_argument("--emails", type=int, default=100, help="emails sent and scheduled")
+    parser.add_argument("--concurrency", type=int, default=4, help="threads sending at once")
+    parser.add_argument("--data-dir", help="keep the app's local data here instead of a temporary directory")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with the results in this --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+    if args.password is None:
+        args.password = PASSWORD
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    scenarios = [s for s in SCENARIOS if s in args.scenarios] or list(SCENARIOS)
+
+    temporary = args.data_dir is None
+    args.data_dir = args.data_dir or tempfile.mkdtemp(prefix="email-benchmark-")
+    servers = Servers(args)
+    # The app reads its settings once, on first import of config, so they go in before any app import
+    os.environ.update(servers.settings())
+    os.environ.update({"DATA_DIR": args.data_dir, "MAIL_BACKEND": args.backend, "AI_CACHE_DISK": "0"})
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ.setdefault("GEMINI_RPM", "0")
+    print(f"🏁 Fake IMAP :{servers.imap.port}, SMTP :{servers.smtp.port}, Gemini :{servers.gemini.port}; "
+          f"{args.messages} messages, {args.latency:.0f} ms latency, {args.backend} backend")
+
+    # With METRICS_ENABLED=1 the app's own timings of the run are exported too
+    import metrics
+    metrics.start()
+
+    gui = Headless()
+    results = []
+    try:
+        for scenario in scenarios:
+            print(f"🏁 Running {scenario}...")
+            results.extend(recorder.result() for recorder in BENCHMARKS[scenario](args, servers, gui))
+    finally:
+        import aio_mail
+        import smtp_pool
+        smtp_pool.close_all()
+        aio_mail.close_sessions()
+        servers.close()
+        if temporary:
+            shutil.rmtree(args.data_dir, ignore_errors=True)
+
+    print(report(results))
+    settings = {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "data_dir", "password")}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print("⚠️ The baseline was run with different settings")
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"❌ Regression: {line}")
+        if found:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
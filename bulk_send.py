@@ -0,0 +1,194 @@
+import csv
+import datetime
+import functools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import config
+
+
+# {column} placeholders; any other braces, e.g. CSS in the body, are plain text
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+def render(template, row):
+    """Fill {field} placeholders in a template from a CSV row, leaving unknown ones in place."""
+    return _PLACEHOLDER_RE.sub(lambda m: row.get(m.group(1), m.group(0)), template)
+
+
+def load_recipients(path):
+    """Read recipients from a CSV file with a header row and an `email` column.
+
+    Returns one dict per row with lower-cased column names.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = [{(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+                for row in csv.DictReader(f)]
+    if rows and "email" not in rows[0]:
+        raise ValueError("The CSV file needs an 'email' column")
+    return [row for row in rows if row.get("email")]
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, cancelled=None):
+        """Block until the next slot; returns False if cancelled while waiting."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            if cancelled is not None:
+                return not cancelled.wait(delay)
+            time.sleep(delay)
+        return True
+
+
+class DailySendCounter:
+    """Per-account count of messages sent today, kept on disk so the cap survives restarts."""
+
+    def __init__(self, account, cap=None, path=None):
+        self.account = account
+        self.cap = cap or config.BULK_DAILY_CAP
+        self.path = path or config.SEND_COUNTS_PATH
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, counts):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(counts, f)
+        os.replace(tmp, self.path)
+
+    def sent_today(self):
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            return self._load().get(self.account, {}).get(today, 0)
+
+    def reserve(self):
+        """Count one send against today's cap; returns False once the cap is reached."""
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            counts = self._load()
+            # Only today's count matters, so older days are dropped
+            sent = counts.get(self.account, {}).get(today, 0)
+            if sent >= self.cap:
+                return False
+            counts[self.account] = {today: sent + 1}
+            self._save(counts)
+            return True
+
+    def release(self):
+        """Give back a reservation for a message that wasn't sent after all."""
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            counts = self._load()
+            sent = counts.get(self.account, {}).get(today, 0)
+            if sent:
+                counts[self.account] = {today: sent - 1}
+                self._save(counts)
+
+
+class BulkSender:
+    """Sends one templated message per recipient row through a shared SMTP pool.
+
+    Up to `workers` messages are in flight at once, started no faster than
+    `rate` per second, and the run stops at the account's daily cap.
+    """
+
+    def __init__(self, pool, subject_template, body_template, rate=None, workers=None, counter=None):
+        self.pool = pool
+        self.subject_template = subject_template
+        self.body_template = body_template
+        self.rate = config.BULK_RATE_PER_SECOND if rate is None else rate
+        self.workers = workers or config.BULK_WORKERS
+        self.counter = counter or DailySendCounter(pool.emailid)
+
+    def build_message(self, row):
+        msg = EmailMessage()
+        msg["From"] = self.pool.emailid
+        msg["To"] = row["email"]
+        msg["Subject"] = render(self.subject_template, row)
+        msg.set_content(render(self.body_template, row))
+        return msg
+
+    def _send_one(self, index, row, limiter, cancelled):
+        result = {"index": index, "email": row["email"], "ok": False, "message": ""}
+        if cancelled.is_set() or not limiter.wait(cancelled):
+            result["message"] = "Cancelled"
+            return result
+        if not self.counter.reserve():
+            result["message"] = "Daily sending limit reached"
+            return result
+
+        try:
+            refused = self.pool.send_message(self.build_message(row))
+        except Exception as e:
+            if getattr(e, "after_data", False):
+                # The connection dropped after the message went out; it may well have been delivered
+                result["message"] = f"Delivery unknown, check the Sent folder: {e}"
+            else:
+                # Failed before the message was accepted, so it doesn't count against the cap
+                self.counter.release()
+                result["message"] = str(e)
+            return result
+
+        if refused:
+            result["message"] = f"Refused: {refused}"
+        else:
+            result.update(ok=True, message="Sent")
+        return result
+
+    def run(self, rows, on_result=None, cancelled=None):
+        """Send to every row and return a summary.
+
+        on_result(result, summary) is called from worker threads as each
+        recipient finishes; `cancelled` is a threading.Event that stops the run.
+        """
+        cancelled = cancelled or threading.Event()
+        limiter = RateLimiter(self.rate)
+        summary = {"total": len(rows), "sent": 0, "failed": 0, "elapsed": 0.0, "per_second": 0.0}
+        lock = threading.Lock()
+        start = time.perf_counter()
+
+        def finished(index, row, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                # _send_one reports its own failures, so this is a bug; still count the row
+                result = {"index": index, "email": row["email"], "ok": False, "message": str(e)}
+            with lock:
+                summary["sent" if result["ok"] else "failed"] += 1
+                summary["elapsed"] = time.perf_counter() - start
+                summary["per_second"] = summary["sent"] / summary["elapsed"] if summary["elapsed"] else 0.0
+                snapshot = dict(summary)
+            if on_result:
+                on_result(result, snapshot)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for index, row in enumerate(rows):
+                future = executor.submit(self._send_one, index, row, limiter, cancelled)
+                future.add_done_callback(functools.partial(finished, index, row))
+
+        print(f"✅ Bulk send finished: {summary['sent']} sent, {summary['failed']} failed "
+              f"in {summary['elapsed']:.1f} s ({summary['per_second']:.2f} msg/s)")
+        return summary
@@ -0,0 +1,131 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# IMAP connection settings
+IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+IMAP_POOL_SIZE = int(os.getenv("IMAP_POOL_SIZE", "3"))
+IMAP_KEEPALIVE_SECONDS = int(os.getenv("IMAP_KEEPALIVE_SECONDS", "300"))
+IMAP_SSL = os.getenv("IMAP_SSL", "1") != "0"
+
+# Push updates; RFC 2177 asks clients to re-issue IDLE at least every 29 minutes
+IMAP_IDLE_ENABLED = os.getenv("IMAP_IDLE_ENABLED", "1") != "0"
+IMAP_IDLE_SECONDS = int(os.getenv("IMAP_IDLE_SECONDS", str(29 * 60)))
+IMAP_POLL_SECONDS = int(os.getenv("IMAP_POLL_SECONDS", "60"))
+
+# SMTP connection settings
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_MAX_IDLE_SECONDS = int(os.getenv("SMTP_MAX_IDLE_SECONDS", "240"))
+SMTP_MAX_MESSAGES = int(os.getenv("SMTP_MAX_MESSAGES", "100"))
+SMTP_CHECK_SECONDS = int(os.getenv("SMTP_CHECK_SECONDS", "30"))
+SMTP_PIPELINING = os.getenv("SMTP_PIPELINING", "1") != "0"
+# Plain-text SMTP on port 587 is only for local test servers
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+
+# Transport for login, folder sync and sending: "sync" runs imaplib/smtplib on
+# worker threads; "asyncio" runs every session on one event loop, pipelining commands
+MAIL_BACKEND = os.getenv("MAIL_BACKEND", "sync").lower()
+MAIL_TIMEOUT_SECONDS = int(os.getenv("MAIL_TIMEOUT_SECONDS", "30"))
+
+# Bulk sending; Gmail allows about 500 messages a day on personal accounts
+BULK_RATE_PER_SECOND = float(os.getenv("BULK_RATE_PER_SECOND", "1"))
+BULK_DAILY_CAP = int(os.getenv("BULK_DAILY_CAP", "500"))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "2"))
+
+# Gemini
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Only for local stand-ins (e.g. fake_servers.py), which are reached over plain HTTP/REST
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+AI_STREAMING = os.getenv("AI_STREAMING", "1") != "0"
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "4"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "4"))
+AI_RETRY_BASE_SECONDS = float(os.getenv("AI_RETRY_BASE_SECONDS", "1"))
+# Client-side quota shared by every Gemini call; 0 disables a limit
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+AI_EXPECTED_OUTPUT_TOKENS = int(os.getenv("AI_EXPECTED_OUTPUT_TOKENS", "512"))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "256"))
+AI_CACHE_DISK_SIZE = int(os.getenv("AI_CACHE_DISK_SIZE", "5000"))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+AI_CACHE_DISK = os.getenv("AI_CACHE_DISK", "1") != "0"
+
+# Inbox settings
+INBOX_FETCH_COUNT = int(os.getenv("INBOX_FETCH_COUNT", "15"))
+# Rows read from the cache (or older headers fetched from the server) per scroll step
+INBOX_PAGE_SIZE = int(os.getenv("INBOX_PAGE_SIZE", "100"))
+# Bodies of this many unopened emails are fetched after each sync so search covers them
+SEARCH_PREFETCH_BODIES = int(os.getenv("SEARCH_PREFETCH_BODIES", "50"))
+# Message bodies are fetched in chunks until the text part is complete, then capped
+MAIL_FETCH_CHUNK_BYTES = int(os.getenv("MAIL_FETCH_CHUNK_BYTES", str(256 * 1024)))
+MAIL_BODY_MAX_BYTES = int(os.getenv("MAIL_BODY_MAX_BYTES", str(1024 * 1024)))
+# Attachments are only downloaded on request, this many encoded bytes per FETCH
+ATTACHMENT_CHUNK_BYTES = int(os.getenv("ATTACHMENT_CHUNK_BYTES", str(512 * 1024)))
+
+# Local data
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.expanduser("~"), ".smart_email_assistant"))
+MAIL_CACHE_PATH = os.getenv("MAIL_CACHE_PATH", os.path.join(DATA_DIR, "mail_cache.db"))
+SEND_COUNTS_PATH = os.getenv("SEND_COUNTS_PATH", os.path.join(DATA_DIR, "send_counts.json"))
+SCHEDULE_DB_PATH = os.getenv("SCHEDULE_DB_PATH", os.path.join(DATA_DIR, "schedule.db"))
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(DATA_DIR, "ai_cache.db"))
+AI_USAGE_PATH = os.getenv("AI_USAGE_PATH", os.path.join(DATA_DIR, "ai_usage.json"))
+# Extra (e.g. shared) mailboxes to sync: a JSON list of {"email", "password", "host", "folders"}
+ACCOUNTS_PATH = os.getenv("ACCOUNTS_PATH", os.path.join(DATA_DIR, "accounts.json"))
+
+# Folder sync: comma-separated folders (IMAP names), or "*" to sync every folder and label
+# (on Gmail that includes All Mail, Spam, Trash and every label)
+_sync_folders = os.getenv("SYNC_FOLDERS", "INBOX,[Gmail]/Sent Mail").strip()
+SYNC_FOLDERS = None if _sync_folders == "*" else [f.strip() for f in _sync_folders.split(",") if f.strip()]
+# Folder syncs run this many at a time, at most IMAP_POOL_SIZE per account
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", str(min(16, (os.cpu_count() or 2) * 2))))
+
+# Scheduled emails that were due while the app was closed are still sent if
+# they are at most this late
+SCHEDULE_MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULE_MISFIRE_GRACE_SECONDS", "3600"))
+# Interrupted sends whose Sent folder check fails are checked again this many times,
+# waiting this long (doubling each time), before they are marked failed
+SCHEDULE_RECOVER_RETRIES = int(os.getenv("SCHEDULE_RECOVER_RETRIES", "4"))
+SCHEDULE_RECOVER_RETRY_SECONDS = int(os.getenv("SCHEDULE_RECOVER_RETRY_SECONDS", "60"))
+# Scheduled emails that come due together are sent this many at a time
+SCHEDULE_SEND_WORKERS = int(os.getenv("SCHEDULE_SEND_WORKERS", "2"))
+SCHEDULE_BATCH_SIZE = int(os.getenv("SCHEDULE_BATCH_SIZE", "100"))
+# On logout, wait this long for scheduled sends in progress before closing their store
+SCHEDULE_STOP_WAIT_SECONDS = int(os.getenv("SCHEDULE_STOP_WAIT_SECONDS", "30"))
+# Mailbox searched for the Message-ID of sends that were interrupted (IMAP-quoted)
+SENT_MAILBOX = os.getenv("SENT_MAILBOX", '"[Gmail]/Sent Mail"')
+
+# Headless service (python mail_api.py) for one mailbox; only listens on this machine by default
+API_EMAIL = os.getenv("API_EMAIL", "")
+API_PASSWORD = os.getenv("API_PASSWORD", "")
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8025"))
+# Required by python mail_api.py; clients send "Authorization: Bearer <token>"
+API_TOKEN = os.getenv("API_TOKEN", "")
+# Blocking IMAP, SMTP and Gemini calls of all clients share this many threads
+API_WORKERS = int(os.getenv("API_WORKERS", "8"))
+API_MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", str(1024 * 1024)))
+API_IDLE_TIMEOUT_SECONDS = int(os.getenv("API_IDLE_TIMEOUT_SECONDS", "60"))
+
+# Print how long startup took, with the slowest imports (like python -X importtime)
+STARTUP_TIMING = os.getenv("STARTUP_TIMING", "0") != "0"
+
+# Timings, bytes and cache hits of the hot paths (see metrics.py); nearly free when off
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") != "0"
+# Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics; 0 turns the endpoint off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# One JSON line per observation, appended every METRICS_FLUSH_SECONDS; empty turns it off
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# The GUI thread is checked this often; any lateness counts as a UI stall
+UI_HEARTBEAT_MS = int(os.getenv("UI_HEARTBEAT_MS", "100"))
+
+# Background work (network I/O) runs on this many threads
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+# Folder syncs, body indexing, downloads, bulk sends and batch drafts get their own threads
+LONG_RUNNING_THREADS = int(os.getenv("LONG_RUNNING_THREADS", "6"))
@@ -0,0 +1,354 @@
+import datetime
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import config
+import metrics
+import smtp_pool
+from schedule_store import ScheduleStore, SENDING
+
+
+class SendQueue:
+    """Min-heap of due times drained by one dispatcher thread.
+
+    Entries hold only a key and a callback, never the email itself. Due
+    entries are handed out in batches to a small worker pool, so a burst of
+    emails due in the same minute shares a few pooled SMTP connections.
+    Push, cancel and reschedule are O(log n); cancelled entries stay in the
+    heap and are skipped when they come up.
+    """
+
+    def __init__(self, workers=None, batch_size=None):
+        self.workers = workers or config.SCHEDULE_SEND_WORKERS
+        self.batch_size = batch_size or config.SCHEDULE_BATCH_SIZE
+        self._heap = []
+        self._entries = {}  # key -> live heap entry
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = threading.BoundedSemaphore(self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="send-queue")
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._thread.start()
+
+    def push(self, key, due, fn, *args):
+        """Run fn(*args) at datetime `due`, replacing any entry with the same key."""
+        with self._cond:
+            self._remove(key)
+            # [due, tie-breaker, key, call]; call is None once removed
+            entry = [due.timestamp(), next(self._counter), key, (fn, args)]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+
+    def cancel(self, key):
+        """Drop a queued entry; returns False if it isn't queued."""
+        with self._cond:
+            return self._remove(key)
+
+    def reschedule(self, key, due):
+        """Move a queued entry to a new time; returns False if it isn't queued."""
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            self.push(key, due, entry[3][0], *entry[3][1])
+            return True
+
+    def pending(self):
+        """Return [(due datetime, key)] of queued entries, soonest first."""
+        with self._cond:
+            entries = sorted(self._entries.values())
+        return [(datetime.datetime.fromtimestamp(entry[0]), entry[2]) for entry in entries]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[3] = None
+        return True
+
+    def _pop_due(self):
+        """Wait for the next due entries and return up to batch_size of them."""
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][3] is None:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    # Wake up now and then in case the wall clock jumps
+                    self._cond.wait(min(delay, 60))
+                    continue
+
+                batch = []
+                now = time.time()
+                while self._heap and len(batch) < self.batch_size and self._heap[0][0] <= now:
+                    entry = heapq.heappop(self._heap)
+                    if entry[3] is not None:
+                        del self._entries[entry[2]]
+                        batch.append(entry[3])
+                return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._pop_due()
+            for fn, args in batch:
+                # Back-pressure: don't queue more work than the workers can take
+                self._in_flight.acquire()
+                future = self._executor.submit(fn, *args)
+                future.add_done_callback(self._job_done)
+
+    def _job_done(self, future):
+        self._in_flight.release()
+        if future.exception() is not None:
+            print(f"❌ Scheduled send failed: {future.exception()}")
+
+
+_send_queue = None
+_send_queue_lock = threading.Lock()
+
+
+def get_send_queue():
+    """Return the process-wide send queue, starting its dispatcher on first use."""
+    global _send_queue
+    with _send_queue_lock:
+        if _send_queue is None:
+            _send_queue = SendQueue()
+    return _send_queue
+
+
+class ScheduledSender:
+    """Sends one account's scheduled emails, kept durably in a ScheduleStore.
+
+    The send queue only holds the email's id; everything else is read from
+    the store when it comes due.
+    """
+
+    def __init__(self, emailid, passkey, store=None, imap_pool=None, send_queue=None,
+                 grace=None, sent_mailbox=None):
+        self.emailid = emailid
+        self.passkey = passkey
+        self._owns_store = store is None
+        self.store = store or ScheduleStore(config.SCHEDULE_DB_PATH)
+        self.imap_pool = imap_pool
+        self.send_queue = send_queue or get_send_queue()
+        self.grace = config.SCHEDULE_MISFIRE_GRACE_SECONDS if grace is None else grace
+        self.sent_mailbox = sent_mailbox or config.SENT_MAILBOX
+        self._keys = set()
+        # Queue workers busy with this sender, so stop() doesn't close the store under them
+        self._busy = 0
+        self._busy_cond = threading.Condition()
+        self._stopped = False
+        self._close_when_idle = False
+
+    def schedule(self, recipient, subject, body, send_at):
+        """Store an email and queue it; returns its id."""
+        email_id = self.store.add(self.emailid, recipient, subject, body, send_at)
+        self._queue(email_id, send_at)
+        return email_id
+
+    def pending(self):
+        """Return this account's emails that are still waiting to be sent, soonest first."""
+        return self.store.unfinished(self.emailid)
+
+    def failed(self):
+        """Return this account's emails that could not be sent, with the reason in `error`."""
+        return self.store.failed(self.emailid)
+
+    def reschedule(self, email_id, send_at):
+        """Move a pending email to a new time; returns False if it is no longer pending."""
+        if not self.store.reschedule(email_id, send_at):
+            return False
+        self._queue(email_id, send_at)
+        return True
+
+    def cancel(self, email_id):
+        """Cancel a pending email; returns False if it is already being sent or done."""
+        if not self.store.cancel(email_id):
+            return False
+        self.send_queue.cancel(self._key(email_id))
+        self._keys.discard(self._key(email_id))
+        return True
+
+    @staticmethod
+    def _key(email_id):
+        return f"email-{email_id}"
+
+    def _queue(self, email_id, send_at):
+        key = self._key(email_id)
+        self.send_queue.push(key, send_at, self.send, email_id)
+        self._keys.add(key)
+
+    def resume(self):
+        """Queue this account's unfinished emails again after a restart or login.
+
+        Emails due within the grace period are sent right away; older ones are
+        marked failed. Sends that were interrupted are checked against the Sent
+        mailbox by Message-ID so they are never delivered twice.
+        Returns (number queued, number missed).
+        """
+        if not self._begin():
+            return 0, 0
+        try:
+            now = datetime.datetime.now()
+            queued = missed = 0
+            for email_data in self.store.unfinished(self.emailid):
+                if email_data["status"] == SENDING and not self._recover(email_data):
+                    continue
+                if self._requeue(email_data, now):
+                    queued += 1
+                else:
+                    missed += 1
+        finally:
+            self._end()
+
+        print(f"✅ Resumed {queued} scheduled emails ({missed} missed)")
+        return queued, missed
+
+    def _requeue(self, email_data, now):
+        """Queue a pending email, or mark it failed if it is past the grace period; True if queued."""
+        if email_data["send_at"] < now - datetime.timedelta(seconds=self.grace):
+            self.store.mark_failed(email_data["id"], f"Missed: was due at {email_data['send_at']}")
+            return False
+        self._queue(email_data["id"], max(email_data["send_at"], now))
+        return True
+
+    def _recover(self, email_data, attempt=0):
+        """Settle an email whose send was interrupted; True if it should be sent again.
+
+        If the Sent mailbox can't be checked, the check is retried later with
+        backoff; after SCHEDULE_RECOVER_RETRIES the email is marked failed so the
+        user can look for it in the Sent folder instead of it staying stuck.
+        """
+        try:
+            delivered = self.was_sent(email_data["message_id"])
+        except Exception as e:
+            # Unknown either way; don't send again and risk a duplicate
+            if attempt < config.SCHEDULE_RECOVER_RETRIES:
+                delay = config.SCHEDULE_RECOVER_RETRY_SECONDS * 2 ** attempt
+                print(f"⚠️ Could not check whether scheduled email {email_data['id']} was sent ({e}), "
+                      f"checking again in {delay} s")
+                key = self._key(email_data["id"])
+                self.send_queue.push(key, datetime.datetime.now() + datetime.timedelta(seconds=delay),
+                                     self._retry_recover, email_data["id"], attempt + 1)
+                self._keys.add(key)
+            else:
+                self.store.mark_failed(email_data["id"], "Delivery unknown: the send was interrupted and the "
+                                                         "Sent folder could not be checked; look for it there")
+                print(f"❌ Gave up checking whether scheduled email {email_data['id']} was sent: {e}")
+            return False
+
+        if delivered:
+            self.store.mark_sent(email_data["id"])
+            print(f"✅ Scheduled email {email_data['id']} had already been sent")
+            return False
+        return self.store.release(email_data["id"])
+
+    def _retry_recover(self, email_id, attempt):
+        """Runs on a send-queue worker when a failed Sent mailbox check is due again."""
+        self._keys.discard(self._key(email_id))
+        if not self._begin():
+            return
+        try:
+            email_data = self.store.get(email_id)
+            if email_data is None or email_data["status"] != SENDING:
+                return
+            if self._recover(email_data, attempt):
+                self._requeue(email_data, datetime.datetime.now())
+        finally:
+            self._end()
+
+    def was_sent(self, message_id):
+        """Look the Message-ID up in the Sent mailbox."""
+        if self.imap_pool is None:
+            raise RuntimeError("No IMAP connection to check the Sent mailbox")
+
+        def search(imap_server):
+            with metrics.span("imap_command_seconds", command="search", backend="sync"):
+                status, data = imap_server.uid("SEARCH", "HEADER", "Message-ID", f'"{message_id}"')
+            if status != "OK":
+                raise imap_server.error(f"SEARCH failed: {data}")
+            return bool(data and data[0] and data[0].split())
+
+        return self.imap_pool.run(search, self.sent_mailbox)
+
+    def send(self, email_id):
+        """Send a stored email at most once; runs on a send-queue worker."""
+        self._keys.discard(self._key(email_id))
+        if not self._begin():
+            return
+        try:
+            self._send(email_id)
+        finally:
+            self._end()
+
+    def _send(self, email_id):
+        if not self.store.claim(email_id):
+            return
+        email_data = self.store.get(email_id)
+        # How late the send starts compared with the time the user picked
+        lag = (datetime.datetime.now() - email_data["send_at"]).total_seconds()
+        metrics.observe("scheduler_lag_seconds", max(0.0, lag))
+
+        msg = EmailMessage()
+        msg["From"] = self.emailid
+        msg["To"] = email_data["recipient"]
+        msg["Subject"] = email_data["subject"]
+        msg["Message-ID"] = email_data["message_id"]
+        msg.set_content(email_data["body"])
+
+        try:
+            smtp_pool.get_pool(self.emailid, self.passkey).send_message(msg)
+        except Exception as e:
+            self.store.mark_failed(email_id, str(e))
+            print(f"📨 Scheduled Email Status: Failed to send email: {e}")
+            return
+        self.store.mark_sent(email_id)
+        print("📨 Scheduled Email Status: Email sent successfully!")
+
+    def _begin(self):
+        """Count a queue worker as busy with this sender; False once it has been stopped."""
+        with self._busy_cond:
+            if self._stopped:
+                return False
+            self._busy += 1
+            return True
+
+    def _end(self):
+        with self._busy_cond:
+            self._busy -= 1
+            self._busy_cond.notify_all()
+            close = self._close_when_idle and not self._busy
+        if close:
+            self.store.close()
+
+    def stop(self, timeout=None):
+        """Take this account's emails out of the send queue; they stay pending in the store.
+
+        Sends already in progress are waited for, up to `timeout` seconds, so
+        they can still record that they were sent; if they take longer, the
+        last one closes the store.
+        """
+        timeout = config.SCHEDULE_STOP_WAIT_SECONDS if timeout is None else timeout
+        with self._busy_cond:
+            self._stopped = True
+        for key in list(self._keys):
+            self.send_queue.cancel(key)
+        self._keys.clear()
+        with self._busy_cond:
+            if not self._busy_cond.wait_for(lambda: not self._busy, timeout):
+                print(f"⚠️ {self._busy} scheduled send(s) still running; their results are saved when they finish")
+                self._close_when_idle = self._owns_store
+                return
+        if self._owns_store:
+            self.store.close()
@@ -0,0 +1,698 @@
+"""Local stand-in IMAP, SMTP and Gemini servers for trying the app (either MAIL_BACKEND) without Gmail.
+
+    python fake_servers.py --messages 500 --latency 20 --attachments 0.3
+
+then run the app or mail_api.py with the settings it prints. Every login is
+accepted unless a password is given, mail is generated per mailbox with the
+given sizes and share of attachments, and sent mail is only counted.
+--latency delays every response to mimic a network round trip, which is what
+makes pipelining visible. benchmark.py runs the same servers in-process.
+"""
+import argparse
+import asyncio
+import base64
+import email.utils
+import functools
+import json
+import random
+import re
+import time
+import zlib
+
+_ITEM_RE = re.compile(r"BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|[A-Z0-9.]+", re.I)
+_SECTION_RE = re.compile(r"BODY(\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", re.I)
+
+
+def split_args(text):
+    """Split IMAP arguments, keeping quoted strings, (lists) and [sections] whole."""
+    args, current, depth, quoted = [], "", 0, False
+    for i, c in enumerate(text):
+        if quoted:
+            current += c
+            if c == '"' and text[i - 1] != "\\":
+                quoted = False
+        elif c == '"':
+            quoted = True
+            current += c
+        elif c in "([":
+            depth += 1
+            current += c
+        elif c in ")]":
+            depth -= 1
+            current += c
+        elif c == " " and depth == 0:
+            if current:
+                args.append(current)
+            current = ""
+        else:
+            current += c
+    if current:
+        args.append(current)
+    return args
+
+
+def unquote(value):
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return value
+
+
+_WORDS = ("meeting report invoice schedule project update review budget team client launch "
+          "design draft notes agenda follow-up deadline summary proposal feedback").split()
+
+
+def _text(rng, size):
+    """About `size` bytes of plain text in CRLF-terminated lines."""
+    lines, length = [], 0
+    while length < size:
+        line = " ".join(rng.choice(_WORDS) for _ in range(10)).capitalize() + ".\r\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()
+
+
+def _text_structure(text):
+    lines = text.count(b"\n")
+    return f'"TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" {len(text)} {lines}'
+
+
+class FakeMail:
+    """A generated message: its raw bytes and its leaf parts as (BODYSTRUCTURE, encoded bytes)."""
+
+    __slots__ = ("raw", "parts")
+
+    def __init__(self, raw, parts=None):
+        self.raw = raw
+        self.parts = parts or [(None, raw.split(b"\r\n\r\n", 1)[1])]
+
+    @property
+    def multipart(self):
+        return len(self.parts) > 1
+
+
+@functools.lru_cache(maxsize=512)
+def make_message(mailbox, number, body_bytes=200, attachment_bytes=0):
+    """Build message `number` of a mailbox; the same arguments always give the same bytes.
+
+    Body and attachment sizes vary by up to half either way around the given
+    sizes. Messages are rebuilt on demand, so a large fake mailbox costs
+    next to no memory.
+    """
+    rng = random.Random(f"{mailbox}/{number}")
+    date = email.utils.formatdate(1700000000 + number * 60, localtime=False)
+    header = (f"From: Sender {number} <sender{number}@example.com>\r\n"
+              f"To: you@example.com\r\n"
+              f"Subject: {mailbox} message {number}\r\n"
+              f"Date: {date}\r\n"
+              f"Message-ID: <{number}.{zlib.crc32(mailbox.encode())}@example.com>\r\n").encode()
+    text = f"Body of {mailbox} message {number}.\r\n".encode()
+    if body_bytes > len(text):
+        text += _text(rng, rng.randint(body_bytes // 2, body_bytes * 3 // 2) - len(text))
+    text_structure = _text_structure(text)
+
+    if not attachment_bytes:
+        raw = header + b"Content-Type: text/plain; charset=utf-8\r\n\r\n" + text
+        return FakeMail(raw, [(text_structure, text)])
+
+    name = f"attachment-{number}.bin"
+    data = rng.randbytes(rng.randint(attachment_bytes // 2, attachment_bytes * 3 // 2))
+    encoded = base64.encodebytes(data).replace(b"\n", b"\r\n")
+    boundary = f"part-{number}".encode()
+    attachment_structure = (f'"APPLICATION" "OCTET-STREAM" ("NAME" "{name}") NIL NIL "BASE64" {len(encoded)} '
+                            f'NIL ("ATTACHMENT" ("FILENAME" "{name}")) NIL')
+    raw = (header + b'Content-Type: multipart/mixed; boundary="' + boundary + b'"\r\n\r\n'
+           + b"--" + boundary + b"\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n" + text
+           + b"\r\n--" + boundary + b"\r\nContent-Type: application/octet-stream; name=\"" + name.encode()
+           + b"\"\r\nContent-Disposition: attachment; filename=\"" + name.encode()
+           + b"\"\r\nContent-Transfer-Encoding: base64\r\n\r\n" + encoded
+           + b"\r\n--" + boundary + b"--\r\n")
+    return FakeMail(raw, [(text_structure, text), (attachment_structure, encoded)])
+
+
+class Message:
+    __slots__ = ("uid", "flags", "build")
+
+    def __init__(self, uid, build, flags=()):
+        self.uid = uid
+        self.build = build
+        self.flags = set(flags)
+
+    @property
+    def mail(self):
+        return self.build()
+
+    @property
+    def raw(self):
+        return self.mail.raw
+
+    @property
+    def header(self):
+        return self.raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+
+    @property
+    def text(self):
+        return self.raw.split(b"\r\n\r\n", 1)[1]
+
+    def bodystructure(self):
+        mail = self.mail
+        if not mail.multipart:
+            structure, text = mail.parts[0]
+            return f"({structure or _text_structure(text)})"
+        boundary = re.search(rb'boundary="([^"]+)"', self.header).group(1).decode()
+        return "(" + "".join(f"({structure})" for structure, _ in mail.parts) + \
+            f' "MIXED" ("BOUNDARY" "{boundary}") NIL NIL)'
+
+    def part(self, number):
+        """Encoded bytes of leaf part `number` (1-based), or b"" if there is none."""
+        parts = self.mail.parts
+        return parts[number - 1][1] if 0 < number <= len(parts) else b""
+
+
+class Mailbox:
+    def __init__(self, name, count, uidvalidity=1, body_bytes=200, attachment_bytes=0, attachment_ratio=0.0):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.body_bytes = body_bytes
+        self.attachment_bytes = attachment_bytes
+        self.attachment_ratio = attachment_ratio
+        self.messages = [self._generated(n) for n in range(1, count + 1)]
+        self.next_uid = count + 1
+
+    def _generated(self, number):
+        # Which messages carry an attachment is fixed per number, like their contents
+        attached = random.Random(f"{self.name}#{number}").random() < self.attachment_ratio
+        attachment_bytes = self.attachment_bytes if attached else 0
+        return Message(number, functools.partial(make_message, self.name, number, self.body_bytes,
+                                                 attachment_bytes))
+
+    def add(self, raw=None):
+        """Deliver a message, generated unless raw bytes are given; returns its UID."""
+        uid = self.next_uid
+        if raw is None:
+            self.messages.append(self._generated(uid))
+        else:
+            mail = FakeMail(raw)
+            self.messages.append(Message(uid, lambda: mail))
+        self.next_uid += 1
+        return uid
+
+
+def _resolve(message_set, largest):
+    """Expand a message-set like '1:5,9,12:*' into inclusive ranges."""
+    ranges = []
+    for part in message_set.split(","):
+        first, _, last = part.partition(":")
+        first = largest if first == "*" else int(first)
+        last = first if not last else (largest if last == "*" else int(last))
+        ranges.append((min(first, last), max(first, last)))
+    return ranges
+
+
+class _DelayedWriter:
+    """Writes responses after a fixed delay without holding up reading, in order."""
+
+    def __init__(self, writer, latency, stats):
+        self.writer = writer
+        self.latency = latency
+        self.stats = stats
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._run())
+
+    def write(self, data):
+        self.queue.put_nowait((time.monotonic() + self.latency, data))
+
+    async def _run(self):
+        while True:
+            due, data = await self.queue.get()
+            if data is None:
+                break
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.writer.write(data)
+            self.stats["bytes_out"] += len(data)
+            await self.writer.drain()
+
+    async def close(self):
+        self.queue.put_nowait((0, None))
+        try:
+            await self.task
+        except (ConnectionError, OSError):
+            pass
+        self.writer.close()
+
+
+class _Server:
+    """Serves handle() on a port and, on close, also closes the connections still open."""
+
+    server = None
+    port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._connections = {}
+        self.server = await asyncio.start_server(self._serve, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            await self.handle(reader, writer)
+        finally:
+            del self._connections[task]
+
+    async def close(self):
+        self.server.close()
+        for writer in list(self._connections.values()):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+
+class FakeIMAPServer(_Server):
+    """An in-memory IMAP4rev1 server with the commands the app uses (no IDLE, CONDSTORE or TLS)."""
+
+    def __init__(self, mailboxes=None, messages=100, password=None, latency=0.0,
+                 body_bytes=200, attachment_bytes=0, attachment_ratio=0.0):
+        names = mailboxes or ["INBOX", "[Gmail]/Sent Mail", "Work"]
+        self.mailboxes = {
+            name: Mailbox(name, messages if name == "INBOX" else messages // 4, body_bytes=body_bytes,
+                          attachment_bytes=attachment_bytes, attachment_ratio=attachment_ratio)
+            for name in names
+        }
+        self.password = password
+        self.latency = latency
+        self.stats = {"connections": 0, "commands": 0, "bytes_in": 0, "bytes_out": 0}
+
+    async def handle(self, reader, writer):
+        self.stats["connections"] += 1
+        out = _DelayedWriter(writer, self.latency, self.stats)
+        out.write(b"* OK Fake IMAP ready\r\n")
+        session = {"mailbox": None, "user": None}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats["bytes_in"] += len(line)
+                line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+                tag, _, rest = line.partition(" ")
+                name, _, args = rest.partition(" ")
+                self.stats["commands"] += 1
+                try:
+                    response = self.command(session, name.upper(), args)
+                except (ValueError, KeyError, IndexError) as e:
+                    response = [f"BAD {e}"]
+                for item in response[:-1]:
+                    out.write(item if isinstance(item, bytes) else f"{item}\r\n".encode())
+                out.write(f"{tag} {response[-1]}\r\n".encode())
+                if name.upper() == "LOGOUT":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await out.close()
+
+    def command(self, session, name, args):
+        """Return the untagged responses followed by the tagged completion text."""
+        if name == "CAPABILITY":
+            return ["* CAPABILITY IMAP4rev1 UIDPLUS", "OK CAPABILITY completed"]
+        if name == "LOGIN":
+            user, password = [unquote(a) for a in split_args(args)]
+            if self.password is not None and password != self.password:
+                return ["NO [AUTHENTICATIONFAILED] Invalid credentials"]
+            session["user"] = user
+            return ["OK LOGIN completed"]
+        if name in ("NOOP", "ENABLE", "CHECK"):
+            return ["OK NOOP completed"]
+        if name == "LOGOUT":
+            return ["* BYE Logging out", "OK LOGOUT completed"]
+        if session["user"] is None:
+            return ["NO Log in first"]
+        if name == "LIST":
+            return [f'* LIST (\\HasNoChildren) "/" "{mb}"' for mb in self.mailboxes] + ["OK LIST completed"]
+        if name in ("SELECT", "EXAMINE"):
+            mailbox = self.mailboxes.get(unquote(split_args(args)[0]))
+            if mailbox is None:
+                return ["NO Mailbox does not exist"]
+            session["mailbox"] = mailbox
+            return ["* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)",
+                    f"* {len(mailbox.messages)} EXISTS", "* 0 RECENT",
+                    f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid",
+                    f"* OK [UIDNEXT {mailbox.next_uid}] Predicted next UID",
+                    f"OK [READ-WRITE] {name} completed"]
+        if session["mailbox"] is None:
+            return ["NO Select a mailbox first"]
+
+        uid = name == "UID"
+        if uid:
+            name, _, args = args.partition(" ")
+            name = name.upper()
+        if name == "FETCH":
+            return self.fetch(session["mailbox"], args, uid)
+        if name == "SEARCH":
+            return self.search(session["mailbox"], args, uid)
+        if name == "STORE":
+            return self.store(session["mailbox"], args, uid)
+        return [f"BAD Unknown command {name}"]
+
+    @staticmethod
+    def _select(mailbox, message_set, uid):
+        """Return [(sequence number, message)] for a message-set of UIDs or sequence numbers."""
+        messages = mailbox.messages
+        if not messages:
+            return []
+        largest = messages[-1].uid if uid else len(messages)
+        ranges = _resolve(message_set, largest)
+        return [(seq, message) for seq, message in enumerate(messages, 1)
+                if any(first <= (message.uid if uid else seq) <= last for first, last in ranges)]
+
+    def fetch(self, mailbox, args, uid):
+        message_set, _, items = args.partition(" ")
+        # Drop modifiers such as (CHANGEDSINCE n)
+        items = items.strip()
+        if items.startswith("("):
+            depth = 0
+            for i, c in enumerate(items):
+                depth += c == "("
+                depth -= c == ")"
+                if depth == 0:
+                    items = items[1:i]
+                    break
+        names = _ITEM_RE.findall(items)
+        if uid and "UID" not in [n.upper() for n in names]:
+            names.insert(0, "UID")
+
+        responses = []
+        for seq, message in self._select(mailbox, message_set, uid):
+            parts = []
+            for item in names:
+                upper = item.upper()
+                if upper == "UID":
+                    parts.append(f"UID {message.uid}".encode())
+                elif upper == "FLAGS":
+                    parts.append(f"FLAGS ({' '.join(sorted(message.flags))})".encode())
+                elif upper == "RFC822.SIZE":
+                    parts.append(f"RFC822.SIZE {len(message.raw)}".encode())
+                elif upper == "BODYSTRUCTURE":
+                    parts.append(f"BODYSTRUCTURE {message.bodystructure()}".encode())
+                else:
+                    match = _SECTION_RE.fullmatch(item)
+                    if not match:
+                        raise ValueError(f"Unsupported FETCH item {item}")
+                    peek, section, offset, length = match.groups()
+                    section_upper = section.upper()
+                    if section_upper.startswith("HEADER.FIELDS"):
+                        wanted = {h.upper() for h in re.findall(r"[A-Za-z-]+", section_upper[13:])}
+                        lines = [h for h in message.header.split(b"\r\n")
+                                 if h.split(b":", 1)[0].decode().upper() in wanted]
+                        data = b"\r\n".join(lines) + b"\r\n\r\n"
+                    elif section_upper == "HEADER":
+                        data = message.header
+                    elif section_upper == "TEXT":
+                        data = message.text
+                    elif section_upper.isdigit():
+                        data = message.part(int(section_upper))
+                    else:
+                        data = message.raw
+                    origin = ""
+                    if offset is not None:
+                        data = data[int(offset):int(offset) + int(length)]
+                        origin = f"<{offset}>"
+                    if not peek:
+                        message.flags.add("\\Seen")
+                    parts.append(f"BODY[{section}]{origin} {{{len(data)}}}\r\n".encode() + data)
+            responses.append(f"* {seq} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+        return responses + [f"OK {'UID ' if uid else ''}FETCH completed"]
+
+    def search(self, mailbox, args, uid):
+        criteria = split_args(args)
+        if len(criteria) >= 2 and criteria[0].upper() == "UID":
+            found = self._select(mailbox, criteria[1], True)
+        else:
+            found = list(enumerate(mailbox.messages, 1))
+        numbers = [str(message.uid if uid else seq) for seq, message in found]
+        return [f"* SEARCH {' '.join(numbers)}".rstrip(), "OK SEARCH completed"]
+
+    def store(self, mailbox, args, uid):
+        message_set, action, flags = split_args(args)[:3]
+        flags = set(flags.strip("()").split())
+        responses = []
+        for seq, message in self._select(mailbox, message_set, uid):
+            if action.upper().startswith("+"):
+                message.flags |= flags
+            elif action.upper().startswith("-"):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            if ".SILENT" not in action.upper():
+                responses.append(f"* {seq} FETCH (UID {message.uid} FLAGS ({' '.join(sorted(message.flags))}))")
+        return responses + ["OK STORE completed"]
+
+
+class FakeSMTPServer(_Server):
+    """An SMTP server that accepts AUTH PLAIN and PIPELINING and counts the mail it is given."""
+
+    def __init__(self, password=None, latency=0.0):
+        self.password = password
+        self.latency = latency
+        self.stats = {"connections": 0, "messages": 0, "recipients": 0, "bytes_in": 0, "bytes_out": 0}
+
+    async def handle(self, reader, writer):
+        self.stats["connections"] += 1
+        out = _DelayedWriter(writer, self.latency, self.stats)
+        out.write(b"220 fake.smtp ESMTP ready\r\n")
+        authenticated = False
+        sender, recipients = None, []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats["bytes_in"] += len(line)
+                command = line.decode("utf-8", errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb in ("EHLO", "HELO"):
+                    out.write(b"250-fake.smtp\r\n250-PIPELINING\r\n250-8BITMIME\r\n250-SIZE 35882577\r\n"
+                              b"250 AUTH PLAIN\r\n")
+                elif verb == "AUTH":
+                    parts = command.split()
+                    if len(parts) < 3 or parts[1].upper() != "PLAIN":
+                        out.write(b"504 Only AUTH PLAIN with an initial response\r\n")
+                        continue
+                    _, _, password = base64.b64decode(parts[2]).decode("utf-8").split("\0")
+                    if self.password is not None and password != self.password:
+                        out.write(b"535 5.7.8 Authentication failed\r\n")
+                    else:
+                        authenticated = True
+                        out.write(b"235 2.7.0 Accepted\r\n")
+                elif verb == "MAIL":
+                    if not authenticated:
+                        out.write(b"530 5.7.0 Authentication required\r\n")
+                    else:
+                        sender, recipients = command[10:].strip("<>"), []
+                        out.write(b"250 2.1.0 OK\r\n")
+                elif verb == "RCPT":
+                    if sender is None:
+                        out.write(b"503 5.5.1 MAIL first\r\n")
+                    else:
+                        recipients.append(command[8:].strip("<>"))
+                        out.write(b"250 2.1.5 OK\r\n")
+                elif verb == "DATA":
+                    if not recipients:
+                        out.write(b"503 5.5.1 RCPT first\r\n")
+                        continue
+                    out.write(b"354 Go ahead\r\n")
+                    while True:
+                        data = await reader.readline()
+                        self.stats["bytes_in"] += len(data)
+                        if data in (b".\r\n", b".\n", b""):
+                            break
+                    self.stats["messages"] += 1
+                    self.stats["recipients"] += len(recipients)
+                    sender, recipients = None, []
+                    out.write(b"250 2.0.0 OK queued\r\n")
+                elif verb == "RSET":
+                    sender, recipients = None, []
+                    out.write(b"250 2.0.0 OK\r\n")
+                elif verb == "NOOP":
+                    out.write(b"250 2.0.0 OK\r\n")
+                elif verb == "QUIT":
+                    out.write(b"221 2.0.0 Bye\r\n")
+                    break
+                else:
+                    out.write(b"502 5.5.2 Command not implemented\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await out.close()
+
+
+class FakeGeminiServer(_Server):
+    """A stand-in for the Gemini REST API's generateContent and streamGenerateContent.
+
+    Point the SDK at it with GEMINI_API_ENDPOINT=http://host:port. Replies
+    follow the app's prompt format (a subject line, a blank line, the body).
+    The first chunk comes after `latency` seconds and every further chunk
+    `chunk_delay` later; `error_rate` of the requests get a 429 instead.
+    """
+
+    def __init__(self, latency=0.0, chunk_delay=0.0, chunks=8, words=150, error_rate=0.0):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.words = words
+        self.error_rate = error_rate
+        self.random = random.Random(0)
+        self.stats = {"connections": 0, "requests": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def reply(self, prompt):
+        about = re.search(r"about: (.*?)\. Start", prompt)
+        topic = (about.group(1) if about else prompt)[:60].strip() or "Your request"
+        receiver = re.search(r" to (.*?)\. ", prompt)
+        words = " ".join(self.random.choice(_WORDS) for _ in range(self.words))
+        return (f"Subject: {topic[0].upper()}{topic[1:]}\n\n"
+                f"Dear {receiver.group(1) if receiver else 'colleague'},\n\n{words.capitalize()}.\n\nBest regards")
+
+    @staticmethod
+    def _chunk(text, prompt, last):
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        if last:
+            candidate["finishReason"] = "STOP"
+        prompt_tokens = len(prompt) // 4
+        return {"candidates": [candidate],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text) // 4,
+                                  "totalTokenCount": prompt_tokens + len(text) // 4}}
+
+    async def handle(self, reader, writer):
+        self.stats["connections"] += 1
+
+        def send(data):
+            writer.write(data)
+            self.stats["bytes_out"] += len(data)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats["bytes_in"] += len(line)
+                method, path, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    self.stats["bytes_in"] += len(header)
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                self.stats["bytes_in"] += len(body)
+                self.stats["requests"] += 1
+
+                match = re.match(r"/v1beta/models/[^/:]+:(generateContent|streamGenerateContent)", path)
+                if method != "POST" or not match:
+                    payload = json.dumps({"error": {"code": 404, "message": "Not found"}}).encode()
+                    send(b"HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                    continue
+                await asyncio.sleep(self.latency)
+                if self.random.random() < self.error_rate:
+                    self.stats["errors"] += 1
+                    payload = json.dumps({"error": {"code": 429, "message": "Resource has been exhausted",
+                                                    "status": "RESOURCE_EXHAUSTED"}}).encode()
+                    send(b"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                    continue
+
+                request = json.loads(body or b"{}")
+                prompt = " ".join(part.get("text", "") for content in request.get("contents", [])
+                                  for part in content.get("parts", []))
+                text = self.reply(prompt)
+                if match.group(1) == "generateContent":
+                    await asyncio.sleep(self.chunk_delay * (self.chunks - 1))
+                    payload = json.dumps(self._chunk(text, prompt, True)).encode()
+                    send(b"HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=UTF-8\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                    await writer.drain()
+                    continue
+
+                # Streamed as one JSON array, like the REST API without alt=sse
+                send(b"HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=UTF-8\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+                step = -(-len(text) // self.chunks)
+                pieces = [text[i:i + step] for i in range(0, len(text), step)]
+                for i, piece in enumerate(pieces):
+                    if i:
+                        await asyncio.sleep(self.chunk_delay)
+                    data = ("[" if i == 0 else ",") + json.dumps(self._chunk(piece, prompt, i == len(pieces) - 1))
+                    if i == len(pieces) - 1:
+                        data += "]"
+                    data = data.encode()
+                    send(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    await writer.drain()
+                send(b"0\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def add_arguments(parser):
+    """Options that shape the fake servers, shared with benchmark.py."""
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--messages", type=int, default=200, help="messages in INBOX (other folders get a quarter)")
+    parser.add_argument("--body-bytes", type=int, default=2000, help="typical size of a message's text")
+    parser.add_argument("--attachment-bytes", type=int, default=100_000, help="typical size of an attachment")
+    parser.add_argument("--attachments", type=float, default=0.2, help="share of messages with an attachment")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to every IMAP/SMTP response")
+    parser.add_argument("--gemini-latency", type=float, default=300, help="milliseconds until Gemini's first chunk")
+    parser.add_argument("--gemini-chunk-delay", type=float, default=50, help="milliseconds between Gemini chunks")
+    parser.add_argument("--gemini-errors", type=float, default=0, help="share of Gemini requests answered with 429")
+    parser.add_argument("--password", default=None, help="only accept this password")
+
+
+async def start_servers(args, imap_port=0, smtp_port=0, gemini_port=0):
+    """Start the three servers described by add_arguments() options; returns (imap, smtp, gemini)."""
+    imap = await FakeIMAPServer(messages=args.messages, password=args.password, latency=args.latency / 1000,
+                                body_bytes=args.body_bytes, attachment_bytes=args.attachment_bytes,
+                                attachment_ratio=args.attachments).start(args.host, imap_port)
+    smtp = await FakeSMTPServer(password=args.password, latency=args.latency / 1000).start(args.host, smtp_port)
+    gemini = await FakeGeminiServer(latency=args.gemini_latency / 1000, chunk_delay=args.gemini_chunk_delay / 1000,
+                                    error_rate=args.gemini_errors).start(args.host, gemini_port)
+    return imap, smtp, gemini
+
+
+def settings(host, imap, smtp, gemini):
+    """The environment that points the app at running fake servers."""
+    return {
+        "IMAP_HOST": host, "IMAP_PORT": str(imap.port), "IMAP_SSL": "0", "IMAP_IDLE_ENABLED": "0",
+        "SMTP_HOST": host, "SMTP_PORT": str(smtp.port), "SMTP_STARTTLS": "0",
+        "GEMINI_API_ENDPOINT": f"http://{host}:{gemini.port}", "GOOGLE_API_KEY": "fake-key",
+    }
+
+
+async def _serve(args):
+    imap, smtp, gemini = await start_servers(args, args.imap_port, args.smtp_port, args.gemini_port)
+    print(f"Fake IMAP on {args.host}:{imap.port}, fake SMTP on {args.host}:{smtp.port}, "
+          f"fake Gemini on {args.host}:{gemini.port}. Use:")
+    print("  " + " ".join(f"{name}={value}" for name, value in settings(args.host, imap, smtp, gemini).items()))
+    await asyncio.gather(imap.server.serve_forever(), smtp.server.serve_forever(), gemini.server.serve_forever())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    add_arguments(parser)
+    parser.add_argument("--imap-port", type=int, default=1143)
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument("--gemini-port", type=int, default=1080)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
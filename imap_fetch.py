@@ -0,0 +1,162 @@
+import re
+
+import metrics
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+
+
+# Parenthesis tokens, kept distinct from quoted strings that happen to read "(" or ")"
+LPAREN = object()
+RPAREN = object()
+
+
+class Literal(bytes):
+    """Raw bytes that arrived as an IMAP literal."""
+
+
+def build_message_set(ids):
+    """Collapse message numbers into an IMAP message-set such as '1:15,20,22:23'."""
+    numbers = sorted({int(i) for i in ids})
+    ranges = []
+    for n in numbers:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _tokenize(data, tokens):
+    """Split the non-literal part of a response line into tokens."""
+    i, n = 0, len(data)
+    while i < n:
+        c = data[i:i + 1]
+        if c in b" \r\n":
+            i += 1
+        elif c == b"(":
+            tokens.append(LPAREN)
+            i += 1
+        elif c == b")":
+            tokens.append(RPAREN)
+            i += 1
+        elif c == b'"':
+            i += 1
+            value = bytearray()
+            while i < n and data[i:i + 1] != b'"':
+                if data[i:i + 1] == b"\\":
+                    i += 1
+                value += data[i:i + 1]
+                i += 1
+            tokens.append(value.decode("utf-8", errors="replace"))
+            i += 1
+        else:
+            start = i
+            while i < n and data[i:i + 1] not in b" ()":
+                # Section specs such as BODY[HEADER.FIELDS (FROM)] keep their spaces and parens
+                if data[i:i + 1] == b"[":
+                    i = data.index(b"]", i)
+                i += 1
+            atom = data[start:i].decode("utf-8", errors="replace")
+            if atom.isdigit():
+                tokens.append(int(atom))
+            elif atom.upper() == "NIL":
+                tokens.append(None)
+            else:
+                tokens.append(atom)
+
+
+def tokenize_response(data):
+    """Turn the list returned by imaplib (bytes and (header, literal) tuples) into tokens."""
+    tokens = []
+    for element in data:
+        if isinstance(element, tuple):
+            head, literal = element
+            match = _LITERAL_RE.search(head)
+            _tokenize(head[:match.start()] if match else head, tokens)
+            tokens.append(Literal(literal))
+        elif element:
+            _tokenize(element, tokens)
+    return tokens
+
+
+def parse_list(tokens, i):
+    """Parse a parenthesised list starting at tokens[i] is LPAREN; return (list, next index)."""
+    items = []
+    i += 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token is LPAREN:
+            value, i = parse_list(tokens, i)
+            items.append(value)
+            continue
+        if token is RPAREN:
+            return items, i + 1
+        items.append(token)
+        i += 1
+    return items, i
+
+
+@metrics.timed("mail_parse_seconds", stage="fetch_response")
+def parse_fetch_response(data):
+    """Split a FETCH response into one record per message, keyed by sequence number.
+
+    Each record maps upper-cased item names (UID, FLAGS, RFC822, BODY[...]) to
+    their values; literals come back as bytes.
+    """
+    if metrics.enabled:
+        # Literals carry the headers, bodies and attachments; both backends parse through here
+        metrics.count("imap_fetch_bytes_total", sum(len(e[1]) for e in data if isinstance(e, tuple)))
+    tokens = tokenize_response(data)
+    records = {}
+    i = 0
+    while i < len(tokens):
+        if isinstance(tokens[i], int) and i + 1 < len(tokens) and tokens[i + 1] is LPAREN:
+            seq = tokens[i]
+            items, i = parse_list(tokens, i + 1)
+            record = records.setdefault(seq, {"SEQ": seq})
+            for key, value in zip(items[::2], items[1::2]):
+                record[str(key).upper()] = value
+        else:
+            i += 1
+    return records
+
+
+def section(record, name):
+    """Return the value of the first BODY[name...] item in a fetch record."""
+    prefix = f"BODY[{name}".upper()
+    for key, value in record.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+
+def fetch_messages(imap_server, ids, items, uid=False, modifiers=None):
+    """Fetch several messages with a single FETCH command and split the records.
+
+    `ids` is either an iterable of message numbers or a ready-made message-set
+    such as '1:500'. `modifiers` is appended as-is to a UID FETCH, e.g.
+    '(CHANGEDSINCE 42)'; imaplib's plain fetch() has no room for them.
+    Returns a list of records in the order the server sent them.
+    """
+    message_set = ids if isinstance(ids, str) else build_message_set(ids)
+    if not message_set:
+        return []
+    with metrics.span("imap_command_seconds", command="fetch", backend="sync"):
+        if uid:
+            args = (message_set, items) + ((modifiers,) if modifiers else ())
+            status, data = imap_server.uid("FETCH", *args)
+        else:
+            status, data = imap_server.fetch(message_set, items)
+    if status != "OK":
+        raise imap_server.error(f"FETCH {message_set} failed: {data}")
+    return list(parse_fetch_response(data).values())
+
+
+def parse_message_set(message_set):
+    """Split a message-set such as '1:3,7' into inclusive (first, last) ranges."""
+    ranges = []
+    for part in message_set.split(","):
+        first, _, last = part.partition(":")
+        first, last = int(first), int(last or first)
+        ranges.append((min(first, last), max(first, last)))
+    return ranges
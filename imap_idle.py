@@ -0,0 +1,141 @@
+import imaplib
+import re
+import select
+import threading
+import time
+
+import config
+
+# Untagged responses that mean the mailbox contents or flags changed
+_CHANGE_RE = re.compile(rb"\* (\d+ (EXISTS|EXPUNGE|FETCH)|VANISHED)\b", re.IGNORECASE)
+
+
+class _LineReader:
+    """Reads CRLF-terminated lines straight off the socket with a timeout.
+
+    imaplib's buffered file can't be read with a timeout without breaking it,
+    so IDLE reads the socket directly; nothing else is in flight meanwhile.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def readline(self, timeout):
+        """Return the next line, or None if nothing arrived within `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self.buffer:
+            # TLS may already hold decrypted bytes that select() can't see
+            pending = self.sock.pending() if hasattr(self.sock, "pending") else 0
+            if not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([self.sock], [], [], remaining)[0]:
+                    return None
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise imaplib.IMAP4.abort("Connection closed by server")
+            self.buffer += chunk
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+
+class IMAPIdleListener(threading.Thread):
+    """Holds IDLE on a mailbox over a dedicated connection and calls on_change() when it changes.
+
+    Servers without IDLE are polled with NOOP instead. The connection is
+    reopened with backoff if it drops.
+    """
+
+    def __init__(self, pool, on_change, mailbox=None, reissue=None, poll=None):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.on_change = on_change
+        self.mailbox = mailbox
+        self.reissue = reissue or config.IMAP_IDLE_SECONDS
+        self.poll = poll or config.IMAP_POLL_SECONDS
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Ask the listener to end its IDLE and log out; returns without waiting."""
+        self._stopped.set()
+
+    def run(self):
+        delay = 1
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = self.pool.open_connection(self.mailbox)
+                conn.untagged_responses.clear()  # SELECT's own EXISTS isn't news
+                delay = 1
+                wait = self._idle_once if "IDLE" in conn.capabilities else self._poll_once
+                print(f"✅ Listening for new mail ({'IDLE' if wait == self._idle_once else 'polling'})")
+                while not self._stopped.is_set():
+                    if wait(conn):
+                        self._notify()
+            except (imaplib.IMAP4.error, OSError) as e:
+                if self._stopped.is_set():
+                    break
+                print(f"⚠️ IMAP IDLE dropped ({e}), reconnecting in {delay} s...")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, 300)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.logout()
+                    except Exception:
+                        pass
+
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"❌ Failed to sync after mailbox change: {e}")
+
+    def _idle_once(self, conn):
+        """Run one IDLE command until a change, the re-issue timeout or stop().
+
+        Returns True if the server reported a change.
+        """
+        tag = conn._new_tag()
+        conn.send(tag + b" IDLE\r\n")
+        reader = _LineReader(conn.sock)
+
+        line = reader.readline(30)
+        if line is None or not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+        changed = False
+        deadline = time.monotonic() + self.reissue
+        while not changed and not self._stopped.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Wake up every second so stop() doesn't have to wait for the server
+            line = reader.readline(min(remaining, 1))
+            if line is not None and _CHANGE_RE.match(line):
+                changed = True
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = reader.readline(30)
+            if line is None:
+                raise imaplib.IMAP4.abort("No reply to IDLE DONE")
+            if _CHANGE_RE.match(line):
+                changed = True
+            elif line.startswith(tag):
+                if not line[len(tag):].strip().upper().startswith(b"OK"):
+                    raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+                return changed
+
+    def _poll_once(self, conn):
+        """Fallback for servers without IDLE: NOOP every few seconds and look at what came back."""
+        if self._stopped.wait(self.poll):
+            return False
+        status, _ = conn.noop()
+        if status != "OK":
+            raise imaplib.IMAP4.abort("NOOP failed")
+        changed = False
+        for name in ("EXISTS", "EXPUNGE", "FETCH", "VANISHED"):
+            if conn.untagged_responses.pop(name, None):
+                changed = True
+        return changed
@@ -0,0 +1,256 @@
+import imaplib
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import metrics
+
+
+class IMAPLoginError(imaplib.IMAP4.error):
+    """Raised when the server rejects the IMAP credentials."""
+
+
+class IMAPPool:
+    """Small pool of logged-in IMAP connections kept alive with NOOP."""
+
+    def __init__(self, emailid, passkey, host=None, port=None, mailbox="INBOX",
+                 size=None, keepalive=None, use_ssl=None):
+        self.emailid = emailid
+        self.passkey = passkey
+        self.host = host or config.IMAP_HOST
+        self.port = port or config.IMAP_PORT
+        self.mailbox = mailbox
+        self.size = size or config.IMAP_POOL_SIZE
+        self.keepalive = keepalive or config.IMAP_KEEPALIVE_SECONDS
+        self.use_ssl = config.IMAP_SSL if use_ssl is None else use_ssl
+
+        self._idle = []  # (connection, last used) pairs, most recent last
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.stats = {
+            "connects": 0,
+            "reconnects": 0,
+            "reuses": 0,
+            "keepalives": 0,
+            "last_connect_ms": 0.0,
+            "last_login_ms": 0.0,
+            "total_connect_ms": 0.0,
+            "total_login_ms": 0.0,
+            "saved_ms": 0.0,
+        }
+
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+        self._keepalive_thread.start()
+
+    def _open(self):
+        """Open and authenticate a new connection, recording how long it took."""
+        start = time.perf_counter()
+        if self.use_ssl:
+            conn = imaplib.IMAP4_SSL(self.host, self.port)
+        else:
+            conn = imaplib.IMAP4(self.host, self.port)
+        connected = time.perf_counter()
+
+        try:
+            conn.login(self.emailid, self.passkey)
+        except imaplib.IMAP4.abort:
+            conn.shutdown()
+            raise
+        except imaplib.IMAP4.error as e:
+            conn.shutdown()
+            raise IMAPLoginError(str(e))
+        logged_in = time.perf_counter()
+
+        # QRESYNC lets mailbox syncs learn about expunged messages without a full UID scan
+        conn.qresync = False
+        if "QRESYNC" in conn.capabilities:
+            try:
+                conn.qresync = conn.enable("QRESYNC")[0] == "OK"
+            except imaplib.IMAP4.error as e:
+                print(f"⚠️ Could not enable QRESYNC: {e}")
+
+        conn.selected_mailbox = None
+        conn.fresh_select = None  # mailbox whose SELECT responses nobody has read yet
+        connect_ms = (connected - start) * 1000
+        login_ms = (logged_in - connected) * 1000
+        metrics.observe("imap_connect_seconds", connected - start, backend="sync")
+        metrics.observe("imap_login_seconds", logged_in - connected, backend="sync")
+        with self._lock:
+            self.stats["connects"] += 1
+            self.stats["last_connect_ms"] = connect_ms
+            self.stats["last_login_ms"] = login_ms
+            self.stats["total_connect_ms"] += connect_ms
+            self.stats["total_login_ms"] += login_ms
+        print(f"✅ IMAP connected in {connect_ms:.0f} ms, logged in in {login_ms:.0f} ms")
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.logout()
+        except Exception:
+            try:
+                conn.shutdown()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            return conn.noop()[0] == "OK"
+        except (imaplib.IMAP4.error, OSError):
+            return False
+
+    def select(self, conn, mailbox=None):
+        """SELECT the mailbox on the connection unless it is already selected."""
+        mailbox = mailbox or self.mailbox
+        if conn.selected_mailbox == mailbox:
+            return
+        with metrics.span("imap_command_seconds", command="select", backend="sync"):
+            status, data = conn.select(mailbox)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Failed to select {mailbox}: {data}")
+        conn.selected_mailbox = mailbox
+        conn.fresh_select = mailbox
+
+    def acquire(self, timeout=None):
+        """Take a live connection from the pool, opening one if none are idle."""
+        if self._closed.is_set():
+            raise imaplib.IMAP4.error("IMAP pool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No IMAP connection available")
+
+        try:
+            while True:
+                with self._lock:
+                    conn, last_used = self._idle.pop() if self._idle else (None, 0)
+                if conn is None:
+                    metrics.count("pool_checkouts_total", pool="imap", result="opened", backend="sync")
+                    return self._open()
+                # Connections idle for longer than the keepalive interval may have been dropped
+                if time.monotonic() - last_used < self.keepalive or self._is_alive(conn):
+                    with self._lock:
+                        self.stats["reuses"] += 1
+                        self.stats["saved_ms"] += self.stats["last_connect_ms"] + self.stats["last_login_ms"]
+                    metrics.count("pool_checkouts_total", pool="imap", result="reused", backend="sync")
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Return a connection to the pool, or drop it if it is no longer usable."""
+        if broken or self._closed.is_set():
+            self._discard(conn)
+        else:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, mailbox=None):
+        """Borrow a connection with the mailbox selected for the duration of a block."""
+        conn = self.acquire()
+        try:
+            # SELECT responses from an earlier borrow are out of date
+            conn.fresh_select = None
+            self.select(conn, mailbox)
+            yield conn
+        except (imaplib.IMAP4.abort, OSError):
+            self.release(conn, broken=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def run(self, func, mailbox=None, retries=1):
+        """Call func(conn) on a pooled connection, reconnecting if the connection drops."""
+        for attempt in range(retries + 1):
+            try:
+                with self.connection(mailbox) as conn:
+                    return func(conn)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                if attempt == retries:
+                    raise
+                with self._lock:
+                    self.stats["reconnects"] += 1
+                print(f"⚠️ IMAP connection dropped ({e}), reconnecting...")
+
+    def open_connection(self, mailbox=None):
+        """Open a dedicated, selected connection that is not counted against the pool.
+
+        Meant for long-running commands such as IDLE; the caller logs it out.
+        """
+        conn = self._open()
+        try:
+            self.select(conn, mailbox)
+        except BaseException:
+            self._discard(conn)
+            raise
+        return conn
+
+    def warm(self):
+        """Open one connection ahead of time so the first fetch doesn't pay for it."""
+        with self.connection():
+            pass
+
+    def _keepalive_loop(self):
+        while not self._closed.wait(self.keepalive / 2):
+            # Check stale connections one at a time, each holding a pool slot like any borrower,
+            # so a concurrent acquire() can't open a connection beyond the pool size meanwhile
+            while not self._closed.is_set() and self._slots.acquire(blocking=False):
+                try:
+                    if not self._check_stale():
+                        break
+                finally:
+                    self._slots.release()
+
+    def _check_stale(self):
+        """NOOP the idle connection unused for longest if it is stale; False when none is."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._idle or now - self._idle[0][1] < self.keepalive / 2:
+                return False
+            conn, last_used = self._idle.pop(0)
+
+        if self._is_alive(conn):
+            # Just checked, so it goes to the most-recently-used end
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+                self.stats["keepalives"] += 1
+            return True
+
+        # The server dropped us; replace the connection so the pool stays warm
+        self._discard(conn)
+        try:
+            replacement = self._open()
+        except Exception as e:
+            print(f"⚠️ IMAP reconnect failed: {e}")
+            return False
+        try:
+            self.select(replacement)
+        except Exception as e:
+            self._discard(replacement)
+            print(f"⚠️ IMAP reconnect failed: {e}")
+            return False
+        if self._closed.is_set():
+            self._discard(replacement)
+            return False
+        with self._lock:
+            self.stats["reconnects"] += 1
+            self._idle.append((replacement, time.monotonic()))
+        return True
+
+    def close(self):
+        """Log out every idle connection and stop the keepalive thread."""
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+        print("✅ IMAP pool closed")
@@ -0,0 +1,165 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from PyQt5.QtGui import QFont
+
+import config
+from mail_sync import fetch_older_headers
+from workers import run_job
+
+
+class EmailRow:
+    """Just what the inbox list shows for one email; bodies stay in the MailStore."""
+
+    __slots__ = ("uid", "subject", "sender", "date", "flags")
+
+    def __init__(self, uid, subject, sender, date, flags):
+        self.uid = uid
+        self.subject = subject
+        self.sender = sender
+        self.date = date
+        self.flags = flags
+
+    @property
+    def unread(self):
+        return "\\Seen" not in self.flags.split()
+
+
+class InboxModel(QAbstractListModel):
+    """Lazily loaded, newest-first list of a mailbox's headers for a QListView.
+
+    Rows are read from the MailStore a page at a time as the view scrolls
+    (canFetchMore/fetchMore). When the cache runs out, the next page of older
+    headers is fetched from the server in the background. Only rows scrolled
+    to so far are held, as compact EmailRow records. With a search query set
+    the rows come from the local full-text index instead, also page by page.
+    """
+
+    def __init__(self, mail_store, imap_pool, account, mailbox="INBOX", page_size=None, parent=None):
+        super().__init__(parent)
+        self.mail_store = mail_store
+        self.imap_pool = imap_pool
+        self.account = account
+        self.mailbox = mailbox
+        self.page_size = page_size or config.INBOX_PAGE_SIZE
+        self.uidvalidity = None
+        self.rows = []
+        self.query = ""
+        self.cache_exhausted = False
+        self.server_exhausted = False
+        self.older_job = None
+        self._bold = QFont()
+        self._bold.setBold(True)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return row.subject
+        if role == Qt.ToolTipRole:
+            return f"From: {row.sender}\nDate: {row.date}"
+        if role == Qt.FontRole and row.unread:
+            return self._bold
+        return None
+
+    def row(self, number):
+        return self.rows[number]
+
+    def _load_page(self, before_uid, limit):
+        if self.query:
+            rows = self.mail_store.search(
+                self.account, self.mailbox, self.uidvalidity, self.query, before_uid, limit
+            )
+        else:
+            rows = self.mail_store.page(self.account, self.mailbox, self.uidvalidity, before_uid, limit)
+        return [EmailRow(r["uid"], r["subject"], r["sender"], r["date"], r["flags"]) for r in rows]
+
+    def set_mailbox(self, mailbox):
+        """Switch the list to another synced folder of the same account."""
+        self.cancel()
+        self.mailbox = mailbox
+        self.server_exhausted = False
+        self.reload(self.page_size)
+
+    def set_query(self, text):
+        """Show only emails matching `text` (see mail_store.build_search_query); "" shows them all."""
+        text = text.strip()
+        if text == self.query:
+            return
+        self.query = text
+        self.reload(self.page_size)
+
+    def reload(self, count=None):
+        """Re-read the rows loaded so far from the cache, e.g. after a sync changed them.
+
+        The view keeps roughly the same number of rows so its scroll position survives.
+        """
+        self.beginResetModel()
+        self.uidvalidity, _ = self.mail_store.get_mailbox(self.account, self.mailbox)
+        self.rows = self._load_page(None, count or max(len(self.rows), self.page_size))
+        self.cache_exhausted = False
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.uidvalidity is None:
+            return False
+        if self.query:
+            # Search only covers what has been synced
+            return not self.cache_exhausted
+        return not self.cache_exhausted or (not self.server_exhausted and self.older_job is None)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        before_uid = self.rows[-1].uid if self.rows else None
+        if not self.cache_exhausted:
+            rows = self._load_page(before_uid, self.page_size)
+            if rows:
+                self._append(rows)
+                return
+            self.cache_exhausted = True
+        if self.query:
+            return
+
+        # Everything cached is shown; ask the server for the page before it
+        if not self.server_exhausted and self.older_job is None:
+            self.older_job = run_job(
+                self.imap_pool.run,
+                lambda imap_server: fetch_older_headers(
+                    imap_server, self.mail_store, self.account, self.mailbox, self.uidvalidity, self.page_size
+                ),
+                self.mailbox,
+                on_result=self._older_fetched,
+                on_error=lambda e: print(f"❌ Failed to fetch older emails: {e}"),
+                on_finished=self._older_finished
+            )
+
+    def _append(self, rows):
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+
+    def _older_fetched(self, added):
+        if not added:
+            self.server_exhausted = True
+            return
+        self.cache_exhausted = False
+        self.fetchMore()
+
+    def _older_finished(self):
+        self.older_job = None
+
+    def set_flags(self, uid, flags):
+        for number, row in enumerate(self.rows):
+            if row.uid == uid:
+                row.flags = flags
+                index = self.index(number)
+                self.dataChanged.emit(index, index, [Qt.FontRole])
+                break
+
+    def cancel(self):
+        if self.older_job is not None:
+            self.older_job.cancel()
@@ -0,0 +1,321 @@
+import asyncio
+import datetime
+import functools
+import hmac
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import aio_mail
+import config
+import metrics
+import smtp_pool
+from imap_idle import IMAPIdleListener
+from mail_client import MailClient, authenticate
+from sync_engine import quote_mailbox
+
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+    415: "Unsupported Media Type", 500: "Internal Server Error", 502: "Bad Gateway",
+}
+MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _int_param(params, name, default=None):
+    value = params.get(name, [None])[0]
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be a number")
+
+
+def _fields(data, *names):
+    """Required string fields of a JSON request body."""
+    missing = [name for name in names if not isinstance(data.get(name), str) or not data[name].strip()]
+    if missing:
+        raise HTTPError(400, f"Missing fields: {', '.join(missing)}")
+    return [data[name].strip() for name in names]
+
+
+class MailAPI:
+    """Local HTTP/JSON API over a MailClient, served by asyncio.
+
+    Every connection is a coroutine, so many slow or idle clients cost almost
+    nothing. The blocking IMAP, SMTP and Gemini calls run on one shared thread
+    pool and reuse the client's connection pools and caches. Requests with an
+    Origin header or a body that isn't application/json are refused, so a web
+    page open in a browser can't use the API.
+
+    GET    /health
+    GET    /messages?mailbox=INBOX&before=<uid>&limit=<n>&q=<search>
+    GET    /messages/<uid>?mailbox=INBOX
+    POST   /sync          {"mailbox": "INBOX"} or {"all": true}
+    POST   /send          {"to", "subject", "body"}
+    POST   /schedule      {"to", "subject", "body", "send_at": ISO 8601}
+    GET    /scheduled
+    DELETE /scheduled/<id>
+    POST   /generate      {"sender", "receiver", "description", "force"}
+    """
+
+    def __init__(self, client, host=None, port=None, token=None, workers=None):
+        self.client = client
+        self.host = host or config.API_HOST
+        self.port = config.API_PORT if port is None else port
+        self.token = config.API_TOKEN if token is None else token
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.API_WORKERS,
+                                           thread_name_prefix="mail-api")
+        self.routes = [
+            ("GET", re.compile(r"/health"), self.health),
+            ("GET", re.compile(r"/messages"), self.list_messages),
+            ("GET", re.compile(r"/messages/(\d+)"), self.get_message),
+            ("POST", re.compile(r"/sync"), self.sync),
+            ("POST", re.compile(r"/send"), self.send),
+            ("POST", re.compile(r"/schedule"), self.schedule),
+            ("GET", re.compile(r"/scheduled"), self.list_scheduled),
+            ("DELETE", re.compile(r"/scheduled/(\d+)"), self.cancel_scheduled),
+            ("POST", re.compile(r"/generate"), self.generate),
+        ]
+        self.server = None
+
+    async def call(self, fn, *args, **kwargs):
+        """Run a blocking core call on the shared thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    # Handlers return (status, JSON-able payload)
+
+    async def health(self, params, data):
+        return 200, {"ok": True, "account": self.client.emailid}
+
+    async def list_messages(self, params, data):
+        mailbox = quote_mailbox(params.get("mailbox", ["INBOX"])[0])
+        messages = await self.call(
+            self.client.messages, mailbox, _int_param(params, "before"),
+            min(_int_param(params, "limit", config.INBOX_PAGE_SIZE), 1000), params.get("q", [""])[0]
+        )
+        return 200, {"mailbox": mailbox, "messages": messages}
+
+    async def get_message(self, params, data, uid):
+        mailbox = quote_mailbox(params.get("mailbox", ["INBOX"])[0])
+        email_data = await self.call(self.client.message, mailbox, int(uid))
+        if email_data is None:
+            raise HTTPError(404, "No such message in the cache; sync the mailbox first")
+        return 200, email_data
+
+    async def sync(self, params, data):
+        if data.get("all"):
+            results = await self.call(self.client.sync_engine.sync)
+            return 200, {"results": results}
+        mailbox = quote_mailbox(str(data.get("mailbox") or "INBOX"))
+        added = await self.call(self.client.sync, mailbox)
+        return 200, {"mailbox": mailbox, "added": added}
+
+    async def send(self, params, data):
+        to, subject, body = _fields(data, "to", "subject", "body")
+        ok, message = await self.call(self.client.send, to, subject, body)
+        return (200 if ok else 502), {"ok": ok, "message": message}
+
+    async def schedule(self, params, data):
+        to, subject, body, send_at = _fields(data, "to", "subject", "body", "send_at")
+        try:
+            send_at = datetime.datetime.fromisoformat(send_at)
+        except ValueError:
+            raise HTTPError(400, "send_at must be an ISO 8601 date and time")
+        if send_at.tzinfo is not None:
+            # Scheduled times are stored as naive local time
+            send_at = send_at.astimezone().replace(tzinfo=None)
+        if send_at < datetime.datetime.now():
+            raise HTTPError(400, "send_at is in the past")
+        email_id = await self.call(self.client.schedule, to, subject, body, send_at)
+        return 201, {"id": email_id, "send_at": send_at}
+
+    async def list_scheduled(self, params, data):
+        return 200, {"scheduled": await self.call(self.client.scheduled)}
+
+    async def cancel_scheduled(self, params, data, email_id):
+        if not await self.call(self.client.cancel_scheduled, int(email_id)):
+            raise HTTPError(409, "This email is already being sent, sent or cancelled")
+        return 200, {"ok": True}
+
+    async def generate(self, params, data):
+        sender, receiver, description = _fields(data, "sender", "receiver", "description")
+        result = await self.call(self.client.generate, sender, receiver, description, force=bool(data.get("force")))
+        if result is None:
+            raise HTTPError(502, "Gemini returned no text")
+        subject, body = result
+        return 200, {"subject": subject, "body": body}
+
+    async def dispatch(self, method, target, headers, body):
+        # Browsers add Origin to cross-site requests, and can send a "simple" text/plain POST
+        # without asking first; neither comes from a real API client
+        if "origin" in headers:
+            raise HTTPError(403, "Requests from web pages are not allowed")
+        if body and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            raise HTTPError(415, "Send request bodies as application/json")
+        if self.token:
+            supplied = headers.get("authorization", "")
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {self.token}".encode()):
+                raise HTTPError(401, "Missing or wrong API token")
+
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        allowed = []
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(url.path.rstrip("/") or "/")
+            if not match:
+                continue
+            if route_method != method:
+                allowed.append(route_method)
+                continue
+            data = {}
+            if body:
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    raise HTTPError(400, "Body is not valid JSON")
+                if not isinstance(data, dict):
+                    raise HTTPError(400, "Body must be a JSON object")
+            return await handler(params, data, *match.groups())
+        if allowed:
+            raise HTTPError(405, f"Use {', '.join(allowed)}")
+        raise HTTPError(404, "No such endpoint")
+
+    async def read_request(self, reader):
+        """Read one request; returns None when the client has closed the connection."""
+        line = await asyncio.wait_for(reader.readline(), config.API_IDLE_TIMEOUT_SECONDS)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), config.API_IDLE_TIMEOUT_SECONDS)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS or b":" not in line:
+                raise HTTPError(400, "Malformed headers")
+            name, value = line.decode("latin-1").split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length")
+        if length > config.API_MAX_BODY_BYTES:
+            raise HTTPError(413, f"Bodies are limited to {config.API_MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method.upper(), target, version.upper(), headers, body
+
+    @staticmethod
+    async def write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=_json_default).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection, keeping it open between them (HTTP/1.1)."""
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HTTPError as e:
+                    await self.write_response(writer, e.status, {"error": str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                start = time.perf_counter()
+                try:
+                    status, payload = await self.dispatch(method, target, headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    print(f"❌ {method} {target} failed: {e}")
+                    status, payload = 500, {"error": str(e)}
+                print(f"🌐 {method} {target} {status} in {(time.perf_counter() - start) * 1000:.0f} ms")
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # Idle, truncated or oversized-line requests just drop the connection
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"🌐 Mail API for {self.client.emailid} listening on http://{self.host}:{self.port}")
+        return self.server
+
+    async def serve(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    """Run the headless service for the API_EMAIL mailbox until interrupted."""
+    if not config.API_EMAIL or not config.API_PASSWORD:
+        raise SystemExit("Set API_EMAIL and API_PASSWORD to run the mail API.")
+    if not config.API_TOKEN:
+        raise SystemExit("Set API_TOKEN; the API can send mail, so it never runs without one.")
+    if not authenticate(config.API_EMAIL, config.API_PASSWORD):
+        raise SystemExit("Login failed.")
+
+    metrics.start()
+    client = MailClient(config.API_EMAIL, config.API_PASSWORD)
+    client.scheduled_sender.resume()
+
+    api = MailAPI(client)
+    listener = None
+    if config.IMAP_IDLE_ENABLED:
+        listener = IMAPIdleListener(client.imap_pool, lambda: client.sync("INBOX"), "INBOX")
+        listener.start()
+    # Catch up on every folder in the background while requests are already served
+    api.executor.submit(client.sync_engine.sync)
+    try:
+        asyncio.run(api.serve())
+    except KeyboardInterrupt:
+        print("Shutting down")
+    finally:
+        if listener is not None:
+            listener.stop()
+        api.close()
+        client.close()
+        smtp_pool.close_all()
+        aio_mail.close_sessions()
+
+
+if __name__ == "__main__":
+    main()
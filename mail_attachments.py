@@ -0,0 +1,216 @@
+import json
+import os
+from email.header import decode_header, make_header
+
+import config
+from imap_fetch import Literal, fetch_messages, section
+from mail_parse import TransferDecoder
+
+# Positions of the disposition in a single-part BODYSTRUCTURE, which depend on the type
+_DISPOSITION_INDEX = {"text": 9, "message/rfc822": 11}
+
+
+def _text(value):
+    if isinstance(value, Literal):
+        return bytes(value).decode("utf-8", errors="replace")
+    return value if isinstance(value, str) else None
+
+
+def _params(values):
+    """Turn a BODYSTRUCTURE parameter list ("NAME" "x" "CHARSET" "y") into a dict."""
+    if not isinstance(values, list):
+        return {}
+    return {str(_text(k)).lower(): _text(v) for k, v in zip(values[::2], values[1::2])}
+
+
+def _decode_name(name):
+    """Filenames may arrive as RFC 2047 encoded words."""
+    if not name:
+        return name
+    try:
+        return str(make_header(decode_header(name)))
+    except (UnicodeDecodeError, LookupError, ValueError):
+        return name
+
+
+def parse_bodystructure(structure, prefix=""):
+    """Flatten a parsed BODYSTRUCTURE into its leaf parts, in section order.
+
+    Each part is a dict with `section` (e.g. "2.1"), `type`, `name`, `size`
+    (encoded bytes on the server), `encoding`, `charset` and `disposition`.
+    Attached messages (message/rfc822) are kept as single parts.
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        parts = []
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            parts.extend(parse_bodystructure(child, f"{prefix}{number}."))
+        return parts
+
+    maintype = str(_text(structure[0]) or "").lower()
+    subtype = str(_text(structure[1]) or "").lower() if len(structure) > 1 else ""
+    content_type = f"{maintype}/{subtype}"
+    params = _params(structure[2] if len(structure) > 2 else None)
+
+    index = _DISPOSITION_INDEX.get(content_type, _DISPOSITION_INDEX.get(maintype, 8))
+    disposition = structure[index] if len(structure) > index else None
+    disposition_type, disposition_params = None, {}
+    if isinstance(disposition, list) and disposition:
+        disposition_type = str(_text(disposition[0]) or "").lower()
+        disposition_params = _params(disposition[1] if len(disposition) > 1 else None)
+
+    size = structure[6] if len(structure) > 6 and isinstance(structure[6], int) else 0
+    return [{
+        # A single-part message's body is section 1
+        "section": prefix.rstrip(".") or "1",
+        "type": content_type,
+        "name": _decode_name(disposition_params.get("filename") or params.get("name")),
+        "size": size,
+        "encoding": str(_text(structure[5]) or "7bit").lower() if len(structure) > 5 else "7bit",
+        "charset": params.get("charset"),
+        "disposition": disposition_type,
+    }]
+
+
+def is_attachment(part):
+    return part["disposition"] == "attachment" or bool(part["name"])
+
+
+def text_part(parts):
+    """The part shown as the email's body: the first inline text/plain one."""
+    for part in parts:
+        if part["type"] == "text/plain" and not is_attachment(part):
+            return part
+    return None
+
+
+def fetch_structure(imap_server, uid):
+    """Return the leaf parts of a message from its BODYSTRUCTURE, without downloading any of them."""
+    records = fetch_messages(imap_server, [uid], "(UID BODYSTRUCTURE)", uid=True)
+    if not records or "BODYSTRUCTURE" not in records[0]:
+        return None
+    return parse_bodystructure(records[0]["BODYSTRUCTURE"])
+
+
+def fetch_part_chunk(imap_server, uid, part_section, offset, length, peek=True):
+    """Fetch `length` raw (still transfer-encoded) bytes of a part starting at `offset`."""
+    item = "BODY.PEEK" if peek else "BODY"
+    records = fetch_messages(imap_server, [uid], f"({item}[{part_section}]<{offset}.{length}>)", uid=True)
+    chunk = section(records[0], part_section) if records else None
+    return bytes(chunk) if chunk is not None else b""
+
+
+def fetch_part_text(imap_server, uid, part, chunk_size=None, max_bytes=None, peek=False):
+    """Download and decode a text part in chunks, stopping at `max_bytes` of text.
+
+    Returns (text, truncated). Unless `peek` is set the first chunk is fetched
+    with BODY[], which marks the message as read like opening it always has.
+    """
+    chunk_size = chunk_size or config.MAIL_FETCH_CHUNK_BYTES
+    max_bytes = max_bytes or config.MAIL_BODY_MAX_BYTES
+    decoder = TransferDecoder(part["encoding"])
+    body = bytearray()
+    offset = 0
+    while len(body) < max_bytes:
+        chunk = fetch_part_chunk(imap_server, uid, part["section"], offset, chunk_size, peek=peek or offset > 0)
+        body += decoder.decode(chunk)
+        offset += len(chunk)
+        if len(chunk) < chunk_size:
+            body += decoder.flush()
+            break
+    truncated = len(body) > max_bytes or offset < part["size"]
+    charset = part["charset"] or "utf-8"
+    try:
+        text = bytes(body[:max_bytes]).decode(charset, errors="ignore")
+    except LookupError:
+        text = bytes(body[:max_bytes]).decode("utf-8", errors="ignore")
+    return text, truncated
+
+
+class AttachmentDownload:
+    """Streams one attachment to a file with BODY.PEEK[n]<offset.length> fetches.
+
+    Decoded data goes to `path + ".part"`, and after every chunk the encoded
+    offset and any held-back input are saved next to it, so an interrupted
+    download carries on where it stopped. Only one chunk is ever in memory.
+    """
+
+    def __init__(self, imap_pool, mailbox, uidvalidity, uid, part, path, chunk_size=None):
+        self.imap_pool = imap_pool
+        self.mailbox = mailbox
+        self.uidvalidity = uidvalidity
+        self.uid = uid
+        self.part = part
+        self.path = path
+        self.chunk_size = chunk_size or config.ATTACHMENT_CHUNK_BYTES
+        self.partial_path = path + ".part"
+        self.state_path = path + ".part.json"
+
+    def _identity(self):
+        return {"mailbox": self.mailbox, "uidvalidity": self.uidvalidity,
+                "uid": self.uid, "section": self.part["section"]}
+
+    def _load_state(self):
+        """Return (offset, written, pending) to resume from, or zeros to start over."""
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0, 0, b""
+        if state.get("identity") != self._identity() or not os.path.exists(self.partial_path):
+            return 0, 0, b""
+        return state["offset"], state["written"], state["pending"].encode("latin-1")
+
+    def _save_state(self, offset, written, pending):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"identity": self._identity(), "offset": offset, "written": written,
+                       "pending": pending.decode("latin-1")}, f)
+        os.replace(tmp, self.state_path)
+
+    def run(self, on_progress=None, cancelled=None):
+        """Download the attachment; returns the saved path, or None if cancelled.
+
+        on_progress(done, total) reports encoded bytes fetched so far.
+        """
+        offset, written, pending = self._load_state()
+        if offset:
+            print(f"⏯️ Resuming {self.part['name']} at {offset} of {self.part['size']} bytes")
+        decoder = TransferDecoder(self.part["encoding"], pending)
+        total = self.part["size"]
+
+        with open(self.partial_path, "r+b" if written else "wb") as f:
+            # Anything written after the last saved state is redone
+            f.truncate(written)
+            f.seek(written)
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                chunk = self.imap_pool.run(
+                    lambda imap_server: fetch_part_chunk(
+                        imap_server, self.uid, self.part["section"], offset, self.chunk_size
+                    ),
+                    self.mailbox
+                )
+                offset += len(chunk)
+                last = len(chunk) < self.chunk_size
+                data = decoder.decode(chunk) + (decoder.flush() if last else b"")
+                f.write(data)
+                written += len(data)
+                f.flush()
+                self._save_state(offset, written, decoder.pending)
+                if on_progress:
+                    on_progress(offset, max(total, offset))
+                if last:
+                    break
+
+        os.replace(self.partial_path, self.path)
+        os.remove(self.state_path)
+        print(f"✅ Saved {self.part['name']} ({written} bytes) to {self.path}")
+        return self.path
@@ -0,0 +1,199 @@
+import smtplib
+from email.message import EmailMessage
+
+import config
+import aio_mail
+import smtp_pool
+from aio_mail import get_backend
+from ai_generate import build_prompt, extract_subject_and_body, generate_text
+from email_scheduler import ScheduledSender
+from imap_pool import IMAPPool
+from mail_store import MailStore
+from mail_sync import fetch_email_body, index_bodies
+from sync_engine import SyncEngine, sync_folder
+
+
+def authenticate(emailid, passkey):
+    """Check credentials with an SMTP login; the session is kept in the pool for sending."""
+    try:
+        if config.MAIL_BACKEND == "asyncio":
+            backend = get_backend()
+            backend.run(backend.login_check(emailid, passkey))
+        else:
+            smtp_pool.get_pool(emailid, passkey).warm()
+        print("Log In Successful.")
+        return True
+    except smtplib.SMTPAuthenticationError:
+        print("Authentication failed.")
+        return False
+    except Exception as e:
+        print("Error:", e)
+        return False
+
+
+class SendEmail:
+    def __init__(self, emailid, password, smtp_server=config.SMTP_HOST, smtp_port=config.SMTP_PORT):
+        self.emailid = emailid
+        self.password = password
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        # Shared by every SendEmail for this account, so sends reuse a logged-in session
+        self.smtp_pool = smtp_pool.get_pool(emailid, password, smtp_server, smtp_port)
+
+    def send_email(self, recipient_email, subject, body):
+        msg = EmailMessage()
+        msg['From'] = self.emailid
+        msg['To'] = recipient_email
+        msg['Subject'] = subject
+        msg.set_content(body)
+
+        try:
+            if config.MAIL_BACKEND == "asyncio":
+                backend = get_backend()
+                backend.run(backend.send_message(
+                    self.emailid, self.password, msg, self.smtp_server, self.smtp_port
+                ))
+            else:
+                self.smtp_pool.send_message(msg)
+
+            print("✅ Email sent successfully!")
+            return True, "Email sent successfully!"
+
+        except smtplib.SMTPAuthenticationError:
+            print("❌ Authentication failed! Invalid email or password.")
+            return False, "Authentication failed! Check your email or password."
+
+        except Exception as e:
+            print(f"❌ Failed to send email: {e}")
+            return False, f"Failed to send email: {e}"
+
+
+def load_body(imap_pool, store, account, mailbox, email_data):
+    """Download and cache the body of an email.
+
+    Returns (body, attachments, flags), since fetching BODY[] marks the email as read on the server.
+    """
+    body, attachments = imap_pool.run(
+        lambda imap_server: fetch_email_body(imap_server, email_data["uid"]),
+        mailbox
+    )
+    store.save_body(account, mailbox, email_data["uidvalidity"], email_data["uid"], body, attachments)
+    return body, attachments, _cache_seen(store, account, mailbox, email_data)
+
+
+def mark_seen(imap_pool, store, account, mailbox, email_data):
+    """Mark an email whose body was already cached as read; returns its flags.
+
+    Bodies prefetched for search are fetched with BODY.PEEK, so opening one
+    later sets \\Seen with an explicit STORE.
+    """
+    if "\\Seen" in email_data["flags"].split():
+        return email_data["flags"]
+    imap_pool.run(
+        lambda imap_server: imap_server.uid("STORE", str(email_data["uid"]), "+FLAGS", "(\\Seen)"),
+        mailbox
+    )
+    return _cache_seen(store, account, mailbox, email_data)
+
+
+def _cache_seen(store, account, mailbox, email_data):
+    flags = email_data["flags"]
+    if "\\Seen" not in flags.split():
+        flags = f"{flags} \\Seen".strip()
+        store.update_flags(account, mailbox, email_data["uidvalidity"], {email_data["uid"]: flags})
+    return flags
+
+
+class MailClient:
+    """Everything one logged-in account can do, without any GUI.
+
+    Owns the account's IMAP pool, mail cache, scheduled sender and folder sync
+    engine, and is safe to call from many threads at once; the desktop app and
+    the HTTP API (mail_api) both sit on top of it.
+    """
+
+    def __init__(self, emailid, passkey, imap_pool=None, mail_store=None):
+        self.emailid = emailid
+        self.passkey = passkey
+        self._owns_pool = imap_pool is None
+        self._owns_store = mail_store is None
+        self.imap_pool = imap_pool or IMAPPool(emailid, passkey)
+        self.mail_store = mail_store or MailStore(config.MAIL_CACHE_PATH)
+        self.scheduled_sender = ScheduledSender(emailid, passkey, imap_pool=self.imap_pool)
+        self.sync_engine = SyncEngine(self.mail_store)
+        self.sync_engine.add_account(emailid, pool=self.imap_pool, folders=config.SYNC_FOLDERS)
+        self.sync_engine.add_configured_accounts()
+        self.sender = SendEmail(emailid, passkey)
+
+    def sync(self, mailbox="INBOX", limit=None):
+        """Sync new mail of one folder into the cache; returns how many new emails arrived."""
+        _, added = sync_folder(self.imap_pool, self.mail_store, self.emailid, mailbox, limit)
+        return added
+
+    def index_bodies(self, mailbox="INBOX"):
+        """Fetch bodies of recent unopened emails so search can find them; returns how many."""
+        uidvalidity, _ = self.mail_store.get_mailbox(self.emailid, mailbox)
+        if uidvalidity is None or not config.SEARCH_PREFETCH_BODIES:
+            return 0
+        return self.imap_pool.run(
+            lambda imap_server: index_bodies(imap_server, self.mail_store, self.emailid, mailbox, uidvalidity),
+            mailbox
+        )
+
+    def messages(self, mailbox="INBOX", before_uid=None, limit=None, query=""):
+        """Cached headers of a folder, newest first, optionally matching a search query."""
+        limit = limit or config.INBOX_PAGE_SIZE
+        uidvalidity, _ = self.mail_store.get_mailbox(self.emailid, mailbox)
+        if uidvalidity is None:
+            return []
+        if query:
+            rows = self.mail_store.search(self.emailid, mailbox, uidvalidity, query, before_uid, limit)
+        else:
+            rows = self.mail_store.page(self.emailid, mailbox, uidvalidity, before_uid, limit)
+        return [{"uid": r["uid"], "subject": r["subject"], "sender": r["sender"],
+                 "date": r["date"], "flags": r["flags"]} for r in rows]
+
+    def message(self, mailbox, uid):
+        """One email with its body, downloading the body the first time; None if not cached."""
+        uidvalidity, _ = self.mail_store.get_mailbox(self.emailid, mailbox)
+        email_data = self.mail_store.get_message(self.emailid, mailbox, uidvalidity, uid)
+        if email_data is None:
+            return None
+        if email_data["body"] is None:
+            email_data["body"], email_data["attachments"], email_data["flags"] = load_body(
+                self.imap_pool, self.mail_store, self.emailid, mailbox, email_data
+            )
+        else:
+            email_data["flags"] = mark_seen(self.imap_pool, self.mail_store, self.emailid, mailbox, email_data)
+        return email_data
+
+    def send(self, recipient, subject, body):
+        """Send an email now; returns (ok, message)."""
+        return self.sender.send_email(recipient, subject, body)
+
+    def schedule(self, recipient, subject, body, send_at):
+        """Schedule an email for a datetime; returns its id."""
+        return self.scheduled_sender.schedule(recipient, subject, body, send_at)
+
+    def scheduled(self):
+        return self.scheduled_sender.pending()
+
+    def cancel_scheduled(self, email_id):
+        return self.scheduled_sender.cancel(email_id)
+
+    def generate(self, sender_name, receiver_name, description, force=False, cancelled=None, on_wait=None):
+        """Draft an email with Gemini; returns (subject, body), or None if it gave no text."""
+        prompt = build_prompt(sender_name, receiver_name, description)
+        content = generate_text(prompt, force=force, cancelled=cancelled, on_wait=on_wait)
+        if content is None:
+            return None
+        return extract_subject_and_body(content)
+
+    def close(self):
+        self.scheduled_sender.stop()
+        self.sync_engine.close()
+        aio_mail.close_sessions(self.emailid)
+        if self._owns_pool:
+            self.imap_pool.close()
+        if self._owns_store:
+            self.mail_store.close()
@@ -0,0 +1,228 @@
+import binascii
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+
+import config
+
+# Header blocks larger than this are cut off; real ones are a few KB
+MAX_HEADER_BYTES = 64 * 1024
+# A line this long without a newline can't be a boundary, so skipped parts are dropped in pieces
+MAX_LINE_BYTES = 64 * 1024
+
+
+def parse_headers(raw_headers):
+    """Decode subject, sender and date from raw header bytes."""
+    return header_summary(BytesHeaderParser().parsebytes(raw_headers))
+
+
+def header_summary(headers):
+    """Subject, sender and date from an already parsed header block."""
+    # Decode the subject
+    subject, encoding = decode_header(headers.get("Subject", "No Subject"))[0]
+    if isinstance(subject, bytes):
+        subject = subject.decode(encoding or "utf-8", errors="ignore")
+
+    return {
+        "subject": subject,
+        "sender": headers.get("From", "Unknown Sender"),
+        "date": headers.get("Date", "")
+    }
+
+
+class TransferDecoder:
+    """Undoes a Content-Transfer-Encoding on data that arrives in arbitrary chunks.
+
+    Incomplete base64 quads and quoted-printable lines are held back until the
+    rest arrives; `pending` is that held-back input, so a download can be
+    resumed by passing it back in.
+    """
+
+    def __init__(self, encoding, pending=b""):
+        self.encoding = (encoding or "").strip().lower()
+        self.pending = pending
+
+    def decode(self, data):
+        if self.encoding == "base64":
+            data = self.pending + data.translate(None, b" \t\r\n")
+            usable = len(data) - len(data) % 4
+            self.pending = data[usable:]
+            try:
+                return binascii.a2b_base64(data[:usable])
+            except binascii.Error:
+                return b""
+        if self.encoding == "quoted-printable":
+            data = self.pending + data
+            # Soft line breaks and =XX escapes never span a newline
+            end = data.rfind(b"\n") + 1
+            if not end and len(data) > MAX_LINE_BYTES:
+                end = len(data) - 2
+            self.pending = data[end:]
+            return binascii.a2b_qp(data[:end])
+        return data
+
+    def flush(self):
+        """Decode whatever is still held back at the end of the data."""
+        pending, self.pending = self.pending, b""
+        if not pending:
+            return b""
+        if self.encoding == "base64":
+            try:
+                return binascii.a2b_base64(pending + b"==")
+            except binascii.Error:
+                return b""
+        if self.encoding == "quoted-printable":
+            return binascii.a2b_qp(pending)
+        return pending
+
+
+class BodyExtractor:
+    """Incremental MIME parser that keeps only the first plain-text body.
+
+    Feed raw message bytes in chunks of any size. Part headers are parsed as
+    they arrive, attachments and other parts are skipped without being stored
+    or decoded, and the text is decoded line by line up to `max_bytes`. Memory
+    stays bounded by the cap and the longest line, whatever the message size.
+    `done` turns True once the body is complete, so the caller can stop feeding.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or config.MAIL_BODY_MAX_BYTES
+        self.headers = None  # top-level headers, once parsed
+        self.done = False
+        self.truncated = False
+        self._buffer = b""
+        self._partial_line = False  # the buffer continues a line whose start was dropped
+        self._boundaries = []  # open multipart boundaries, innermost last
+        self._state = "headers"
+        self._header_lines = []
+        self._header_size = 0
+        self._top_level = True
+        self._decoder = TransferDecoder("")
+        self._charset = "utf-8"
+        self._body = bytearray()
+
+    def feed(self, data):
+        if self.done:
+            return
+        self._buffer += data
+        while not self.done:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                if len(self._buffer) > MAX_LINE_BYTES:
+                    self._process(self._buffer)
+                    self._buffer = b""
+                    self._partial_line = True
+                break
+            line, self._buffer = self._buffer[:end + 1], self._buffer[end + 1:]
+            self._process(line)
+            self._partial_line = False
+
+    def close(self):
+        """Finish parsing and return the decoded body text."""
+        if not self.done:
+            if self._buffer:
+                self._process(self._buffer)
+            self._buffer = b""
+            if self._state == "headers":
+                self._end_headers()
+            self._finish()
+        return bytes(self._body).decode(self._charset, errors="ignore")
+
+    def _process(self, line):
+        if not self._partial_line:
+            self._line(line)
+        elif self._state == "body":
+            # The rest of an overlong line can't be a boundary
+            self._decode(line)
+
+    def _line(self, line):
+        stripped = line.rstrip(b"\r\n")
+        if self._boundaries and stripped.startswith(b"--") and self._boundary_line(stripped):
+            return
+        if self._state == "headers":
+            if stripped:
+                self._header_size += len(line)
+                if self._header_size <= MAX_HEADER_BYTES:
+                    self._header_lines.append(line)
+            else:
+                self._end_headers()
+        elif self._state == "body":
+            self._decode(line)
+
+    def _boundary_line(self, stripped):
+        """Handle --boundary and --boundary-- lines; returns False for ordinary lines."""
+        # An unclosed inner multipart ends when an outer boundary turns up
+        for depth in range(len(self._boundaries) - 1, -1, -1):
+            boundary = self._boundaries[depth]
+            if stripped.rstrip() == b"--" + boundary:
+                if self._state == "body":
+                    return self._end_body()
+                del self._boundaries[depth + 1:]
+                self._start_part()
+                return True
+            if stripped.rstrip() == b"--" + boundary + b"--":
+                if self._state == "body":
+                    return self._end_body()
+                del self._boundaries[depth:]
+                self._state = "skip"
+                return True
+        return False
+
+    def _end_body(self):
+        # The line break before a boundary belongs to the boundary, not the text
+        if self._decoder.encoding != "base64" and not self.truncated:
+            if self._body.endswith(b"\r\n"):
+                del self._body[-2:]
+            elif self._body.endswith(b"\n"):
+                del self._body[-1:]
+        return self._finish()
+
+    def _start_part(self):
+        self._state = "headers"
+        self._header_lines = []
+        self._header_size = 0
+
+    def _end_headers(self):
+        headers = BytesHeaderParser().parsebytes(b"".join(self._header_lines) + b"\r\n")
+        self._header_lines = []
+        top_level, self._top_level = self._top_level, False
+        if top_level:
+            self.headers = headers
+
+        content_type = headers.get_content_type()
+        boundary = headers.get_boundary()
+        if headers.get_content_maintype() == "multipart" and boundary:
+            # Skip the preamble up to the first part
+            self._boundaries.append(boundary.encode("utf-8", errors="ignore"))
+            self._state = "skip"
+        elif top_level or (content_type == "text/plain" and headers.get("Content-Disposition") is None):
+            # A single-part message's payload is its body, whatever its type
+            self._decoder = TransferDecoder(headers.get("Content-Transfer-Encoding"))
+            self._charset = headers.get_content_charset() or "utf-8"
+            try:
+                "".encode(self._charset)
+            except LookupError:
+                self._charset = "utf-8"
+            self._state = "body"
+        else:
+            self._state = "skip"
+
+    def _decode(self, line):
+        self._append(self._decoder.decode(line))
+
+    def _append(self, data):
+        room = self.max_bytes - len(self._body)
+        if len(data) > room:
+            data = data[:room]
+            self.truncated = True
+        self._body += data
+        if self.truncated:
+            self._finish()
+
+    def _finish(self):
+        if not self.truncated:
+            self._append(self._decoder.flush())
+        self.done = True
+        self._buffer = b""
+        return True
+
@@ -0,0 +1,276 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+# Bump when the tables change; the cache is rebuilt from the server on mismatch
+SCHEMA_VERSION = 4
+
+# Field prefixes accepted in search queries, mapped to index columns
+SEARCH_FIELDS = {"from": "sender", "sender": "sender", "subject": "subject", "body": "body"}
+_SEARCH_TERM_RE = re.compile(r'(?:(\w+):)?("[^"]*"?|\S+)')
+
+
+def build_search_query(text):
+    """Turn what the user typed into an FTS5 MATCH expression, or None if there is nothing to search.
+
+    Bare words match as prefixes (`budg` finds "budget"), "quoted text" as an
+    exact phrase, and `from:`, `subject:` or `body:` limit a term to one field.
+    Every term must match.
+    """
+    terms = []
+    for field, value in _SEARCH_TERM_RE.findall(text):
+        column = SEARCH_FIELDS.get(field.lower())
+        if field and column is None:
+            # Not a known field, so the colon was part of the word
+            value = f"{field}:{value}"
+        quoted = value.startswith('"')
+        value = value.strip('"').rstrip("*")
+        if not value.strip():
+            continue
+        term = '"' + value.replace('"', '""') + '"' + ("" if quoted else "*")
+        terms.append(f"{column} : {term}" if column else term)
+    return " ".join(terms) or None
+
+
+class MailStore:
+    """SQLite cache of message headers and bodies keyed by (account, mailbox, UIDVALIDITY, UID).
+
+    Subject, sender and body are also kept in an FTS5 full-text index for search().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS mailboxes")
+                self._db.execute("DROP TABLE IF EXISTS messages")
+                self._db.execute("DROP TABLE IF EXISTS messages_fts")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS mailboxes (
+                    account TEXT NOT NULL,
+                    mailbox TEXT NOT NULL,
+                    uidvalidity INTEGER NOT NULL,
+                    highestmodseq INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (account, mailbox)
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    account TEXT NOT NULL,
+                    mailbox TEXT NOT NULL,
+                    uidvalidity INTEGER NOT NULL,
+                    uid INTEGER NOT NULL,
+                    subject TEXT,
+                    sender TEXT,
+                    date TEXT,
+                    size INTEGER,
+                    flags TEXT NOT NULL DEFAULT '',
+                    body TEXT,
+                    attachments TEXT,
+                    UNIQUE (account, mailbox, uidvalidity, uid)
+                )
+            """)
+            # Full-text index over subject, sender and body, kept in step with messages by triggers
+            self._db.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    subject, sender, body,
+                    content = 'messages', content_rowid = 'id',
+                    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+                )
+            """)
+            self._db.executescript("""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, subject, sender, body)
+                    VALUES (new.id, new.subject, new.sender, new.body);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, subject, sender, body)
+                    VALUES ('delete', old.id, old.subject, old.sender, old.body);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF subject, sender, body ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, subject, sender, body)
+                    VALUES ('delete', old.id, old.subject, old.sender, old.body);
+                    INSERT INTO messages_fts (rowid, subject, sender, body)
+                    VALUES (new.id, new.subject, new.sender, new.body);
+                END;
+            """)
+
+    def get_mailbox(self, account, mailbox):
+        """Return (UIDVALIDITY, HIGHESTMODSEQ) of a cached mailbox, or (None, 0)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uidvalidity, highestmodseq FROM mailboxes WHERE account = ? AND mailbox = ?",
+                (account, mailbox)
+            ).fetchone()
+        return (row["uidvalidity"], row["highestmodseq"]) if row else (None, 0)
+
+    def set_highestmodseq(self, account, mailbox, highestmodseq):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE mailboxes SET highestmodseq = ? WHERE account = ? AND mailbox = ?",
+                (highestmodseq, account, mailbox)
+            )
+
+    def reset_mailbox(self, account, mailbox, uidvalidity):
+        """Drop everything cached for a mailbox and start over with a new UIDVALIDITY."""
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM messages WHERE account = ? AND mailbox = ?", (account, mailbox)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO mailboxes (account, mailbox, uidvalidity) VALUES (?, ?, ?)",
+                (account, mailbox, uidvalidity)
+            )
+
+    def max_uid(self, account, mailbox, uidvalidity):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(uid) AS uid FROM messages WHERE account = ? AND mailbox = ? AND uidvalidity = ?",
+                (account, mailbox, uidvalidity)
+            ).fetchone()
+        return row["uid"] or 0
+
+    def min_uid(self, account, mailbox, uidvalidity):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(uid) AS uid FROM messages WHERE account = ? AND mailbox = ? AND uidvalidity = ?",
+                (account, mailbox, uidvalidity)
+            ).fetchone()
+        return row["uid"] or 0
+
+    def cached_flags(self, account, mailbox, uidvalidity):
+        """Return {uid: flags} for every cached message of a mailbox."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uid, flags FROM messages WHERE account = ? AND mailbox = ? AND uidvalidity = ?",
+                (account, mailbox, uidvalidity)
+            ).fetchall()
+        return {row["uid"]: row["flags"] for row in rows}
+
+    def save_headers(self, account, mailbox, uidvalidity, emails_data):
+        """Insert or update header rows; bodies that are already cached are kept."""
+        with self._lock, self._db:
+            self._db.executemany("""
+                INSERT INTO messages (account, mailbox, uidvalidity, uid, subject, sender, date, size, flags)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (account, mailbox, uidvalidity, uid) DO UPDATE SET
+                    subject = excluded.subject, sender = excluded.sender,
+                    date = excluded.date, size = excluded.size, flags = excluded.flags
+            """, [
+                (account, mailbox, uidvalidity, e["uid"], e["subject"], e["sender"], e["date"], e["size"], e["flags"])
+                for e in emails_data
+            ])
+
+    def update_flags(self, account, mailbox, uidvalidity, flags_by_uid):
+        """Overwrite the flags of cached messages from a {uid: flags} mapping."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE messages SET flags = ? WHERE account = ? AND mailbox = ? AND uidvalidity = ? AND uid = ?",
+                [(flags, account, mailbox, uidvalidity, uid) for uid, flags in flags_by_uid.items()]
+            )
+
+    def delete_uid_ranges(self, account, mailbox, uidvalidity, ranges):
+        """Drop cached messages whose UID falls in any of the (first, last) ranges."""
+        with self._lock, self._db:
+            cursor = self._db.executemany(
+                "DELETE FROM messages WHERE account = ? AND mailbox = ? AND uidvalidity = ? AND uid BETWEEN ? AND ?",
+                [(account, mailbox, uidvalidity, first, last) for first, last in ranges]
+            )
+        return cursor.rowcount
+
+    def save_body(self, account, mailbox, uidvalidity, uid, body, attachments=None):
+        """Cache a downloaded body along with the attachment list from its BODYSTRUCTURE."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE messages SET body = ?, attachments = ? "
+                "WHERE account = ? AND mailbox = ? AND uidvalidity = ? AND uid = ?",
+                (body, json.dumps(attachments or []), account, mailbox, uidvalidity, uid)
+            )
+
+    def latest(self, account, mailbox, limit):
+        """Return the newest cached emails of the current UIDVALIDITY, newest first."""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT m.uidvalidity, m.uid, m.subject, m.sender, m.date, m.size, m.flags, m.body,
+                    m.attachments
+                FROM messages m JOIN mailboxes b
+                    ON b.account = m.account AND b.mailbox = m.mailbox AND b.uidvalidity = m.uidvalidity
+                WHERE m.account = ? AND m.mailbox = ?
+                ORDER BY m.uid DESC LIMIT ?
+            """, (account, mailbox, limit)).fetchall()
+        emails_data = [dict(row) for row in rows]
+        for email_data in emails_data:
+            email_data["attachments"] = json.loads(email_data["attachments"] or "[]")
+        return emails_data
+
+    def page(self, account, mailbox, uidvalidity, before_uid=None, limit=100):
+        """Header rows older than `before_uid` (all if None), newest first, for paging through a mailbox.
+
+        Bodies are left out so a page stays small however long the emails are.
+        """
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT uid, subject, sender, date, size, flags FROM messages
+                WHERE account = ? AND mailbox = ? AND uidvalidity = ? AND uid < ?
+                ORDER BY uid DESC LIMIT ?
+            """, (account, mailbox, uidvalidity, before_uid or 2 ** 63 - 1, limit)).fetchall()
+        return rows
+
+    def search(self, account, mailbox, uidvalidity, text, before_uid=None, limit=100):
+        """Header rows of cached emails matching a search (see build_search_query), newest first.
+
+        CROSS JOIN keeps SQLite from scanning the mailbox and running MATCH per
+        row; the index is read first and only its hits are looked up.
+        """
+        query = build_search_query(text)
+        if query is None:
+            return []
+        with self._lock:
+            try:
+                return self._db.execute("""
+                    SELECT m.uid, m.subject, m.sender, m.date, m.size, m.flags
+                    FROM messages_fts f CROSS JOIN messages m ON m.id = f.rowid
+                    WHERE messages_fts MATCH ?
+                        AND m.account = ? AND m.mailbox = ? AND m.uidvalidity = ? AND m.uid < ?
+                    ORDER BY m.uid DESC LIMIT ?
+                """, (query, account, mailbox, uidvalidity, before_uid or 2 ** 63 - 1, limit)).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ Search failed for {query!r}: {e}")
+                return []
+
+    def missing_bodies(self, account, mailbox, uidvalidity, limit):
+        """UIDs of the newest cached emails whose body hasn't been downloaded yet."""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT uid FROM messages
+                WHERE account = ? AND mailbox = ? AND uidvalidity = ? AND body IS NULL
+                ORDER BY uid DESC LIMIT ?
+            """, (account, mailbox, uidvalidity, limit)).fetchall()
+        return [row["uid"] for row in rows]
+
+    def get_message(self, account, mailbox, uidvalidity, uid):
+        """Return one cached email with its body and attachments, or None."""
+        with self._lock:
+            row = self._db.execute("""
+                SELECT uidvalidity, uid, subject, sender, date, size, flags, body, attachments FROM messages
+                WHERE account = ? AND mailbox = ? AND uidvalidity = ? AND uid = ?
+            """, (account, mailbox, uidvalidity, uid)).fetchone()
+        if row is None:
+            return None
+        email_data = dict(row)
+        email_data["attachments"] = json.loads(email_data["attachments"] or "[]")
+        return email_data
+
+    def close(self):
+        with self._lock:
+            self._db.close()
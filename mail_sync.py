@@ -0,0 +1,267 @@
+import imaplib
+
+import config
+import metrics
+from imap_fetch import fetch_messages, parse_message_set, section
+from mail_attachments import fetch_part_text, fetch_structure, is_attachment, text_part
+from mail_parse import BodyExtractor, parse_headers
+
+# Headers shown in the inbox list; PEEK leaves the \Seen flag untouched
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)]"
+HEADER_ITEMS = f"(UID FLAGS RFC822.SIZE {HEADER_FIELDS})"
+FLAG_ITEMS = "(UID FLAGS)"
+
+# Upper bound on UIDs per FETCH when catching up on a lot of new mail
+SYNC_BATCH_SIZE = 500
+
+
+def select_mailbox(imap_server, mailbox):
+    """SELECT a mailbox and return (message count, UIDVALIDITY, HIGHESTMODSEQ).
+
+    HIGHESTMODSEQ is 0 when the server doesn't support CONDSTORE. If the pool
+    has just selected the mailbox for this call, its responses are used
+    instead of a second SELECT.
+    """
+    if getattr(imap_server, "fresh_select", None) == mailbox:
+        imap_server.fresh_select = None
+        _, data = imap_server.response("EXISTS")
+    else:
+        status, data = imap_server.select(mailbox)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Failed to select {mailbox}: {data}")
+        imap_server.selected_mailbox = mailbox
+
+    exists = int(data[-1] or 0) if data else 0
+    _, uidvalidity = imap_server.response("UIDVALIDITY")
+    uidvalidity = int(uidvalidity[0]) if uidvalidity and uidvalidity[0] else 0
+    _, highestmodseq = imap_server.response("HIGHESTMODSEQ")
+    highestmodseq = int(highestmodseq[0]) if highestmodseq and highestmodseq[0] else 0
+    return exists, uidvalidity, highestmodseq
+
+
+def format_flags(flags):
+    return " ".join(str(flag) for flag in flags or [])
+
+
+@metrics.timed("mail_parse_seconds", stage="headers")
+def headers_from_records(records):
+    """Turn header FETCH records into email dicts without bodies."""
+    emails_data = []
+    for record in records:
+        raw_headers = section(record, "HEADER.FIELDS")
+        if raw_headers is None or record.get("UID") is None:
+            print(f"❌ Error fetching mail ID {record['SEQ']}")
+            continue
+
+        email_data = parse_headers(raw_headers)
+        email_data.update({
+            "uid": record["UID"],
+            "size": record.get("RFC822.SIZE", 0),
+            "flags": format_flags(record.get("FLAGS")),
+            "body": None,
+            "attachments": []
+        })
+        emails_data.append(email_data)
+    return emails_data
+
+
+def sync_changes(imap_server, store, account, mailbox, uidvalidity, modseq, highestmodseq):
+    """Bring flags of cached messages up to date and drop expunged ones.
+
+    With CONDSTORE only messages changed since `modseq` are fetched, and with
+    QRESYNC the server also reports expunged UIDs as VANISHED. Without them
+    the cached UID range is diffed against the server. Returns
+    (number of flag changes, number of removed messages).
+    """
+    first_uid = store.min_uid(account, mailbox, uidvalidity)
+    last_uid = store.max_uid(account, mailbox, uidvalidity)
+    qresync = getattr(imap_server, "qresync", False)
+    # Without QRESYNC an expunge need not bump HIGHESTMODSEQ, so only trust it with QRESYNC
+    if not last_uid or (qresync and modseq and modseq == highestmodseq):
+        return 0, 0
+    message_set = f"{first_uid}:{last_uid}"
+
+    if modseq and highestmodseq:
+        modifiers = f"(CHANGEDSINCE {modseq}{' VANISHED' if qresync else ''})"
+        records = fetch_messages(imap_server, message_set, FLAG_ITEMS, uid=True, modifiers=modifiers)
+    else:
+        records = fetch_messages(imap_server, message_set, FLAG_ITEMS, uid=True)
+
+    cached = store.cached_flags(account, mailbox, uidvalidity)
+    changed = {}
+    for record in records:
+        uid, flags = record.get("UID"), format_flags(record.get("FLAGS"))
+        if uid in cached and cached[uid] != flags:
+            changed[uid] = flags
+    store.update_flags(account, mailbox, uidvalidity, changed)
+
+    if qresync and modseq and highestmodseq:
+        _, vanished = imap_server.response("VANISHED")
+        ranges = []
+        for line in vanished or []:
+            if line:
+                ranges += parse_message_set(line.decode().replace("(EARLIER)", "").strip())
+    else:
+        with metrics.span("imap_command_seconds", command="search", backend="sync"):
+            status, data = imap_server.uid("SEARCH", "UID", message_set)
+        if status != "OK":
+            raise imaplib.IMAP4.error("SEARCH failed")
+        present = {int(uid) for uid in data[0].split()}
+        ranges = [(uid, uid) for uid in cached if uid not in present]
+    removed = store.delete_uid_ranges(account, mailbox, uidvalidity, ranges) if ranges else 0
+
+    return len(changed), removed
+
+
+def sync_mailbox(imap_server, store, account, mailbox="INBOX", limit=15):
+    """Download headers of mail newer than the local cache and apply flag/expunge changes.
+
+    On a cold cache only the newest `limit` messages are fetched; after that
+    each sync asks for UIDs above the highest cached one. A UIDVALIDITY change
+    invalidates the cache. Returns (UIDVALIDITY, number of new messages).
+    """
+    exists, uidvalidity, highestmodseq = select_mailbox(imap_server, mailbox)
+
+    cached_uidvalidity, modseq = store.get_mailbox(account, mailbox)
+    if cached_uidvalidity != uidvalidity:
+        print(f"♻️ UIDVALIDITY of {mailbox} is {uidvalidity}, starting a fresh cache")
+        store.reset_mailbox(account, mailbox, uidvalidity)
+        modseq = 0
+
+    max_uid = store.max_uid(account, mailbox, uidvalidity)
+    added = changed = removed = 0
+
+    if max_uid:
+        changed, removed = sync_changes(
+            imap_server, store, account, mailbox, uidvalidity, modseq, highestmodseq
+        )
+
+        with metrics.span("imap_command_seconds", command="search", backend="sync"):
+            status, data = imap_server.uid("SEARCH", "UID", f"{max_uid + 1}:*")
+        if status != "OK":
+            raise imaplib.IMAP4.error("SEARCH failed")
+        # n:* always matches the last message, even when its UID is below n
+        new_uids = [int(uid) for uid in data[0].split() if int(uid) > max_uid]
+
+        for start in range(0, len(new_uids), SYNC_BATCH_SIZE):
+            records = fetch_messages(imap_server, new_uids[start:start + SYNC_BATCH_SIZE], HEADER_ITEMS, uid=True)
+            emails_data = headers_from_records(records)
+            store.save_headers(account, mailbox, uidvalidity, emails_data)
+            added += len(emails_data)
+
+    elif exists:
+        first = max(1, exists - limit + 1)
+        records = fetch_messages(imap_server, range(first, exists + 1), HEADER_ITEMS)
+        emails_data = headers_from_records(records)
+        store.save_headers(account, mailbox, uidvalidity, emails_data)
+        added = len(emails_data)
+
+    store.set_highestmodseq(account, mailbox, highestmodseq)
+    print(f"✅ Synced {mailbox}: {added} new, {changed} changed, {removed} removed")
+    return uidvalidity, added
+
+
+def fetch_older_headers(imap_server, store, account, mailbox, uidvalidity, limit=100):
+    """Download headers of up to `limit` messages older than anything cached; returns how many.
+
+    The sequence number of the oldest cached UID tells which messages come
+    before it, so the page is one FETCH by sequence range instead of a UID
+    SEARCH over the whole mailbox. Returns 0 once the start of the mailbox is reached.
+    """
+    oldest = store.min_uid(account, mailbox, uidvalidity)
+    if oldest <= 1:
+        return 0
+    found = fetch_messages(imap_server, [oldest], "(UID)", uid=True)
+    if found:
+        last = found[0]["SEQ"] - 1
+        if last < 1:
+            return 0
+        records = fetch_messages(imap_server, range(max(1, last - limit + 1), last + 1), HEADER_ITEMS)
+    else:
+        # The oldest cached message is gone; look up what is left below it
+        with metrics.span("imap_command_seconds", command="search", backend="sync"):
+            status, data = imap_server.uid("SEARCH", "UID", f"1:{oldest - 1}")
+        if status != "OK":
+            raise imaplib.IMAP4.error("SEARCH failed")
+        uids = [int(uid) for uid in data[0].split() if int(uid) < oldest]
+        records = fetch_messages(imap_server, uids[-limit:], HEADER_ITEMS, uid=True)
+    emails_data = headers_from_records(records)
+    store.save_headers(account, mailbox, uidvalidity, emails_data)
+    print(f"✅ Fetched {len(emails_data)} older headers of {mailbox}")
+    return len(emails_data)
+
+
+def fetch_email_body(imap_server, uid, chunk_size=None, max_bytes=None, peek=False):
+    """Download the text of a single message by UID; returns (body, attachments).
+
+    BODYSTRUCTURE tells which part holds the text, so only that part is
+    fetched and attachments are just listed (see mail_attachments). Servers
+    without BODYSTRUCTURE fall back to reading BODY[] in chunks until a
+    BodyExtractor has the text. With `peek` the message is left unread.
+    """
+    parts = fetch_structure(imap_server, uid)
+    if parts is None:
+        return _extract_body(imap_server, uid, chunk_size, max_bytes, peek), []
+
+    attachments = [part for part in parts if is_attachment(part)]
+    part = text_part(parts)
+    if part is None and len(parts) == 1 and not attachments:
+        # A single-part message is shown whatever its type, as before
+        part = parts[0]
+    if part is None:
+        body, truncated = "", False
+        if not peek:
+            # Nothing was fetched with BODY[], so mark the email read explicitly
+            imap_server.uid("STORE", str(uid), "+FLAGS", "(\\Seen)")
+    else:
+        body, truncated = fetch_part_text(imap_server, uid, part, chunk_size, max_bytes, peek)
+    if truncated:
+        body += "\n\n(Message truncated.)"
+    print(f"✅ Read {len(body)} characters of UID {uid}, {len(attachments)} attachment(s) left on the server")
+    return body, attachments
+
+
+def _extract_body(imap_server, uid, chunk_size=None, max_bytes=None, peek=False):
+    """Fetch BODY[]<offset.length> chunks until the extractor has the plain-text body."""
+    chunk_size = chunk_size or config.MAIL_FETCH_CHUNK_BYTES
+    item = "BODY.PEEK" if peek else "BODY"
+    extractor = BodyExtractor(max_bytes)
+    offset = 0
+    while not extractor.done:
+        records = fetch_messages(imap_server, [uid], f"({item}[]<{offset}.{chunk_size}>)", uid=True)
+        chunk = section(records[0], "") if records else None
+        if chunk is None:
+            if offset == 0:
+                raise imaplib.IMAP4.error(f"Message UID {uid} not found")
+            break
+        extractor.feed(chunk)
+        offset += len(chunk)
+        if len(chunk) < chunk_size:
+            break
+    body = extractor.close()
+    if extractor.truncated:
+        body += "\n\n(Message truncated.)"
+    print(f"✅ Read {offset} bytes of UID {uid} for {len(body)} characters of text")
+    return body
+
+
+def index_bodies(imap_server, store, account, mailbox, uidvalidity, limit=None, uids=None, cancelled=None):
+    """Download bodies of the newest emails not opened yet so search covers them too.
+
+    `uids` picks the emails, by default the newest `limit` without a body. A
+    set `cancelled` event stops after the current email. Fetched with
+    BODY.PEEK, so nothing is marked as read. Returns how many were added.
+    """
+    if uids is None:
+        limit = config.SEARCH_PREFETCH_BODIES if limit is None else limit
+        uids = store.missing_bodies(account, mailbox, uidvalidity, limit) if limit else []
+    indexed = 0
+    for uid in uids:
+        if cancelled is not None and cancelled.is_set():
+            break
+        body, attachments = fetch_email_body(imap_server, uid, peek=True)
+        store.save_body(account, mailbox, uidvalidity, uid, body, attachments)
+        indexed += 1
+    if indexed:
+        print(f"🔎 Indexed the bodies of {indexed} emails in {mailbox}")
+    return indexed
@@ -1,29 +1,44 @@
 import sys
 import os
+import time
+# Installed first so the imports below show up in the startup timing report
+import startup_timing
+startup_timing.install()
 from dotenv import load_dotenv
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit,
     QTextEdit, QPushButton, QVBoxLayout, QHBoxLayout,
-    QComboBox, QMessageBox, QStackedWidget, QListWidget, QListWidgetItem, QFormLayout
+    QComboBox, QMessageBox, QStackedWidget, QListWidget, QListWidgetItem, QFormLayout,
+    QFileDialog, QDoubleSpinBox, QSpinBox, QCheckBox, QProgressBar, QListView, QTableWidget,
+    QTableWidgetItem, QHeaderView
 )
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt, QDate, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QDateEdit
-import smtplib
 import imaplib
-import email
-from email.message import EmailMessage
-import google.generativeai as genai
+import config
+import metrics
+from imap_idle import IMAPIdleListener
+from imap_pool import IMAPPool, IMAPLoginError
+from mail_store import MailStore
+from mail_sync import index_bodies
+from mail_attachments import AttachmentDownload
+from inbox_model import InboxModel
+from mail_client import MailClient, SendEmail, authenticate, load_body, mark_seen
+from sync_engine import mailbox_label, sync_folder
+import smtp_pool
+import aio_mail
+from bulk_send import BulkSender, load_recipients
+from email_scheduler import ScheduledSender
+from schedule_store import SENDING
+from ai_generate import build_prompt, extract_subject_and_body, generate_drafts, generate_text, stream_text
+from ai_quota import get_rate_limiter
+from workers import run_job
 
 # Load environment variables from .env file
 load_dotenv()
-from apscheduler.schedulers.background import BackgroundScheduler
 import datetime
-from email.header import decode_header
 from PyQt5.QtGui import QFont, QIcon
 
-# Configure API with environment variable
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
 class LoginWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -120,28 +135,19 @@ class LoginWindow(QWidget):
         else:
             self.password_input.setEchoMode(QLineEdit.Password)
 
-    @staticmethod
-    def authenticate_gmail(emailid, passkey):
-        """Authenticate with Gmail using SMTP."""
-        try:
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(emailid, passkey)
-            print("Log In Successful.")
-            return True
-        except smtplib.SMTPAuthenticationError:
-            print("Authentication failed.")
-            return False
-        except Exception as e:
-            print("Error:", e)
-            return False
-
     def check_login(self):
-        """Check credentials and open home screen."""
+        """Check credentials in the background and open home screen."""
         emailid = self.emailid_input.text()
         passkey = self.password_input.text()
 
-        if self.authenticate_gmail(emailid, passkey):
+        self.loginButton.setEnabled(False)
+        self.loginButton.setText("Logging in...")
+        run_job(authenticate, emailid, passkey, on_result=self.login_finished)
+
+    def login_finished(self, success):
+        self.loginButton.setEnabled(True)
+        self.loginButton.setText("Log In")
+        if success:
             self.open_home_screen()
         else:
             QMessageBox.warning(self, "Error", "Incorrect username or password")
@@ -149,41 +155,12 @@ class LoginWindow(QWidget):
     def open_home_screen(self):
         """Open home screen."""
         QMessageBox.information(self, "Success", "Login Successful!")
+        startup_timing.mark("Login accepted")
         self.home_screen = HomeScreen(self.emailid_input.text(), self.password_input.text())
         self.hide()
         self.home_screen.show()
-
-class SendEmail(QWidget):
-    def __init__(self, emailid, password, smtp_server='smtp.gmail.com', smtp_port=587):
-        super().__init__()
-        self.emailid = emailid
-        self.password = password
-        self.smtp_server = smtp_server
-        self.smtp_port = smtp_port
-
-    def send_email(self, recipient_email, subject, body):
-        msg = EmailMessage()
-        msg['From'] = self.emailid
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        msg.set_content(body)
-
-        try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as smtp:
-                smtp.starttls()
-                smtp.login(self.emailid, self.password)
-                smtp.send_message(msg)
-
-            print("✅ Email sent successfully!")
-            return True, "Email sent successfully!"
-
-        except smtplib.SMTPAuthenticationError:
-            print("❌ Authentication failed! Invalid email or password.")
-            return False, "Authentication failed! Check your email or password."
-
-        except Exception as e:
-            print(f"❌ Failed to send email: {e}")
-            return False, f"Failed to send email: {e}"
+        # Runs once the event loop has painted the home screen
+        QTimer.singleShot(0, lambda: (startup_timing.mark("Home screen shown"), startup_timing.print_report()))
 
 class SideBar(QWidget):
     def __init__(self, parent=None):
@@ -212,28 +189,64 @@ class SideBar(QWidget):
         self.compose_button = QPushButton("Compose")
         self.ai_button = QPushButton("Email Generation")
         self.schedule_button = QPushButton("Schedule Email")
+        self.bulk_button = QPushButton("Bulk Send")
+        self.batch_button = QPushButton("Batch Drafts")
+        self.diagnostics_button = QPushButton("Diagnostics")
         self.logout_button = QPushButton("Logout")
 
         self.frame.addWidget(self.inbox_button)
         self.frame.addWidget(self.compose_button)
         self.frame.addWidget(self.ai_button)
         self.frame.addWidget(self.schedule_button)
+        self.frame.addWidget(self.bulk_button)
+        self.frame.addWidget(self.batch_button)
+        self.frame.addWidget(self.diagnostics_button)
         self.frame.addWidget(self.logout_button)
         self.frame.addStretch()
 
         self.setLayout(self.frame)
 
-    def connect_buttons(self, inbox_function, compose_func, ai_func, schedule_func, logout_func):
+    def connect_buttons(self, inbox_function, compose_func, ai_func, schedule_func, bulk_func, batch_func,
+                        diagnostics_func, logout_func):
         self.inbox_button.clicked.connect(inbox_function)
         self.compose_button.clicked.connect(compose_func)
         self.ai_button.clicked.connect(ai_func)
         self.schedule_button.clicked.connect(schedule_func)
+        self.bulk_button.clicked.connect(bulk_func)
+        self.batch_button.clicked.connect(batch_func)
+        self.diagnostics_button.clicked.connect(diagnostics_func)
         self.logout_button.clicked.connect(logout_func)
 
+def format_size(size):
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
 class InboxPage(QWidget):
-    def __init__(self, emailid, passkey):
+    # Emitted from the IDLE listener thread when the server reports a change
+    mailbox_changed = pyqtSignal()
+
+    def __init__(self, emailid, passkey, imap_pool=None, mail_store=None,
+                 fetch_count=config.INBOX_FETCH_COUNT, mailbox="INBOX"):
         super().__init__()
         self.emailid, self.passkey = emailid, passkey
+        self.imap_pool = imap_pool or IMAPPool(emailid, passkey)
+        self.mail_store = mail_store or MailStore(config.MAIL_CACHE_PATH)
+        self.fetch_count = fetch_count
+        self.mailbox = mailbox
+        self.idle_mailbox = mailbox
+        self.uidvalidity = None
+        self.model = InboxModel(self.mail_store, self.imap_pool, emailid, mailbox, parent=self)
+        self.refresh_job = None
+        self.refresh_again = False
+        self.body_job = None
+        self.download_job = None
+        self.index_job = None
+        self.index_again = False
+        self.shown_email = None
         main_layout = QVBoxLayout()
         self.stack = QStackedWidget()
 
@@ -246,8 +259,17 @@ class InboxPage(QWidget):
         main_layout.addWidget(self.stack)
         self.setLayout(main_layout)
 
+        # Show whatever is cached right away, then catch up with the server
+        self.model.reload()
         self.latest_emails()
 
+        # New mail is pushed by the server instead of waiting for Refresh
+        self.mailbox_changed.connect(self.refresh_from_idle)
+        self.idle_listener = None
+        if config.IMAP_IDLE_ENABLED:
+            self.idle_listener = IMAPIdleListener(self.imap_pool, self.mailbox_changed.emit, self.idle_mailbox)
+            self.idle_listener.start()
+
     def create_inbox_page(self):
         self.inbox_page = QWidget()
         layout = QVBoxLayout()
@@ -255,15 +277,36 @@ class InboxPage(QWidget):
         title = QLabel("Inbox")
         title.setAlignment(Qt.AlignCenter)
 
-        self.email_list = QListWidget()
-        self.email_list.itemClicked.connect(self.show_email_details)
+        # Folders and labels filled in by the background folder sync
+        self.folder_combo = QComboBox()
+        self.folder_combo.addItem(mailbox_label(self.mailbox), self.mailbox)
+        self.folder_combo.activated.connect(self.change_folder)
+
+        # Searches the local index as you type: words match as prefixes, "quotes" as phrases,
+        # and from:, subject: or body: limit a word to one field
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search mail (e.g. from:alice subject:invoice)")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(lambda: self.model.set_query(self.search_input.text()))
+        self.search_input.textChanged.connect(self.search_timer.start)
+
+        # Only the visible rows are drawn; more are loaded as the list is scrolled
+        self.email_list = QListView()
+        self.email_list.setUniformItemSizes(True)
+        self.email_list.setModel(self.model)
+        self.email_list.clicked.connect(self.show_email_details)
 
         # Refresh Button
         self.refresh_button = QPushButton("Refresh")
-        self.refresh_button.clicked.connect(self.latest_emails)
+        self.refresh_button.clicked.connect(lambda: self.latest_emails())
 
         layout.addWidget(title)
+        layout.addWidget(self.folder_combo)
         layout.addWidget(self.refresh_button)  # Add the refresh button to the layout
+        layout.addWidget(self.search_input)
         layout.addWidget(self.email_list)
         self.inbox_page.setLayout(layout)
 
@@ -276,111 +319,285 @@ class InboxPage(QWidget):
         self.body_text = QTextEdit()
         self.body_text.setReadOnly(True)
 
+        # Attachments are listed from BODYSTRUCTURE and only downloaded when double-clicked
+        self.attachments_label = QLabel("Attachments (double-click to save):")
+        self.attachments_list = QListWidget()
+        self.attachments_list.setMaximumHeight(90)
+        self.attachments_list.itemDoubleClicked.connect(self.save_attachment)
+        self.download_progress = QProgressBar()
+        self.download_progress.hide()
+        self.cancel_download_button = QPushButton("Cancel Download")
+        self.cancel_download_button.clicked.connect(self.cancel_download)
+        self.cancel_download_button.hide()
+
         self.back_button = QPushButton("Back to Inbox")
         self.back_button.clicked.connect(self.go_back_to_inbox)
 
         layout.addWidget(self.sender_label)
         layout.addWidget(self.subject_label)
         layout.addWidget(self.body_text)
+        layout.addWidget(self.attachments_label)
+        layout.addWidget(self.attachments_list)
+        layout.addWidget(self.download_progress)
+        layout.addWidget(self.cancel_download_button)
         layout.addWidget(self.back_button)
 
         self.email_view_page.setLayout(layout)
 
-    def latest_emails(self):
-        self.email_list.clear()  # Clear the current list before refreshing
-        try:
-            print("Connecting to Gmail IMAP...")
-            imap_server = imaplib.IMAP4_SSL("imap.gmail.com")
-
-            # IMAP Login
-            try:
-                imap_server.login(self.emailid, self.passkey)
-                print("✅ IMAP Login Successful")
-            except imaplib.IMAP4.error as e:
-                QMessageBox.critical(self, "IMAP Error", f"Login failed: {e}")
-                print(f"❌ IMAP Login failed: {e}")
-                return
-
-            imap_server.select("INBOX")
-            status, email_numbers = imap_server.search(None, "ALL")
-
-            if status != "OK":
-                QMessageBox.warning(self, "Search Error", "Failed to search inbox.")
-                print("❌ Search Error")
-                return
-
-            mail_ids = email_numbers[0].split()
-            if not mail_ids:
-                QMessageBox.information(self, "No Emails", "Inbox is empty.")
-                print("📭 No emails found.")
-                return
-
-            # Fetch only the latest 15 emails
-            latest_mails = mail_ids[-15:]
-            self.emails_data = []
-
-            for num in reversed(latest_mails):
-                res, msg_data = imap_server.fetch(num, "(RFC822)")
-
-                if res != "OK":
-                    print(f"❌ Error fetching mail ID {num}")
-                    continue
-
-                raw_email = msg_data[0][1]
-                email_message = email.message_from_bytes(raw_email)
-
-                # Decode the subject
-                subject, encoding = decode_header(email_message.get("Subject", "No Subject"))[0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode(encoding or "utf-8")
-
-                sender = email_message.get("From", "Unknown Sender")
-
-                body = ""
-                try:
-                    if email_message.is_multipart():
-                        for part in email_message.walk():
-                            content_type = part.get_content_type()
-                            if content_type == "text/plain" and part.get("Content-Disposition") is None:
-                                charset = part.get_content_charset() or "utf-8"
-                                body = part.get_payload(decode=True).decode(charset, errors="ignore")
-                                break
-                    else:
-                        charset = email_message.get_content_charset() or "utf-8"
-                        body = email_message.get_payload(decode=True).decode(charset, errors="ignore")
-                except Exception as decode_err:
-                    print(f"⚠️ Decode Error: {decode_err}")
-                    body = "(Unable to decode email body.)"
-
-                # Create a QListWidgetItem with only the subject
-                item = QListWidgetItem(subject)
-                # Set the sender as a tooltip or additional data
-                item.setToolTip(f"From: {sender}")
-                self.email_list.addItem(item)
-
-                self.emails_data.append({
-                    "subject": subject,
-                    "sender": sender,
-                    "body": body
-                })
-
-            imap_server.logout()
-            print("✅ IMAP Disconnected Successfully")
-
-        except Exception as e:
+    def latest_emails(self, quiet=False):
+        """Sync the shown folder in the background; quiet=True skips the "folder is empty" notice."""
+        # A refresh that is already running will pick up the same mail
+        if self.refresh_job is not None:
+            return
+        self.refresh_button.setEnabled(False)
+        self.refresh_button.setText("Refreshing...")
+        self.refresh_job = run_job(
+            self.fetch_latest_emails, self.mailbox,
+            on_result=lambda result: self.show_latest_emails(result, quiet),
+            on_error=self.show_refresh_error,
+            on_finished=self.refresh_finished
+        )
+
+    def refresh_from_idle(self):
+        """IDLE saw a change in the watched folder; refresh it if it is the one on screen."""
+        if self.mailbox != self.idle_mailbox:
+            # Switching back to it refreshes it anyway
+            return
+        if self.refresh_job is not None:
+            # The running refresh may have searched before the new mail arrived
+            self.refresh_again = True
+            return
+        self.latest_emails(quiet=True)
+
+    def show_latest_emails(self, result, quiet=False):
+        self.uidvalidity, added = result
+        self.show_synced_emails()
+        if not quiet and not self.model.rowCount():
+            QMessageBox.information(self, "No Emails", f"{mailbox_label(self.mailbox)} is empty.")
+            print("📭 No emails found.")
+
+    def show_refresh_error(self, e):
+        if isinstance(e, IMAPLoginError):
+            QMessageBox.critical(self, "IMAP Error", f"Login failed: {e}")
+            print(f"❌ IMAP Login failed: {e}")
+
+        elif isinstance(e, imaplib.IMAP4.abort):
+            QMessageBox.critical(self, "IMAP Error", f"Connection lost: {e}")
+            print(f"❌ IMAP connection lost: {e}")
+
+        elif isinstance(e, imaplib.IMAP4.error):
+            QMessageBox.warning(self, "Search Error", "Failed to search inbox.")
+            print(f"❌ Search Error: {e}")
+
+        else:
             QMessageBox.critical(self, "Error", f"An error occurred: {e}")
             print(f"❌ Critical error: {e}")
 
-    def show_email_details(self, item):
-        index = self.email_list.currentRow()
-        email_data = self.emails_data[index]
+    def refresh_finished(self):
+        self.refresh_job = None
+        self.refresh_button.setEnabled(True)
+        self.refresh_button.setText("Refresh")
+        if self.refresh_again:
+            self.refresh_again = False
+            self.refresh_from_idle()
+
+    def show_synced_emails(self):
+        self.model.reload()
+        self.index_new_bodies()
+
+    def set_folders(self, folders):
+        """Offer every synced folder in the folder picker, keeping the current one selected."""
+        folders = sorted(set(folders) | {self.mailbox}, key=lambda f: (f != "INBOX", mailbox_label(f).lower()))
+        self.folder_combo.clear()
+        for folder in folders:
+            self.folder_combo.addItem(mailbox_label(folder), folder)
+        self.folder_combo.setCurrentIndex(folders.index(self.mailbox))
+
+    def change_folder(self, index):
+        mailbox = self.folder_combo.itemData(index)
+        if mailbox == self.mailbox:
+            return
+        print(f"Switching to folder {mailbox_label(mailbox)}")
+        self.mailbox = mailbox
+        if self.index_job is not None:
+            # Its bodies belong to the old folder; stop it after the current one
+            self.index_job.cancel()
+        self.model.set_mailbox(mailbox)
+        self.stack.setCurrentIndex(0)
+        self.latest_emails()
+
+    def index_new_bodies(self):
+        """Fetch bodies of recent unopened emails in the background so search can find them."""
+        if not config.SEARCH_PREFETCH_BODIES or self.model.uidvalidity is None:
+            return
+        if self.index_job is not None:
+            # Index again once the running job is done, e.g. for the folder switched to
+            self.index_again = True
+            return
+        # Taken now, since the folder may change while the job waits or runs
+        mailbox, uidvalidity = self.mailbox, self.model.uidvalidity
+        uids = self.mail_store.missing_bodies(self.emailid, mailbox, uidvalidity, config.SEARCH_PREFETCH_BODIES)
+        if not uids:
+            return
+        self.index_job = run_job(
+            self.index_folder_bodies, mailbox, uidvalidity, uids, pass_job=True,
+            on_result=lambda indexed: self.model.reload() if indexed and self.model.query else None,
+            on_error=lambda e: print(f"⚠️ Failed to index email bodies: {e}"),
+            on_finished=self.index_finished,
+            long_running=True
+        )
+
+    def index_folder_bodies(self, mailbox, uidvalidity, uids, job):
+        """Runs on a worker thread; returns how many bodies were indexed."""
+        return self.imap_pool.run(
+            lambda imap_server: index_bodies(
+                imap_server, self.mail_store, self.emailid, mailbox, uidvalidity,
+                uids=uids, cancelled=job.cancel_event
+            ),
+            mailbox
+        )
+
+    def index_finished(self):
+        self.index_job = None
+        if self.index_again:
+            self.index_again = False
+            self.index_new_bodies()
+
+    def stop_background_work(self):
+        """Stop the IDLE listener and drop results of anything still in flight."""
+        if self.idle_listener is not None:
+            self.idle_listener.stop()
+        self.index_again = False
+        for job in (self.refresh_job, self.body_job, self.download_job, self.index_job):
+            if job is not None:
+                job.cancel()
+        self.model.cancel()
+
+    def fetch_latest_emails(self, mailbox):
+        """Runs on a worker thread; syncs new mail of a folder into the cache and returns (UIDVALIDITY, new emails)."""
+        uidvalidity, added = sync_folder(self.imap_pool, self.mail_store, self.emailid, mailbox, self.fetch_count)
+
+        stats = self.imap_pool.stats
+        print(f"✅ Fetched {added} new email headers "
+              f"(IMAP connects: {stats['connects']}, reuses: {stats['reuses']}, "
+              f"saved ~{stats['saved_ms']:.0f} ms of connect/login)")
+        return uidvalidity, added
+
+    def load_email_body(self, email_data):
+        """Runs on a worker thread; returns (body, attachments, flags)."""
+        return load_body(self.imap_pool, self.mail_store, self.emailid, self.mailbox, email_data)
+
+    def show_email_details(self, index):
+        row = self.model.row(index.row())
+        email_data = self.mail_store.get_message(self.emailid, self.mailbox, self.model.uidvalidity, row.uid)
+        if email_data is None:
+            # Dropped from the cache by a sync since the list was drawn
+            return
+
+        # The body is only downloaded the first time the email is opened
+        if email_data["body"] is None:
+            if self.body_job is not None:
+                self.body_job.cancel()
+            self.body_job = run_job(
+                self.load_email_body, email_data,
+                on_result=lambda result: self.show_loaded_email(email_data, *result),
+                on_error=self.show_body_error
+            )
+            return
+
+        if "\\Seen" not in email_data["flags"].split():
+            # Prefetched for search with BODY.PEEK, so it still has to be marked read
+            run_job(
+                mark_seen, self.imap_pool, self.mail_store, self.emailid, self.mailbox, email_data,
+                on_result=lambda flags: self.show_email_seen(email_data, flags),
+                on_error=lambda e: print(f"⚠️ Failed to mark the email as read: {e}")
+            )
+        self.display_email(email_data)
+
+    def show_email_seen(self, email_data, flags):
+        email_data["flags"] = flags
+        self.model.set_flags(email_data["uid"], flags)
+
+    def show_loaded_email(self, email_data, body, attachments, flags):
+        self.body_job = None
+        email_data["body"], email_data["attachments"], email_data["flags"] = body, attachments, flags
+
+        self.model.set_flags(email_data["uid"], flags)
+
+        self.display_email(email_data)
+
+    def show_body_error(self, e):
+        self.body_job = None
+        QMessageBox.warning(self, "Error", f"Failed to load email: {e}")
+        print(f"❌ Failed to load email body: {e}")
 
+    def display_email(self, email_data):
         self.sender_label.setText(f"From: {email_data['sender']}")
         self.subject_label.setText(f"Subject: {email_data['subject']}")
         self.body_text.setPlainText(email_data['body'])
 
+        self.shown_email = email_data
+        self.attachments_list.clear()
+        for attachment in email_data.get("attachments", []):
+            self.attachments_list.addItem(
+                f"📎 {attachment['name'] or 'unnamed'} ({attachment['type']}, {format_size(attachment['size'])})"
+            )
+        has_attachments = self.attachments_list.count() > 0
+        self.attachments_label.setVisible(has_attachments)
+        self.attachments_list.setVisible(has_attachments)
+
         self.stack.setCurrentIndex(1)
 
+    def save_attachment(self, item):
+        if self.download_job is not None:
+            QMessageBox.information(self, "Download", "Another attachment is still downloading.")
+            return
+        email_data = self.shown_email
+        attachment = email_data["attachments"][self.attachments_list.row(item)]
+        path, _ = QFileDialog.getSaveFileName(self, "Save Attachment", attachment["name"] or "attachment")
+        if not path:
+            return
+
+        download = AttachmentDownload(
+            self.imap_pool, self.mailbox, email_data["uidvalidity"], email_data["uid"], attachment, path
+        )
+        self.download_progress.setRange(0, 100)
+        self.download_progress.setValue(0)
+        self.download_progress.show()
+        self.cancel_download_button.show()
+        self.download_job = run_job(
+            self.run_download, download, pass_job=True,
+            on_progress=self.show_download_progress,
+            on_result=self.show_downloaded,
+            on_error=lambda e: QMessageBox.warning(self, "Error", f"Download failed (it will resume next time): {e}"),
+            on_finished=self.download_finished,
+            long_running=True
+        )
+
+    @staticmethod
+    def run_download(download, job):
+        """Runs on a worker thread; reports (done, total) encoded bytes as progress."""
+        return download.run(on_progress=lambda done, total: job.report((done, total)),
+                            cancelled=job.cancel_event)
+
+    def show_download_progress(self, progress):
+        done, total = progress
+        self.download_progress.setValue(int(done * 100 / total) if total else 0)
+        self.download_progress.setFormat(f"%p% of {format_size(total)}")
+
+    def show_downloaded(self, path):
+        if path:
+            QMessageBox.information(self, "Download", f"Saved to {path}")
+
+    def cancel_download(self):
+        if self.download_job is not None:
+            self.download_job.cancel()
+
+    def download_finished(self):
+        self.download_job = None
+        self.download_progress.hide()
+        self.cancel_download_button.hide()
+
     def go_back_to_inbox(self):
         self.stack.setCurrentIndex(0)
 
@@ -409,13 +626,13 @@ class ComposeEmail(QWidget):
         body_label.setStyleSheet(label_style)
         self.body_input = QTextEdit()
 
-        send_button = QPushButton("Send Email")
-        send_button.clicked.connect(self.send_email)
+        self.send_button = QPushButton("Send Email")
+        self.send_button.clicked.connect(self.send_email)
 
         layout.addRow(recipient_label, self.recipient_input)
         layout.addRow(subject_label, self.subject_input)
         layout.addRow(body_label, self.body_input)
-        layout.addRow(send_button)
+        layout.addRow(self.send_button)
 
         self.setLayout(layout)
 
@@ -429,7 +646,12 @@ class ComposeEmail(QWidget):
             return
 
         sender = SendEmail(self.user_email, self.user_password)
-        success, message = sender.send_email(recipient, subject, body)
+        self.send_button.setEnabled(False)
+        run_job(sender.send_email, recipient, subject, body, on_result=self.send_finished)
+
+    def send_finished(self, result):
+        success, message = result
+        self.send_button.setEnabled(True)
 
         if success:
             QMessageBox.information(self, "Success", message)
@@ -443,6 +665,19 @@ class ComposeEmail(QWidget):
         self.body_input.clear()
 
 
+def quota_wait_status(job):
+    """on_wait callback for Gemini calls that shows the expected queueing time as the job's status."""
+    def on_wait(seconds):
+        job.set_status(f"⏳ Waiting ~{seconds:.0f} s for Gemini quota..." if seconds > 0 else "")
+    return on_wait
+
+
+def usage_today_text():
+    usage = get_rate_limiter().usage.today()
+    return (f"Gemini today: {usage['requests']} requests, "
+            f"{usage['prompt_tokens'] + usage['output_tokens']} tokens")
+
+
 class AIGeneratePage(QWidget):
     def __init__(self, user_email=None, user_password=None):
         super().__init__()
@@ -492,6 +727,24 @@ class AIGeneratePage(QWidget):
         self.generate_button.clicked.connect(self.generate_email)
         layout.addWidget(self.generate_button)
 
+        # Stops a queued or streaming generation; what has arrived so far stays in the editor
+        self.cancel_generate_button = QPushButton("Cancel Generation")
+        self.cancel_generate_button.setEnabled(False)
+        self.cancel_generate_button.clicked.connect(self.cancel_generation)
+        layout.addWidget(self.cancel_generate_button)
+
+        # Identical requests are answered from the cache unless this is ticked
+        self.force_checkbox = QCheckBox("Force regenerate (skip cache)")
+        layout.addWidget(self.force_checkbox)
+
+        # Expected wait when Gemini's per-minute quota is used up, then today's usage
+        self.quota_label = QLabel(usage_today_text())
+        layout.addWidget(self.quota_label)
+
+        self.generation_job = None
+        self.streamed_text = ""
+        self.streamed_tail = None
+
         # --- Editable Compose Section ---
         self.to_email_input = QLineEdit()
         self.to_email_input.setPlaceholderText("Recipient Email Address (Required)")
@@ -547,54 +800,96 @@ class AIGeneratePage(QWidget):
             QMessageBox.warning(self, "Missing Fields", "Please fill in Receiver Name, Sender Name, and Description.")
             return
 
-        # Compose the prompt (we ask Gemini to start with a subject on first line)
-        prompt = (
-            f"Write a professional email from {sender_name} to {receiver_name}. "
-            f"The email should be about: {description}. "
-            "Start the email with a subject line on the first line, then a blank line, followed by the body."
-        )
+        prompt = build_prompt(sender_name, receiver_name, description)
+
+        self.generate_button.setEnabled(False)
+        self.generate_button.setText("Generating...")
+        self.cancel_generate_button.setEnabled(True)
+        self.streamed_text = ""
+        self.streamed_tail = None
+        if config.AI_STREAMING:
+            self.subject_input.clear()
+            self.body_input.clear()
+            self.generation_job = run_job(
+                self.stream_generation, prompt, self.force_checkbox.isChecked(), pass_job=True,
+                on_progress=self.show_partial_email,
+                on_status=self.quota_label.setText,
+                on_result=self.show_generated_email,
+                on_error=self.show_generation_error,
+                on_finished=self.generation_finished
+            )
+        else:
+            self.generation_job = run_job(
+                self.run_generation, prompt, self.force_checkbox.isChecked(), pass_job=True,
+                on_status=self.quota_label.setText,
+                on_result=self.show_generated_email,
+                on_error=self.show_generation_error,
+                on_finished=self.generation_finished
+            )
 
-        try:
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
+    @staticmethod
+    def run_generation(prompt, force, job):
+        return generate_text(prompt, force=force, cancelled=job.cancel_event, on_wait=quota_wait_status(job))
 
-            if response and hasattr(response, 'text'):
-                full_content = response.text.strip()
-                print("✅ AI Email Content Generated\n", full_content)
+    @staticmethod
+    def stream_generation(prompt, force, job):
+        """Runs on a worker thread; every streamed chunk is reported as progress."""
+        return stream_text(prompt, job.report, cancelled=job.cancel_event, force=force,
+                           on_wait=quota_wait_status(job))
+
+    def show_partial_email(self, chunk):
+        if self.streamed_tail is not None:
+            # The body has started, so only the new text is appended; trailing whitespace
+            # is held back since the finished body has it stripped
+            text = self.streamed_tail + chunk
+            shown = text.rstrip()
+            self.streamed_tail = text[len(shown):]
+            if shown:
+                cursor = self.body_input.textCursor()
+                cursor.movePosition(cursor.End)
+                cursor.insertText(shown)
+            return
 
-                # Extract subject (first non-empty line)
-                subject, body = self.extract_subject_and_body(full_content)
+        # Until then the text is short: the subject line and maybe blank lines
+        self.streamed_text += chunk
+        if "\n" not in self.streamed_text.lstrip():
+            return
+        subject, body = extract_subject_and_body(self.streamed_text)
+        if not self.subject_input.text():
+            self.subject_input.setText(subject)
+        if body:
+            self.body_input.setPlainText(body)
+            self.streamed_tail = self.streamed_text[len(self.streamed_text.rstrip()):]
 
-                # Populate compose fields
-                self.subject_input.setText(subject)
-                self.body_input.setPlainText(body)
+    def cancel_generation(self):
+        if self.generation_job is not None:
+            self.generation_job.cancel()
 
-            else:
-                self.body_input.setPlainText("Failed to generate email body.")
-                print("❌ No response from AI model")
+    def show_generated_email(self, full_content):
+        if full_content:
+            print("✅ AI Email Content Generated\n", full_content)
 
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"Failed to generate: {e}")
-            print(f"❌ Error: {e}")
+            # Extract subject (first non-empty line)
+            subject, body = extract_subject_and_body(full_content)
 
-    def extract_subject_and_body(self, content):
-        lines = content.split("\n")
-        subject = ""
-        body_lines = []
+            # Populate compose fields
+            self.subject_input.setText(subject)
+            self.body_input.setPlainText(body)
 
-        for i, line in enumerate(lines):
-            if line.strip() and not subject:  # First non-empty line is subject
-                subject = line.strip()
-                continue
-            if subject and line.strip():  # Everything else is body
-                body_lines = lines[i:]
-                break
+        else:
+            self.body_input.setPlainText("Failed to generate email body.")
+            print("❌ No response from AI model")
 
-        body = "\n".join(body_lines).strip()
-        if not subject:
-            subject = "Generated Email"
+    def show_generation_error(self, e):
+        QMessageBox.warning(self, "Error", f"Failed to generate: {e}")
+        print(f"❌ Error: {e}")
 
-        return subject[9:], body
+    def generation_finished(self):
+        self.generation_job = None
+        self.quota_label.setText(usage_today_text())
+        self.cancel_generate_button.setEnabled(False)
+        self.generate_button.setEnabled(True)
+        self.generate_button.setText("Generate Email Content")
 
     def send_email(self):
         to_email = self.to_email_input.text().strip()
@@ -607,7 +902,12 @@ class AIGeneratePage(QWidget):
 
         # Send email using SendEmail class
         sender = SendEmail(self.user_email, self.user_password)
-        success, message = sender.send_email(to_email, subject, body)
+        self.send_button.setEnabled(False)
+        run_job(sender.send_email, to_email, subject, body, on_result=self.send_finished)
+
+    def send_finished(self, result):
+        success, message = result
+        self.send_button.setEnabled(True)
 
         if success:
             QMessageBox.information(self, "Success", message)
@@ -623,14 +923,300 @@ class AIGeneratePage(QWidget):
         self.subject_input.clear()
         self.body_input.clear()
 
-class SchedulePage(QWidget):
+class BulkSendPage(QWidget):
+    def __init__(self, user_email, user_password):
+        super().__init__()
+        self.user_email = user_email
+        self.user_password = user_password
+        self.recipients = []
+        self.send_job = None
+
+        layout = QFormLayout()
+
+        # Recipient list
+        self.load_button = QPushButton("Load Recipients (CSV)")
+        self.load_button.clicked.connect(self.load_csv)
+        self.recipients_label = QLabel("No recipients loaded")
+
+        # Templates; {column} is replaced with that column of each CSV row
+        self.subject_input = QLineEdit()
+        self.subject_input.setPlaceholderText("Subject, e.g. Hello {name}")
+        self.body_input = QTextEdit()
+        self.body_input.setPlaceholderText("Body, e.g. Dear {name}, ...")
+
+        self.rate_input = QDoubleSpinBox()
+        self.rate_input.setRange(0.1, 20)
+        self.rate_input.setSingleStep(0.5)
+        self.rate_input.setValue(config.BULK_RATE_PER_SECOND)
+        self.rate_input.setSuffix(" msg/s")
+
+        # Start / Cancel
+        self.send_button = QPushButton("Send to All")
+        self.send_button.clicked.connect(self.start_sending)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_sending)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.send_button)
+        button_layout.addWidget(self.cancel_button)
+
+        self.status_label = QLabel("")
+        self.results_list = QListWidget()
+
+        layout.addRow(self.load_button, self.recipients_label)
+        layout.addRow(QLabel("Subject:"), self.subject_input)
+        layout.addRow(QLabel("Body:"), self.body_input)
+        layout.addRow(QLabel("Rate:"), self.rate_input)
+        layout.addRow(button_layout)
+        layout.addRow(self.status_label)
+        layout.addRow(self.results_list)
+
+        self.setLayout(layout)
+
+    def load_csv(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Recipients", "", "CSV files (*.csv)")
+        if not path:
+            return
+        try:
+            self.recipients = load_recipients(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not read recipients: {e}")
+            return
+        self.recipients_label.setText(f"{len(self.recipients)} recipients from {os.path.basename(path)}")
+
+    def start_sending(self):
+        subject = self.subject_input.text().strip()
+        body = self.body_input.toPlainText().strip()
+
+        if not self.recipients or not subject or not body:
+            QMessageBox.warning(self, "Error", "Load recipients and fill in subject and body first!")
+            return
+
+        sender = BulkSender(
+            smtp_pool.get_pool(self.user_email, self.user_password),
+            subject, body, rate=self.rate_input.value()
+        )
+        self.results_list.clear()
+        self.send_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.status_label.setText(f"Sending 0/{len(self.recipients)}...")
+        self.send_job = run_job(
+            self.run_bulk_send, sender, list(self.recipients), pass_job=True,
+            on_progress=self.show_progress,
+            on_result=self.show_summary,
+            on_error=lambda e: QMessageBox.warning(self, "Error", f"Bulk send failed: {e}"),
+            on_finished=self.sending_finished,
+            long_running=True
+        )
+
+    @staticmethod
+    def run_bulk_send(sender, rows, job):
+        """Runs on a worker thread; each finished recipient is reported as progress."""
+        return sender.run(rows, on_result=lambda result, summary: job.report((result, summary)),
+                          cancelled=job.cancel_event)
+
+    def show_progress(self, progress):
+        result, summary = progress
+        icon = "✅" if result["ok"] else "❌"
+        self.results_list.addItem(f"{icon} {result['email']}: {result['message']}")
+        self.status_label.setText(
+            f"Sent {summary['sent']}, failed {summary['failed']} of {summary['total']} "
+            f"({summary['per_second']:.2f} msg/s)"
+        )
+
+    def show_summary(self, summary):
+        self.status_label.setText(
+            f"Done: {summary['sent']} sent, {summary['failed']} failed "
+            f"in {summary['elapsed']:.1f} s ({summary['per_second']:.2f} msg/s)"
+        )
+
+    def cancel_sending(self):
+        if self.send_job is not None:
+            self.send_job.cancel()
+            self.status_label.setText("Cancelled")
+
+    def sending_finished(self):
+        self.send_job = None
+        self.send_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+class BatchDraftPage(QWidget):
     def __init__(self, user_email, user_password):
         super().__init__()
+        self.user_email = user_email
+        self.user_password = user_password
+        self.rows = []
+        self.drafts = []
+        self.draft_job = None
+        self.send_job = None
+
+        layout = QVBoxLayout()
+
+        title = QLabel("Batch AI Drafts")
+        title.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title)
+
+        # CSV with receiver, sender, description and email columns
+        load_layout = QHBoxLayout()
+        self.load_button = QPushButton("Load Rows (CSV)")
+        self.load_button.clicked.connect(self.load_csv)
+        self.rows_label = QLabel("No rows loaded")
+        load_layout.addWidget(self.load_button)
+        load_layout.addWidget(self.rows_label)
+        layout.addLayout(load_layout)
+
+        self.concurrency_input = QSpinBox()
+        self.concurrency_input.setRange(1, 16)
+        self.concurrency_input.setValue(config.AI_BATCH_CONCURRENCY)
+        self.concurrency_input.setSuffix(" at a time")
+        form = QFormLayout()
+        form.addRow("Concurrency:", self.concurrency_input)
+        layout.addLayout(form)
+
+        button_layout = QHBoxLayout()
+        self.generate_button = QPushButton("Generate Drafts")
+        self.generate_button.clicked.connect(self.generate_drafts)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        button_layout.addWidget(self.generate_button)
+        button_layout.addWidget(self.cancel_button)
+        layout.addLayout(button_layout)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        # Finished drafts appear here as they complete; select one to review it
+        self.draft_list = QListWidget()
+        self.draft_list.currentRowChanged.connect(self.show_draft)
+        layout.addWidget(self.draft_list)
+
+        self.subject_input = QLineEdit()
+        self.subject_input.setPlaceholderText("Draft Subject (Editable)")
+        self.subject_input.textEdited.connect(self.save_draft_edits)
+        self.body_input = QTextEdit()
+        self.body_input.setPlaceholderText("Draft Body (Editable)")
+        self.body_input.textChanged.connect(self.save_draft_edits)
+        layout.addWidget(self.subject_input)
+        layout.addWidget(self.body_input)
+
+        self.send_button = QPushButton("Send All Drafts")
+        self.send_button.clicked.connect(self.send_drafts)
+        layout.addWidget(self.send_button)
+
+        self.setLayout(layout)
+
+    def load_csv(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Draft Rows", "", "CSV files (*.csv)")
+        if not path:
+            return
+        try:
+            self.rows = load_recipients(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not read rows: {e}")
+            return
+        self.rows_label.setText(f"{len(self.rows)} rows from {os.path.basename(path)}")
+
+    def generate_drafts(self):
+        if not self.rows:
+            QMessageBox.warning(self, "Error", "Load a CSV with receiver, sender, description and email columns first!")
+            return
+
+        self.drafts = []
+        self.draft_list.clear()
+        self.generate_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.status_label.setText(f"Generating 0/{len(self.rows)}...")
+        self.draft_job = run_job(
+            self.run_drafts, list(self.rows), self.concurrency_input.value(), pass_job=True,
+            on_progress=self.add_draft,
+            on_status=self.status_label.setText,
+            on_error=lambda e: QMessageBox.warning(self, "Error", f"Batch generation failed: {e}"),
+            on_finished=self.generation_finished,
+            long_running=True
+        )
+
+    @staticmethod
+    def run_drafts(rows, concurrency, job):
+        """Runs on a worker thread; each finished draft is reported as progress."""
+        return generate_drafts(rows, on_draft=job.report, concurrency=concurrency, cancelled=job.cancel_event,
+                               on_wait=quota_wait_status(job))
+
+    def add_draft(self, draft):
+        self.drafts.append(draft)
+        if draft["ok"]:
+            self.draft_list.addItem(f"✅ {draft['email']}: {draft['subject']}")
+        else:
+            self.draft_list.addItem(f"❌ {draft['email']}: {draft['error']}")
+        self.status_label.setText(f"Generated {len(self.drafts)}/{len(self.rows)}")
+
+    def show_draft(self, row):
+        if not 0 <= row < len(self.drafts):
+            return
+        draft = self.drafts[row]
+        self.subject_input.setText(draft["subject"])
+        self.body_input.blockSignals(True)
+        self.body_input.setPlainText(draft["body"])
+        self.body_input.blockSignals(False)
+
+    def save_draft_edits(self):
+        row = self.draft_list.currentRow()
+        if 0 <= row < len(self.drafts):
+            self.drafts[row]["subject"] = self.subject_input.text()
+            self.drafts[row]["body"] = self.body_input.toPlainText()
+
+    def cancel_generation(self):
+        if self.draft_job is not None:
+            self.draft_job.cancel()
+            self.status_label.setText("Cancelled")
+
+    def generation_finished(self):
+        self.draft_job = None
+        self.status_label.setText(f"{len(self.drafts)} drafts. {usage_today_text()}")
+        self.generate_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def send_drafts(self):
+        ready = [draft for draft in self.drafts if draft["ok"]]
+        if not ready or self.send_job is not None:
+            return
+
+        # Each draft is already personalised, so the bulk templates just copy it over
+        sender = BulkSender(smtp_pool.get_pool(self.user_email, self.user_password), "{subject}", "{body}")
+        self.send_button.setEnabled(False)
+        self.status_label.setText(f"Sending 0/{len(ready)}...")
+        self.send_job = run_job(
+            BulkSendPage.run_bulk_send, sender, ready, pass_job=True,
+            on_progress=self.show_send_progress,
+            on_error=lambda e: QMessageBox.warning(self, "Error", f"Sending drafts failed: {e}"),
+            on_finished=self.sending_finished,
+            long_running=True
+        )
+
+    def show_send_progress(self, progress):
+        result, summary = progress
+        self.status_label.setText(
+            f"Sent {summary['sent']}, failed {summary['failed']} of {summary['total']} "
+            f"({summary['per_second']:.2f} msg/s)"
+        )
+
+    def sending_finished(self):
+        self.send_job = None
+        self.send_button.setEnabled(True)
+
+    def cancel_background_work(self):
+        for job in (self.draft_job, self.send_job):
+            if job is not None:
+                job.cancel()
+
+class SchedulePage(QWidget):
+    def __init__(self, user_email, user_password, scheduled_sender=None):
+        super().__init__()
 
         self.user_email = user_email
         self.user_password = user_password
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.start()
+        # Scheduled emails are kept on disk and sent by the process-wide scheduler
+        self.scheduled_sender = scheduled_sender or ScheduledSender(user_email, user_password)
 
         self.setWindowTitle("Schedule Email")
         self.resize(400, 400)
@@ -683,7 +1269,48 @@ class SchedulePage(QWidget):
         layout.addRow(QLabel("Select Time:"), time_layout)
         layout.addRow(self.schedule_button)
 
+        # Emails still waiting to be sent
+        self.pending_list = QListWidget()
+        self.cancel_button = QPushButton("Cancel Selected")
+        self.cancel_button.clicked.connect(self.cancel_selected)
+        layout.addRow(QLabel("Pending:"), self.pending_list)
+        layout.addRow(self.cancel_button)
+
+        # Emails that could not be sent, with the reason
+        self.failed_list = QListWidget()
+        self.failed_list.setMaximumHeight(120)
+        layout.addRow(QLabel("Failed:"), self.failed_list)
+
         self.setLayout(layout)
+        self.refresh_pending()
+
+    def refresh_pending(self):
+        self.pending_list.clear()
+        for email_data in self.scheduled_sender.pending():
+            item = QListWidgetItem(f"{email_data['send_at']:%Y-%m-%d %H:%M}  {email_data['recipient']}: "
+                                   f"{email_data['subject']}")
+            item.setData(Qt.UserRole, email_data["id"])
+            if email_data["status"] == SENDING:
+                item.setText(item.text() + "  (sending, or checking whether it was sent)")
+            self.pending_list.addItem(item)
+
+        self.failed_list.clear()
+        for email_data in self.scheduled_sender.failed():
+            self.failed_list.addItem(f"{email_data['send_at']:%Y-%m-%d %H:%M}  {email_data['recipient']}: "
+                                     f"{email_data['subject']} — {email_data['error']}")
+
+    def cancel_selected(self):
+        item = self.pending_list.currentItem()
+        if item is None:
+            return
+        if not self.scheduled_sender.cancel(item.data(Qt.UserRole)):
+            QMessageBox.warning(self, "Error", "This email is already being sent.")
+        self.refresh_pending()
+
+    def showEvent(self, event):
+        # Emails may have been sent or resumed since the page was last shown
+        self.refresh_pending()
+        super().showEvent(event)
 
     def schedule_email(self):
         recipient = self.recipient_input.text().strip()
@@ -717,18 +1344,105 @@ class SchedulePage(QWidget):
             return
 
         # Schedule Email
-        self.scheduler.add_job(
-            self.send_email, "date", run_date=send_time,
-            args=[recipient, subject, body]
-        )
+        self.scheduled_sender.schedule(recipient, subject, body, send_time)
+        self.refresh_pending()
 
         QMessageBox.information(self, "Success", f"Email scheduled for {send_time}")
 
-    def send_email(self, recipient, subject, body):
-        """Use SendEmail class to send the email."""
-        email_sender = SendEmail(self.user_email, self.user_password)
-        success, message = email_sender.send_email(recipient, subject, body)
-        print(f"📨 Scheduled Email Status: {message}")
+class StallMonitor:
+    """Times a repeating GUI-thread timer; however late it fires is time the UI was frozen."""
+
+    def __init__(self, interval_ms=None):
+        self.interval = (interval_ms or config.UI_HEARTBEAT_MS) / 1000
+        self.last = time.perf_counter()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.beat)
+        self.timer.start(int(self.interval * 1000))
+
+    def beat(self):
+        now = time.perf_counter()
+        metrics.observe("ui_stall_seconds", max(0.0, now - self.last - self.interval))
+        self.last = now
+
+
+class DiagnosticsPage(QWidget):
+    """Live view of metrics.registry: latency percentiles and counters of the hot paths."""
+
+    def __init__(self):
+        super().__init__()
+        layout = QVBoxLayout()
+
+        title = QLabel("Diagnostics")
+        title.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title)
+
+        self.status_label = QLabel("")
+        if not metrics.enabled:
+            self.status_label.setText("Metrics are off; start the app with METRICS_ENABLED=1 to collect them.")
+        layout.addWidget(self.status_label)
+
+        self.timing_table = QTableWidget(0, 6)
+        self.timing_table.setHorizontalHeaderLabels(["Metric", "Labels", "Count", "p50 (ms)", "p95 (ms)", "Max (ms)"])
+        self.timing_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.timing_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.timing_table)
+
+        self.counter_table = QTableWidget(0, 3)
+        self.counter_table.setHorizontalHeaderLabels(["Counter", "Labels", "Value"])
+        self.counter_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.counter_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.counter_table)
+
+        button_layout = QHBoxLayout()
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.reset)
+        button_layout.addWidget(self.reset_button)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+        # Only refreshed while the page is on screen
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_timer.start(1000)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+
+    @staticmethod
+    def fill(table, rows):
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                table.setItem(i, j, QTableWidgetItem(value))
+
+    def refresh(self):
+        histograms, counters = metrics.registry.snapshot()
+
+        def ms(seconds):
+            return "" if seconds is None else f"{seconds * 1000:.1f}"
+
+        def label_text(labels):
+            return ", ".join(f"{k}={v}" for k, v in labels.items())
+
+        self.fill(self.timing_table, [
+            (h["name"], label_text(h["labels"]), str(h["count"]), ms(h["p50"]), ms(h["p95"]), ms(h["max"]))
+            for h in histograms
+        ])
+        self.fill(self.counter_table, [
+            (c["name"], label_text(c["labels"]), f"{c['value']:,}") for c in counters
+        ])
+
+    def reset(self):
+        metrics.registry.reset()
+        self.refresh()
+
 
 class HomeScreen(QWidget):
     def __init__(self, emailid, passkey):
@@ -743,19 +1457,31 @@ class HomeScreen(QWidget):
             self.compose_mail,
             self.show_ai_generation,
             self.show_scheduling,
+            self.show_bulk_send,
+            self.show_batch_drafts,
+            self.show_diagnostics,
             self.logout
         )
 
-        self.stack = QStackedWidget()
-        self.inbox_page = InboxPage(emailid, passkey)
-        self.compose_page = ComposeEmail(emailid, passkey)
-        self.ai_page = AIGeneratePage(emailid, passkey)
-        self.schedule_page = SchedulePage(emailid, passkey)
+        # One long-lived IMAP pool, mail cache and scheduler shared by everything on the home screen
+        self.client = MailClient(emailid, passkey)
+        self.imap_pool = self.client.imap_pool
+        self.mail_store = self.client.mail_store
+        self.scheduled_sender = self.client.scheduled_sender
+        self.sync_engine = self.client.sync_engine
 
+        self.emailid, self.passkey = emailid, passkey
+        self.stack = QStackedWidget()
+        self.inbox_page = InboxPage(emailid, passkey, self.imap_pool, self.mail_store)
         self.stack.addWidget(self.inbox_page)
-        self.stack.addWidget(self.compose_page)
-        self.stack.addWidget(self.ai_page)
-        self.stack.addWidget(self.schedule_page)
+
+        # The other pages are built the first time their sidebar button is clicked
+        self.compose_page = None
+        self.ai_page = None
+        self.schedule_page = None
+        self.bulk_page = None
+        self.batch_page = None
+        self.diagnostics_page = None
 
         main_layout = QHBoxLayout()
         main_layout.addWidget(self.sidebar)
@@ -763,33 +1489,97 @@ class HomeScreen(QWidget):
 
         self.setLayout(main_layout)
 
+        # Pick up emails scheduled in an earlier session, including ones missed while closed
+        run_job(
+            self.scheduled_sender.resume,
+            on_error=lambda e: print(f"❌ Failed to resume scheduled emails: {e}"),
+            long_running=True
+        )
+
+        # Sync the configured folders (SYNC_FOLDERS) of this account, and of any extra accounts, into the cache
+        self.sync_job = run_job(
+            self.run_folder_sync, self.sync_engine, pass_job=True,
+            on_progress=self.folder_synced,
+            on_result=self.folders_synced,
+            on_error=lambda e: print(f"❌ Folder sync failed: {e}"),
+            long_running=True
+        )
+
+    @staticmethod
+    def run_folder_sync(sync_engine, job):
+        return sync_engine.sync(on_result=job.report, cancelled=job.cancel_event)
+
+    def folder_synced(self, result):
+        """Refresh the inbox list as soon as the folder it shows has synced."""
+        if result["account"] == self.emailid and result["mailbox"] == self.inbox_page.mailbox and result["added"]:
+            self.inbox_page.show_synced_emails()
+
+    def folders_synced(self, results):
+        folders = [result["mailbox"] for result in results if result["account"] == self.emailid and result["ok"]]
+        self.inbox_page.set_folders(folders)
+
+    def show_page(self, name, build):
+        """Show a stacked page, building it with build() the first time it is needed."""
+        page = getattr(self, name)
+        if page is None:
+            start = time.perf_counter()
+            page = build()
+            setattr(self, name, page)
+            self.stack.addWidget(page)
+            print(f"⏱️ Built {type(page).__name__} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        self.stack.setCurrentWidget(page)
+
     def show_inbox_page(self):
         print("Switching to Inbox Page")
         self.stack.setCurrentWidget(self.inbox_page)
 
     def compose_mail(self):
         print("Switching to Compose Mail")
-        self.stack.setCurrentWidget(self.compose_page)
+        self.show_page("compose_page", lambda: ComposeEmail(self.emailid, self.passkey))
 
     def show_ai_generation(self):
         print("Switching to AI Generation Page")
-        self.stack.setCurrentWidget(self.ai_page)
+        self.show_page("ai_page", lambda: AIGeneratePage(self.emailid, self.passkey))
 
     def show_scheduling(self):
         print("Switching to Scheduling Page")
-        self.stack.setCurrentWidget(self.schedule_page)
+        self.show_page("schedule_page", lambda: SchedulePage(self.emailid, self.passkey, self.scheduled_sender))
+
+    def show_bulk_send(self):
+        print("Switching to Bulk Send Page")
+        self.show_page("bulk_page", lambda: BulkSendPage(self.emailid, self.passkey))
+
+    def show_batch_drafts(self):
+        print("Switching to Batch Drafts Page")
+        self.show_page("batch_page", lambda: BatchDraftPage(self.emailid, self.passkey))
+
+    def show_diagnostics(self):
+        print("Switching to Diagnostics Page")
+        self.show_page("diagnostics_page", DiagnosticsPage)
 
     def logout(self):
         print("Logging out")
         confirm = QMessageBox.question(self, "Logout", "Are you sure you want to logout?",
                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if confirm == QMessageBox.Yes:
+            self.inbox_page.stop_background_work()
+            self.sync_job.cancel()
+            if self.bulk_page is not None:
+                self.bulk_page.cancel_sending()
+            if self.batch_page is not None:
+                self.batch_page.cancel_background_work()
+            self.client.close()
+            smtp_pool.close_all()
+            aio_mail.close_sessions()
             self.close()
             self.login_screen = LoginWindow()
             self.login_screen.show()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    metrics.start()
+    stall_monitor = StallMonitor() if metrics.enabled else None
     login = LoginWindow()
     login.show()
+    QTimer.singleShot(0, lambda: startup_timing.mark("Login window shown"))
     sys.exit(app.exec_())
@@ -0,0 +1,254 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# Upper bounds in seconds; mail servers and Gemini can take tens of seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Read once: when off, every call below returns straight away
+enabled = config.METRICS_ENABLED
+_noop = nullcontext()
+
+
+class Histogram:
+    """Counts of observations per bucket, as in a Prometheus histogram."""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket, like histogram_quantile()."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """Histograms and counters keyed by name and labels; safe to use from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> number
+
+    def observe(self, name, value, labels=()):
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount, labels=()):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def snapshot(self):
+        """Plain-data copy for the diagnostics panel: (histogram rows, counter rows), sorted by name."""
+        with self._lock:
+            histograms = [{
+                "name": name, "labels": dict(labels), "count": h.count, "sum": h.sum, "max": h.max,
+                "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99),
+            } for (name, labels), h in sorted(self.histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+        return histograms, counters
+
+    def prometheus(self):
+        """Everything in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, h.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{name}_sum{label_text(labels)} {h.sum}")
+                lines.append(f"{name}_count{label_text(labels)} {h.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+_events = deque(maxlen=100_000)  # JSON-lines records waiting to be written
+_flush_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def observe(name, seconds, **labels):
+    """Record a duration (or any other sized value) in the histogram `name`."""
+    if not enabled:
+        return
+    key = _labels(labels)
+    registry.observe(name, seconds, key)
+    if config.METRICS_JSONL_PATH:
+        _events.append({"ts": time.time(), "name": name, "labels": labels, "value": seconds})
+
+
+def count(name, amount=1, **labels):
+    """Add to the counter `name`, e.g. bytes transferred or cache hits."""
+    if not enabled or not amount:
+        return
+    registry.inc(name, amount, _labels(labels))
+    if config.METRICS_JSONL_PATH:
+        _events.append({"ts": time.time(), "name": name, "labels": labels, "inc": amount})
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels
+        if exc_type is not None:
+            labels = dict(labels, error=exc_type.__name__)
+        observe(self.name, time.perf_counter() - self.start, **labels)
+        return False
+
+
+def span(name, **labels):
+    """Time a block into the histogram `name`; failures get an extra `error` label.
+
+        with metrics.span("imap_command_seconds", command="search"):
+            ...
+    """
+    if not enabled:
+        return _noop
+    return _Span(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator form of span(); the function is left untouched when metrics are off."""
+    def decorate(fn):
+        if not enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _write_events():
+    """Append the queued records to the JSON-lines file now and then."""
+    path = config.METRICS_JSONL_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    while True:
+        time.sleep(config.METRICS_FLUSH_SECONDS)
+        flush(path)
+
+
+def flush(path=None):
+    """Write out the JSON-lines records gathered so far."""
+    path = path or config.METRICS_JSONL_PATH
+    if not path or not _events:
+        return
+    with _flush_lock:
+        lines = []
+        while _events:
+            lines.append(json.dumps(_events.popleft(), default=str))
+        if not lines:
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def start():
+    """Start the configured exporters (Prometheus endpoint, JSON-lines file) once per process."""
+    global _started
+    if not enabled:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    if config.METRICS_PORT:
+        server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), _PrometheusHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"📈 Metrics at http://{config.METRICS_HOST}:{server.server_address[1]}/metrics")
+    if config.METRICS_JSONL_PATH:
+        threading.Thread(target=_write_events, name="metrics-jsonl", daemon=True).start()
+        atexit.register(flush)
+        print(f"📈 Writing metrics to {config.METRICS_JSONL_PATH}")
@@ -0,0 +1,131 @@
+import datetime
+import os
+import sqlite3
+import threading
+from email.utils import make_msgid
+
+# Life of a scheduled email: pending -> sending -> sent, or failed/cancelled
+PENDING, SENDING, SENT, FAILED, CANCELLED = "pending", "sending", "sent", "failed", "cancelled"
+
+
+class ScheduleStore:
+    """SQLite store of scheduled emails that survives restarts.
+
+    Every email gets its Message-ID when it is scheduled, so a send that was
+    interrupted can later be looked up on the server instead of repeated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # Sent-markers must hit the disk before we report success
+            self._db.execute("PRAGMA synchronous=FULL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS scheduled_emails (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    account TEXT NOT NULL,
+                    recipient TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    send_at TEXT NOT NULL,
+                    message_id TEXT NOT NULL UNIQUE,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    sent_at TEXT
+                )
+            """)
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS scheduled_by_status ON scheduled_emails (account, status, send_at)"
+            )
+
+    def add(self, account, recipient, subject, body, send_at):
+        """Store a new pending email and return its id."""
+        domain = account.rpartition("@")[2] or None
+        with self._lock, self._db:
+            cursor = self._db.execute("""
+                INSERT INTO scheduled_emails (account, recipient, subject, body, send_at, message_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (account, recipient, subject, body, send_at.isoformat(), make_msgid(domain=domain)))
+        return cursor.lastrowid
+
+    def get(self, email_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM scheduled_emails WHERE id = ?", (email_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def unfinished(self, account):
+        """Return pending emails and emails whose send was interrupted, oldest first."""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT * FROM scheduled_emails
+                WHERE account = ? AND status IN (?, ?)
+                ORDER BY send_at
+            """, (account, PENDING, SENDING)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def failed(self, account, limit=50):
+        """Return emails that could not be sent, most recently due first."""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT * FROM scheduled_emails
+                WHERE account = ? AND status = ?
+                ORDER BY send_at DESC
+                LIMIT ?
+            """, (account, FAILED, limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, email_id):
+        """Move a pending email to sending; returns False if someone else already did."""
+        return self._transition(email_id, PENDING, SENDING)
+
+    def mark_sent(self, email_id):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE scheduled_emails SET status = ?, error = NULL, sent_at = ? WHERE id = ?",
+                (SENT, datetime.datetime.now().isoformat(), email_id)
+            )
+
+    def mark_failed(self, email_id, error):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE scheduled_emails SET status = ?, error = ? WHERE id = ?", (FAILED, error, email_id)
+            )
+
+    def release(self, email_id):
+        """Put an interrupted send back to pending so it is tried again."""
+        return self._transition(email_id, SENDING, PENDING)
+
+    def cancel(self, email_id):
+        return self._transition(email_id, PENDING, CANCELLED)
+
+    def reschedule(self, email_id, send_at):
+        """Change the send time of a pending email; returns False if it isn't pending."""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE scheduled_emails SET send_at = ? WHERE id = ? AND status = ?",
+                (send_at.isoformat(), email_id, PENDING)
+            )
+        return cursor.rowcount == 1
+
+    def _transition(self, email_id, old, new):
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE scheduled_emails SET status = ? WHERE id = ? AND status = ?", (new, email_id, old)
+            )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _to_dict(row):
+        email_data = dict(row)
+        email_data["send_at"] = datetime.datetime.fromisoformat(email_data["send_at"])
+        return email_data
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,329 @@
+import copy
+import re
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from email.generator import BytesGenerator
+from email.utils import getaddresses
+from io import BytesIO
+
+import config
+import metrics
+
+
+def _connection_dropped(e):
+    """True for network failures; SMTPException is an OSError too but means the server answered."""
+    return isinstance(e, smtplib.SMTPServerDisconnected) or (
+        isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+    )
+
+
+def flatten_message(msg, utf8=False):
+    """Serialise a message with CRLF line endings and SMTP dot-stuffing.
+
+    utf8=True leaves non-ASCII headers unencoded, for SMTPUTF8 sends.
+    """
+    buffer = BytesIO()
+    BytesGenerator(buffer, policy=msg.policy.clone(linesep="\r\n", utf8=utf8)).flatten(msg)
+    data = re.sub(rb"(?m)^\.", b"..", buffer.getvalue())
+    if not data.endswith(b"\r\n"):
+        data += b"\r\n"
+    return data + b".\r\n"
+
+
+def message_envelope(msg):
+    """Return (sender address, recipient addresses) of a message, Bcc included."""
+    from_addr = getaddresses([msg["From"]])[0][1]
+    to_addrs = [addr for _, addr in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", [])
+                                                  + msg.get_all("Bcc", [])) if addr]
+    return from_addr, to_addrs
+
+
+def prepare_message(msg, from_addr, to_addrs, extensions):
+    """Flatten a message and pick its MAIL FROM options, as smtplib.SMTP.send_message does.
+
+    `extensions` are the lower-cased EHLO keywords. Non-ASCII addresses need
+    SMTPUTF8; 8-bit content is announced with BODY=8BITMIME. Returns
+    (data, mail options, whether SMTPUTF8 is used).
+    """
+    international = not all(addr.isascii() for addr in [from_addr] + to_addrs)
+    if international and "smtputf8" not in extensions:
+        raise smtplib.SMTPNotSupportedError(
+            "One or more source or delivery addresses require internationalized email support, "
+            "but the server does not advertise the required SMTPUTF8 capability")
+    msg = copy.copy(msg)
+    del msg["Bcc"]
+    data = flatten_message(msg, utf8=international)
+
+    options = []
+    if "size" in extensions:
+        options.append(f"SIZE={len(data)}")
+    if international:
+        options += ["SMTPUTF8", "BODY=8BITMIME"]
+    elif not data.isascii() and "8bitmime" in extensions:
+        options.append("BODY=8BITMIME")
+    return data, options, international
+
+
+def send_pipelined(conn, msg, pipeline=True):
+    """Send a message, with MAIL, RCPT and DATA in one write when the server offers PIPELINING.
+
+    Returns the refused recipients like smtplib.SMTP.sendmail. Errors raised
+    once the message data has started going out carry `after_data = True`:
+    the server may have accepted the message, so it must not be sent again.
+    """
+    from_addr, to_addrs = message_envelope(msg)
+    data, options, international = prepare_message(msg, from_addr, to_addrs, conn.esmtp_features)
+    if international:
+        conn.command_encoding = "utf-8"
+    mail = f"MAIL FROM:<{from_addr}>" + "".join(f" {option}" for option in options)
+    rcpts = [f"RCPT TO:<{addr}>" for addr in to_addrs]
+
+    if pipeline and conn.has_extn("pipelining"):
+        conn.send("".join(f"{command}\r\n" for command in [mail] + rcpts + ["DATA"]))
+        # Every pipelined command gets a reply, in order, even after a failure
+        mail_reply = conn.getreply()
+        rcpt_replies = [conn.getreply() for _ in rcpts]
+        data_reply = conn.getreply()
+    else:
+        conn.putcmd(mail)
+        mail_reply = conn.getreply()
+        rcpt_replies = []
+        if mail_reply[0] == 250:
+            for rcpt in rcpts:
+                conn.putcmd(rcpt)
+                rcpt_replies.append(conn.getreply())
+        accepted = any(code in (250, 251) for code, _ in rcpt_replies)
+        data_reply = conn.docmd("DATA") if accepted else (0, b"")
+
+    refused = {addr: reply for addr, reply in zip(to_addrs, rcpt_replies) if reply[0] not in (250, 251)}
+    if mail_reply[0] != 250 or len(refused) == len(to_addrs) or data_reply[0] != 354:
+        if data_reply[0] == 354:
+            conn.send(".\r\n")
+            conn.getreply()
+        conn.rset()
+        if mail_reply[0] != 250:
+            raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        raise smtplib.SMTPDataError(*data_reply)
+
+    try:
+        conn.send(data)
+        code, resp = conn.getreply()
+    except OSError as e:
+        e.after_data = True
+        raise
+    metrics.count("smtp_sent_bytes_total", len(data), backend="sync")
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+class SMTPPool:
+    """Small pool of logged-in SMTP connections reused across sends.
+
+    Connections idle for a while are checked with NOOP before reuse, and are
+    recycled after max_idle seconds or max_messages sends.
+    """
+
+    def __init__(self, emailid, passkey, host=None, port=None, size=None,
+                 max_idle=None, max_messages=None, check_after=None):
+        self.emailid = emailid
+        self.passkey = passkey
+        self.host = host or config.SMTP_HOST
+        self.port = port or config.SMTP_PORT
+        self.size = size or config.SMTP_POOL_SIZE
+        self.max_idle = max_idle or config.SMTP_MAX_IDLE_SECONDS
+        self.max_messages = max_messages or config.SMTP_MAX_MESSAGES
+        self.check_after = config.SMTP_CHECK_SECONDS if check_after is None else check_after
+
+        self._idle = []  # connections, most recently used last
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self.closed = False
+        self.stats = {
+            "connects": 0,
+            "reuses": 0,
+            "recycled": 0,
+            "messages": 0,
+            "last_connect_ms": 0.0,
+            "last_login_ms": 0.0,
+            "total_send_ms": 0.0,
+            "saved_ms": 0.0,
+        }
+
+    def _open(self):
+        """Connect, STARTTLS and log in, recording how long it took."""
+        start = time.perf_counter()
+        if self.port == 465:
+            conn = smtplib.SMTP_SSL(self.host, self.port)
+        else:
+            conn = smtplib.SMTP(self.host, self.port)
+            if config.SMTP_STARTTLS:
+                conn.starttls()
+        connected = time.perf_counter()
+
+        try:
+            conn.login(self.emailid, self.passkey)
+        except smtplib.SMTPException:
+            self._discard(conn)
+            raise
+        logged_in = time.perf_counter()
+
+        conn.messages_sent = 0
+        conn.last_used = time.monotonic()
+        metrics.observe("smtp_connect_seconds", connected - start, backend="sync")
+        metrics.observe("smtp_login_seconds", logged_in - connected, backend="sync")
+        with self._lock:
+            self.stats["connects"] += 1
+            self.stats["last_connect_ms"] = (connected - start) * 1000
+            self.stats["last_login_ms"] = (logged_in - connected) * 1000
+        print(f"✅ SMTP connected in {(connected - start) * 1000:.0f} ms, "
+              f"logged in in {(logged_in - connected) * 1000:.0f} ms")
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _usable(self, conn):
+        idle = time.monotonic() - conn.last_used
+        if idle >= self.max_idle or conn.messages_sent >= self.max_messages:
+            return False
+        if idle < self.check_after:
+            return True
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self, timeout=None):
+        """Take a logged-in connection from the pool, opening one if none are usable."""
+        if self.closed:
+            raise smtplib.SMTPException("SMTP pool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No SMTP connection available")
+
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    metrics.count("pool_checkouts_total", pool="smtp", result="opened", backend="sync")
+                    return self._open()
+                if self._usable(conn):
+                    with self._lock:
+                        self.stats["reuses"] += 1
+                        self.stats["saved_ms"] += self.stats["last_connect_ms"] + self.stats["last_login_ms"]
+                    metrics.count("pool_checkouts_total", pool="smtp", result="reused", backend="sync")
+                    return conn
+                with self._lock:
+                    self.stats["recycled"] += 1
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Return a connection to the pool, or drop it if it is no longer usable."""
+        if broken or self.closed:
+            self._discard(conn)
+        else:
+            conn.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a block."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except smtplib.SMTPServerDisconnected:
+            self.release(conn, broken=True)
+            raise
+        except smtplib.SMTPException:
+            # Clear the half-finished transaction so the connection can be reused
+            try:
+                conn.rset()
+            except (smtplib.SMTPException, OSError):
+                self.release(conn, broken=True)
+                raise
+            self.release(conn)
+            raise
+        except BaseException:
+            self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    def send_message(self, msg, retries=1, pipeline=None):
+        """Send an EmailMessage, reconnecting once if a pooled connection has gone stale.
+
+        Only failures before the message data is sent are retried.
+        """
+        pipeline = config.SMTP_PIPELINING if pipeline is None else pipeline
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    start = time.perf_counter()
+                    with metrics.span("smtp_send_seconds", backend="sync"):
+                        result = send_pipelined(conn, msg, pipeline)
+                    conn.messages_sent += 1
+                with self._lock:
+                    self.stats["messages"] += 1
+                    self.stats["total_send_ms"] += (time.perf_counter() - start) * 1000
+                return result
+            except OSError as e:
+                # Once the data has gone out the message may have been delivered; never send it twice
+                if attempt == retries or not _connection_dropped(e) or getattr(e, "after_data", False):
+                    raise
+                print(f"⚠️ SMTP connection dropped ({e}), reconnecting...")
+
+    def warm(self):
+        """Log in once so the first send doesn't pay for it; also checks the credentials."""
+        with self.connection():
+            pass
+
+    def close(self):
+        """Log out every idle connection; connections in use are dropped when released."""
+        self.closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(emailid, passkey, host=None, port=None):
+    """Return the process-wide pool for an account, creating it on first use."""
+    key = (host or config.SMTP_HOST, port or config.SMTP_PORT, emailid)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed or pool.passkey != passkey:
+            if pool is not None:
+                pool.close()
+            pool = _pools[key] = SMTPPool(emailid, passkey, *key[:2])
+    return pool
+
+
+def close_all():
+    """Close every SMTP pool, e.g. on logout."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+    print("✅ SMTP pools closed")
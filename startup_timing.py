@@ -0,0 +1,85 @@
+import builtins
+import os
+import sys
+import threading
+import time
+
+import config
+
+
+def _process_start():
+    """perf_counter() reading at the moment the process started.
+
+    Taken from /proc on Linux, so interpreter startup and every import before
+    this module count too; elsewhere it falls back to when this module was imported.
+    """
+    now = time.perf_counter()
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, after the command name in parentheses, is the start time in clock ticks since boot
+            started = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError, AttributeError):
+        return now
+    return now - max(0.0, uptime - started)
+
+
+_start = _process_start()
+_marks = []
+_imports = []  # (module, depth, self seconds, cumulative seconds)
+_local = threading.local()
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """builtins.__import__ that records how long each first import of a module takes."""
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    # Each frame collects the cumulative time of the imports nested in it
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        _imports.append((name, len(stack), elapsed - nested, elapsed))
+
+
+def install():
+    """Start timing imports, if STARTUP_TIMING is set; call before the heavy imports."""
+    if config.STARTUP_TIMING and builtins.__import__ is not _timed_import:
+        builtins.__import__ = _timed_import
+
+
+def mark(label):
+    """Record that startup reached `label`; returns milliseconds since the process started."""
+    ms = (time.perf_counter() - _start) * 1000
+    _marks.append((label, ms))
+    print(f"⏱️ {label} after {ms:.0f} ms")
+    return ms
+
+
+def report(top=15):
+    """The startup phases and, if timed, the slowest imports, in the style of -X importtime."""
+    lines = ["Startup timing (ms since start | since previous step):"]
+    previous = 0.0
+    for label, ms in _marks:
+        lines.append(f"{ms:9.0f} | {ms - previous:7.0f}  {label}")
+        previous = ms
+    if _imports:
+        lines.append(f"Slowest imports (self ms | cumulative ms), top {top} of {len(_imports)}:")
+        for name, depth, own, cumulative in sorted(_imports, key=lambda i: i[3], reverse=True)[:top]:
+            lines.append(f"{own * 1000:9.1f} | {cumulative * 1000:9.1f} | {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+def print_report():
+    if config.STARTUP_TIMING:
+        print(report())
@@ -0,0 +1,206 @@
+import json
+import re
+import threading
+import time
+
+import config
+from aio_mail import get_backend
+from imap_fetch import LPAREN, RPAREN, tokenize_response
+from imap_pool import IMAPPool
+from mail_sync import sync_mailbox
+
+_ATOM_RE = re.compile(r"^[^\s(){%*\"\\\]]+$")
+
+
+def quote_mailbox(name):
+    """Quote a mailbox name for SELECT unless it is a plain atom; imaplib sends names as-is."""
+    if name.startswith('"') or _ATOM_RE.match(name):
+        return name
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def mailbox_label(mailbox):
+    """A mailbox name as shown to the user, without quotes."""
+    return mailbox[1:-1] if len(mailbox) > 1 and mailbox.startswith('"') and mailbox.endswith('"') else mailbox
+
+
+def list_mailboxes(imap_server):
+    """Return the quoted names of every selectable mailbox (folders and Gmail labels)."""
+    status, data = imap_server.list()
+    if status != "OK":
+        raise imap_server.error(f"LIST failed: {data}")
+    mailboxes = []
+    for line in data:
+        tokens = tokenize_response([line])
+        if not tokens or tokens[0] is not LPAREN or RPAREN not in tokens:
+            continue
+        end = tokens.index(RPAREN)
+        flags = {str(flag).lower() for flag in tokens[1:end]}
+        if "\\noselect" in flags or "\\nonexistent" in flags or len(tokens) < end + 3:
+            continue
+        name = tokens[end + 2]
+        if isinstance(name, bytes):
+            name = name.decode("utf-8", errors="replace")
+        mailboxes.append(quote_mailbox(str(name)))
+    return mailboxes
+
+
+def sync_folder(pool, store, account, mailbox="INBOX", limit=None):
+    """Sync one folder over the configured MAIL_BACKEND; returns (UIDVALIDITY, number of new emails)."""
+    limit = limit or config.INBOX_FETCH_COUNT
+    if config.MAIL_BACKEND == "asyncio":
+        backend = get_backend()
+        return backend.run(backend.sync_mailbox(
+            pool.emailid, pool.passkey, store, mailbox, limit, pool.host, pool.port
+        ))
+    return pool.run(lambda imap_server: sync_mailbox(imap_server, store, account, mailbox, limit), mailbox)
+
+
+def load_accounts(path=None):
+    """Extra accounts to sync, from a JSON list of {"email", "password", "host", "folders"} objects."""
+    path = path or config.ACCOUNTS_PATH
+    try:
+        with open(path, encoding="utf-8") as f:
+            accounts = json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read accounts from {path}: {e}")
+        return []
+    return [account for account in accounts if account.get("email") and account.get("password")]
+
+
+class SyncEngine:
+    """Syncs many folders of many accounts into one MailStore in parallel.
+
+    Each (account, folder) sync is a task. `workers` threads take tasks in
+    round-robin order across accounts, and never run more at once for an
+    account than its IMAP pool has connections, so no worker sits blocked on
+    a busy account while another account has work. A pool shared with the
+    inbox always keeps one connection free for it. Folders of accounts added
+    with folders=None are discovered with LIST at the start of each run.
+    """
+
+    def __init__(self, store, workers=None, limit=None):
+        self.store = store
+        self.workers = workers or config.SYNC_WORKERS
+        self.limit = limit or config.INBOX_FETCH_COUNT
+        self.accounts = {}  # account -> (IMAPPool, folders or None, owns the pool)
+        self._lock = threading.Lock()
+        self.last_results = []
+
+    def add_account(self, account, pool=None, passkey=None, folders=None, host=None):
+        """Register an account with its own pool, or one built from `passkey` and `host`."""
+        owns_pool = pool is None
+        if owns_pool:
+            pool = IMAPPool(account, passkey, host=host)
+        if folders is not None:
+            folders = [quote_mailbox(folder) for folder in folders]
+        with self._lock:
+            self.accounts[account] = (pool, folders, owns_pool)
+
+    def add_configured_accounts(self, path=None):
+        for account in load_accounts(path):
+            self.add_account(account["email"], passkey=account["password"],
+                             folders=account.get("folders") or config.SYNC_FOLDERS, host=account.get("host"))
+
+    def folders(self, account):
+        """The folders synced for an account, listing them from the server if not configured."""
+        pool, folders, _ = self.accounts[account]
+        if folders is None:
+            folders = pool.run(list_mailboxes)
+        return folders
+
+    def _sync_one(self, account, mailbox):
+        pool = self.accounts[account][0]
+        start = time.perf_counter()
+        result = {"account": account, "mailbox": mailbox, "ok": False, "added": 0, "seconds": 0.0, "error": ""}
+        try:
+            _, result["added"] = sync_folder(pool, self.store, account, mailbox, self.limit)
+            result["ok"] = True
+        except Exception as e:
+            result["error"] = str(e)
+            print(f"❌ Sync of {account} {mailbox_label(mailbox)} failed: {e}")
+        result["seconds"] = time.perf_counter() - start
+        print(f"⏱️ {account} {mailbox_label(mailbox)}: {result['added']} new in {result['seconds'] * 1000:.0f} ms")
+        return result
+
+    def sync(self, on_result=None, cancelled=None):
+        """Sync every folder of every account; returns one result dict per folder.
+
+        on_result(result) is called from worker threads as each folder finishes.
+        Results have account, mailbox, ok, added, seconds and error.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            accounts = list(self.accounts)
+
+        pending = {}
+        for account in accounts:
+            try:
+                pending[account] = list(self.folders(account))
+            except Exception as e:
+                print(f"❌ Could not list folders of {account}: {e}")
+        in_flight = {account: 0 for account in pending}
+        limits = {}
+        for account in pending:
+            pool, _, owns_pool = self.accounts[account]
+            limits[account] = pool.size if owns_pool else max(1, pool.size - 1)
+        order = [account for account in accounts if pending.get(account)]
+        results = []
+        cond = threading.Condition()
+        turn = [0]
+
+        def next_task():
+            """Round-robin over accounts that have folders left and a free connection."""
+            for step in range(len(order)):
+                account = order[(turn[0] + step) % len(order)]
+                if pending[account] and in_flight[account] < limits[account]:
+                    turn[0] = (turn[0] + step + 1) % len(order)
+                    in_flight[account] += 1
+                    return account, pending[account].pop(0)
+            return None
+
+        def worker():
+            while True:
+                with cond:
+                    task = None
+                    while task is None:
+                        if cancelled is not None and cancelled.is_set():
+                            return
+                        if not any(pending.values()):
+                            return
+                        task = next_task()
+                        if task is None:
+                            cond.wait(0.5)
+                result = self._sync_one(*task)
+                with cond:
+                    in_flight[task[0]] -= 1
+                    results.append(result)
+                    cond.notify_all()
+                if on_result:
+                    on_result(result)
+
+        tasks = sum(len(folders) for folders in pending.values())
+        threads = [
+            threading.Thread(target=worker, name=f"sync-{n}", daemon=True)
+            for n in range(min(self.workers, tasks))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+        busy = sum(result["seconds"] for result in results)
+        print(f"✅ Synced {len(results)} folders of {len(order)} accounts in {elapsed:.2f} s "
+              f"({busy:.2f} s of folder syncs, {len(threads)} workers)")
+        self.last_results = results
+        return results
+
+    def close(self):
+        """Close the pools this engine opened itself."""
+        with self._lock:
+            for pool, _, owns_pool in self.accounts.values():
+                if owns_pool:
+                    pool.close()
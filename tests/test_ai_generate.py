@@ -0,0 +1,42 @@
+import pytest
+
+import ai_generate
+import config
+from ai_quota import GeminiRateLimiter, UsageLog
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class BrokenStreamModel:
+    """Streams a few chunks, then fails like a dropped connection."""
+
+    usage_metadata = None
+
+    def generate_content(self, prompt, stream=False):
+        return self
+
+    def __iter__(self):
+        yield Chunk("Subject: Hi\n")
+        yield Chunk("Hello there")
+        raise ConnectionError("stream dropped")
+
+
+@pytest.fixture
+def limiter(tmp_path, monkeypatch):
+    limiter = GeminiRateLimiter(rpm=0, tpm=100000, usage=UsageLog(str(tmp_path / "usage.json")))
+    monkeypatch.setattr(ai_generate, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(ai_generate, "get_model", lambda model_name, generation_config=None: BrokenStreamModel())
+    monkeypatch.setattr(config, "AI_CACHE_DISK", False)
+    return limiter
+
+
+def test_broken_stream_gives_back_the_unused_reservation(limiter):
+    chunks = []
+    with pytest.raises(ConnectionError):
+        ai_generate.stream_text("Write a short note", chunks.append, force=True)
+    assert chunks == ["Subject: Hi\n", "Hello there"]
+    # Only the prompt and the text that arrived are charged, not the expected output
+    assert limiter.tokens.capacity - limiter.tokens.level < config.AI_EXPECTED_OUTPUT_TOKENS
@@ -0,0 +1,72 @@
+import asyncio
+import smtplib
+
+import pytest
+
+from aio_mail import AsyncSessionPool
+
+
+class Session:
+    def __init__(self):
+        self.closed = False
+        self.close_calls = 0
+
+    async def close(self):
+        self.close_calls += 1
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    async def open_session():
+        return Session()
+    return AsyncSessionPool(open_session, "pw", size=2, max_idle=kwargs.get("max_idle", 60), kind="smtp")
+
+
+async def use(pool, error=None, close=False):
+    try:
+        async with pool.session() as session:
+            if close:
+                await session.close()
+            if error is not None:
+                raise error
+    except type(error) if error is not None else ():
+        pass
+    return session
+
+
+def test_sessions_are_reused_after_ordinary_errors():
+    async def run():
+        pool = make_pool()
+        first = await use(pool, smtplib.SMTPRecipientsRefused({}))
+        second = await use(pool)
+        assert first is second
+        assert pool.sessions == {first}
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("error, close", [
+    (smtplib.SMTPServerDisconnected("gone"), False),
+    (ConnectionResetError(), False),
+    (None, True),
+])
+def test_dropped_sessions_leave_the_pool(error, close):
+    async def run():
+        pool = make_pool()
+        session = await use(pool, error, close)
+        assert session.closed
+        assert pool.sessions == set() and pool.idle == []
+        await pool.close()
+        assert session.close_calls == 1
+    asyncio.run(run())
+
+
+def test_expired_sessions_leave_the_pool():
+    async def run():
+        pool = make_pool(max_idle=0)
+        first = await use(pool)
+        second = await use(pool)
+        assert first is not second and first.closed
+        assert pool.sessions == {second}
+        await pool.close()
+        assert first.close_calls == 1 and second.closed
+    asyncio.run(run())
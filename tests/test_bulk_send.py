@@ -0,0 +1,74 @@
+import smtplib
+
+import pytest
+
+from bulk_send import BulkSender, DailySendCounter, render
+
+
+class RecordingPool:
+    """Stands in for SMTPPool; fails for addresses listed in `fail`."""
+
+    emailid = "me@example.com"
+
+    def __init__(self, fail=None):
+        self.fail = fail or {}
+        self.sent = []
+
+    def send_message(self, msg):
+        error = self.fail.get(msg["To"])
+        if error is not None:
+            raise error
+        self.sent.append(msg)
+        return {}
+
+
+@pytest.fixture
+def counter(tmp_path):
+    return DailySendCounter("me@example.com", cap=10, path=str(tmp_path / "counts.json"))
+
+
+@pytest.mark.parametrize("template, expected", [
+    ("Hi {name}", "Hi Ada"),
+    ("Hi {name}, {unknown}", "Hi Ada, {unknown}"),
+    ("p { color: red } {name}", "p { color: red } Ada"),
+    ("{} {0} {name!r} {", "{} {0} {name!r} {"),
+    ("{{name}}", "{Ada}"),
+])
+def test_render(template, expected):
+    assert render(template, {"name": "Ada"}) == expected
+
+
+def test_render_leaves_braces_in_values():
+    assert render("Dear {name}", {"name": "{email}"}) == "Dear {email}"
+
+
+def test_braces_in_templates_and_rows_are_sent(counter):
+    pool = RecordingPool()
+    sender = BulkSender(pool, "Hello {name} {", "body { margin: 0 } {}", rate=0, workers=2, counter=counter)
+    summary = sender.run([{"email": "a@example.com", "name": "{Ada}"}])
+    assert summary["sent"] == 1
+    assert pool.sent[0]["Subject"] == "Hello {Ada} {"
+
+
+def test_failures_release_the_reservation_and_are_reported(counter):
+    pool = RecordingPool(fail={
+        "b@example.com": smtplib.SMTPRecipientsRefused({}),
+        "c@example.com": ValueError("bad row"),
+    })
+    sender = BulkSender(pool, "Hi", "Hi {name}", rate=0, workers=2, counter=counter)
+    results = []
+    rows = [{"email": f"{name}@example.com", "name": name} for name in "abc"]
+    summary = sender.run(rows, on_result=lambda result, _: results.append(result))
+
+    assert (summary["sent"], summary["failed"]) == (1, 2)
+    assert sorted(result["email"] for result in results) == [row["email"] for row in rows]
+    assert counter.sent_today() == 1
+
+
+def test_after_data_failures_stay_counted(counter):
+    error = smtplib.SMTPServerDisconnected("dropped")
+    error.after_data = True
+    sender = BulkSender(RecordingPool(fail={"a@example.com": error}), "Hi", "Hi", rate=0, counter=counter)
+    summary = sender.run([{"email": "a@example.com"}])
+    assert summary["failed"] == 1
+    assert counter.sent_today() == 1
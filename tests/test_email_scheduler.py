@@ -0,0 +1,77 @@
+import datetime
+import threading
+
+import pytest
+
+import config
+import email_scheduler
+from email_scheduler import ScheduledSender, SendQueue
+from schedule_store import SENT, ScheduleStore
+
+
+class SlowPool:
+    """Stands in for SMTPPool; send_message blocks until `proceed` is set."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+
+    def send_message(self, msg):
+        self.started.set()
+        assert self.proceed.wait(5)
+        return {}
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    pool = SlowPool()
+    monkeypatch.setattr(config, "SCHEDULE_DB_PATH", str(tmp_path / "schedule.db"))
+    monkeypatch.setattr(email_scheduler.smtp_pool, "get_pool", lambda emailid, passkey: pool)
+    return pool
+
+
+def status(email_id):
+    store = ScheduleStore(config.SCHEDULE_DB_PATH)
+    try:
+        return store.get(email_id)["status"]
+    finally:
+        store.close()
+
+
+def schedule_now(sender):
+    return sender.schedule("you@example.com", "Hi", "Hello", datetime.datetime.now())
+
+
+def test_stop_waits_for_a_send_in_progress(pool):
+    sender = ScheduledSender("me@example.com", "pw", send_queue=SendQueue(workers=1))
+    email_id = schedule_now(sender)
+    assert pool.started.wait(5)
+
+    stopper = threading.Thread(target=sender.stop, kwargs={"timeout": 5})
+    stopper.start()
+    stopper.join(0.2)
+    assert stopper.is_alive()
+
+    pool.proceed.set()
+    stopper.join(5)
+    assert not stopper.is_alive()
+    assert status(email_id) == SENT
+
+
+def test_a_send_outliving_stop_still_records_it(pool):
+    sender = ScheduledSender("me@example.com", "pw", send_queue=SendQueue(workers=1))
+    email_id = schedule_now(sender)
+    assert pool.started.wait(5)
+
+    sender.stop(timeout=0)
+    pool.proceed.set()
+    with sender._busy_cond:
+        assert sender._busy_cond.wait_for(lambda: not sender._busy, 5)
+    assert status(email_id) == SENT
+
+
+def test_nothing_is_sent_after_stop(pool):
+    sender = ScheduledSender("me@example.com", "pw", send_queue=SendQueue(workers=1))
+    sender.stop()
+    sender.send(1)
+    assert not pool.started.is_set()
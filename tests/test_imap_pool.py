@@ -0,0 +1,60 @@
+import asyncio
+import imaplib
+import threading
+
+import pytest
+
+import config
+from fake_servers import FakeIMAPServer
+from imap_pool import IMAPPool
+
+
+@pytest.fixture
+def imap(monkeypatch):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(FakeIMAPServer(messages=5, password="pw").start(), loop).result()
+    monkeypatch.setattr(config, "IMAP_SSL", False)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+@pytest.fixture
+def pool(imap):
+    pool = IMAPPool("me@example.com", "pw", host="127.0.0.1", port=imap.port, size=2, keepalive=3600)
+    yield pool
+    pool.close()
+
+
+def make_stale(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    with pool._lock:
+        pool._idle = [(c, last_used - 3600) for c, last_used in pool._idle]
+    return conn
+
+
+def test_keepalive_checks_a_stale_connection(pool):
+    conn = make_stale(pool)
+    assert pool._check_stale()
+    assert pool._idle[0][0] is conn
+    assert pool.stats["keepalives"] == 1
+    assert not pool._check_stale()
+
+
+def test_replacement_is_logged_out_when_select_fails(pool, monkeypatch):
+    make_stale(pool)
+    discarded = []
+    monkeypatch.setattr(pool, "_is_alive", lambda conn: False)
+    monkeypatch.setattr(pool, "_discard", discarded.append)
+
+    def fail(conn, mailbox=None):
+        raise imaplib.IMAP4.error("SELECT failed")
+    monkeypatch.setattr(pool, "select", fail)
+
+    assert not pool._check_stale()
+    assert len(discarded) == 2
+    assert pool._idle == []
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import pytest
+
+from mail_api import HTTPError, MailAPI
+
+
+class StubClient:
+    emailid = "me@example.com"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, to, subject, body):
+        self.sent.append((to, subject, body))
+        return True, "Email sent successfully!"
+
+
+@pytest.fixture
+def api():
+    api = MailAPI(StubClient(), token="secret", workers=1)
+    yield api
+    api.close()
+
+
+def dispatch(api, method, target, headers=None, body=b""):
+    headers = dict({"authorization": "Bearer secret"}, **(headers or {}))
+    return asyncio.run(api.dispatch(method, target, headers, body))
+
+
+SEND = json.dumps({"to": "you@example.com", "subject": "Hi", "body": "Hello"}).encode()
+
+
+def test_send_with_json(api):
+    status, payload = dispatch(api, "POST", "/send", {"content-type": "application/json; charset=utf-8"}, SEND)
+    assert status == 200 and payload["ok"]
+    assert api.client.sent == [("you@example.com", "Hi", "Hello")]
+
+
+@pytest.mark.parametrize("headers, status", [
+    ({"content-type": "text/plain"}, 415),
+    ({}, 415),
+    ({"content-type": "application/json", "origin": "https://example.org"}, 403),
+    ({"content-type": "application/json", "authorization": ""}, 401),
+])
+def test_requests_a_web_page_could_send_are_refused(api, headers, status):
+    with pytest.raises(HTTPError) as error:
+        dispatch(api, "POST", "/send", headers, SEND)
+    assert error.value.status == status
+    assert api.client.sent == []
+
+
+def test_origin_is_refused_without_a_body(api):
+    with pytest.raises(HTTPError) as error:
+        dispatch(api, "GET", "/health", {"origin": "null"})
+    assert error.value.status == 403
+    assert dispatch(api, "GET", "/health") == (200, {"ok": True, "account": "me@example.com"})
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+
+import config
+from fake_servers import FakeIMAPServer
+from imap_pool import IMAPPool
+from mail_client import load_body, mark_seen
+from mail_store import MailStore
+from mail_sync import index_bodies, sync_mailbox
+
+
+@pytest.fixture
+def imap(monkeypatch):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(FakeIMAPServer(messages=5, password="pw").start(), loop).result()
+    monkeypatch.setattr(config, "IMAP_SSL", False)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+@pytest.fixture
+def pool(imap):
+    pool = IMAPPool("me@example.com", "pw", host="127.0.0.1", port=imap.port, size=1)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def store():
+    store = MailStore(":memory:")
+    yield store
+    store.close()
+
+
+def server_flags(imap, uid):
+    return next(message.flags for message in imap.mailboxes["INBOX"].messages if message.uid == uid)
+
+
+def cached(store, uid):
+    uidvalidity, _ = store.get_mailbox("me@example.com", "INBOX")
+    return store.get_message("me@example.com", "INBOX", uidvalidity, uid)
+
+
+def test_opening_a_prefetched_email_marks_it_seen(imap, pool, store):
+    uidvalidity, _ = pool.run(lambda conn: sync_mailbox(conn, store, "me@example.com", "INBOX"), "INBOX")
+    indexed = pool.run(lambda conn: index_bodies(conn, store, "me@example.com", "INBOX", uidvalidity, 1), "INBOX")
+    assert indexed == 1
+
+    email_data = cached(store, 5)
+    assert email_data["body"] is not None
+    assert "\\Seen" not in server_flags(imap, 5)
+
+    flags = mark_seen(pool, store, "me@example.com", "INBOX", email_data)
+    assert "\\Seen" in flags.split()
+    assert "\\Seen" in server_flags(imap, 5)
+    assert cached(store, 5)["flags"] == flags
+
+
+def test_loading_a_body_marks_it_seen(imap, pool, store):
+    pool.run(lambda conn: sync_mailbox(conn, store, "me@example.com", "INBOX"), "INBOX")
+    body, _, flags = load_body(pool, store, "me@example.com", "INBOX", cached(store, 4))
+    assert body
+    assert "\\Seen" in flags.split()
+    assert "\\Seen" in server_flags(imap, 4)
+    assert cached(store, 4)["flags"] == flags
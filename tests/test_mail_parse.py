@@ -0,0 +1,79 @@
+import base64
+import quopri
+
+import pytest
+
+from mail_parse import BodyExtractor, TransferDecoder
+
+TEXT = "Grüße aus Köln! " * 40 + "\nZweite Zeile mit = und ümlauten.\n"
+
+
+def extract(raw, chunk_size, max_bytes=None):
+    extractor = BodyExtractor(max_bytes or 1024 * 1024)
+    for start in range(0, len(raw), chunk_size):
+        extractor.feed(raw[start:start + chunk_size])
+    return extractor.close(), extractor
+
+
+def single_part(encoding, body):
+    return (b"Subject: Test\r\nContent-Type: text/plain; charset=utf-8\r\n"
+            b"Content-Transfer-Encoding: " + encoding + b"\r\n\r\n" + body)
+
+
+def multipart(encoding, body):
+    return (b"Subject: Test\r\nMIME-Version: 1.0\r\n"
+            b'Content-Type: multipart/mixed; boundary="XYZ"\r\n\r\n'
+            b"Preamble\r\n--XYZ\r\n"
+            b"Content-Type: text/plain; charset=utf-8\r\n"
+            b"Content-Transfer-Encoding: " + encoding + b"\r\n\r\n" + body +
+            b"\r\n--XYZ\r\nContent-Type: application/pdf\r\n"
+            b"Content-Transfer-Encoding: base64\r\n\r\n" + base64.encodebytes(b"%PDF" * 500) +
+            b"--XYZ--\r\n")
+
+
+def qp_body():
+    # Lines longer than 76 characters get soft breaks ("=\n"), and ü becomes =C3=BC
+    return quopri.encodestring(TEXT.encode()).replace(b"\n", b"\r\n")
+
+
+def base64_body():
+    return base64.encodebytes(TEXT.encode()).replace(b"\n", b"\r\n")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 76, 77, 1000])
+@pytest.mark.parametrize("make", [single_part, multipart])
+def test_quoted_printable_split_across_chunks(make, chunk_size):
+    body, extractor = extract(make(b"quoted-printable", qp_body()), chunk_size)
+    assert body.replace("\r\n", "\n").rstrip("\n") == TEXT.rstrip("\n")
+    assert extractor.headers["Subject"] == "Test"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 77, 1000])
+@pytest.mark.parametrize("make", [single_part, multipart])
+def test_base64_split_across_chunks(make, chunk_size):
+    body, _ = extract(make(b"base64", base64_body()), chunk_size)
+    assert body == TEXT
+
+
+@pytest.mark.parametrize("data", [b"=\r\n", b"ab=\r\ncd", b"=C3", b"=C3=BC\r\n"])
+def test_quoted_printable_escape_split_at_every_offset(data):
+    for split in range(len(data) + 1):
+        decoder = TransferDecoder("quoted-printable")
+        decoded = decoder.decode(data[:split]) + decoder.decode(data[split:]) + decoder.flush()
+        assert decoded == quopri.decodestring(data)
+
+
+def test_done_once_the_text_part_ends():
+    raw = multipart(b"base64", base64_body())
+    extractor = BodyExtractor(1024 * 1024)
+    # Up to the start of the attachment's data
+    extractor.feed(raw[:raw.index(b"application/pdf") + 200])
+    assert extractor.done
+    assert extractor.close() == TEXT
+
+
+def test_max_bytes_truncates():
+    body, extractor = extract(single_part(b"base64", base64_body()), 10, max_bytes=100)
+    assert extractor.truncated
+    assert TEXT.startswith(body)
+    assert len(body.encode()) <= 100
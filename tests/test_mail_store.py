@@ -0,0 +1,69 @@
+import pytest
+
+from mail_store import MailStore, build_search_query
+
+
+@pytest.fixture
+def store():
+    store = MailStore(":memory:")
+    store.reset_mailbox("me@example.com", "INBOX", 1)
+    store.save_headers("me@example.com", "INBOX", 1, [
+        {"uid": 1, "subject": "Budget for Q3", "sender": "Alice <alice@example.com>",
+         "date": "", "size": 10, "flags": ""},
+        {"uid": 2, "subject": 'The "quarterly report"', "sender": "Bob <bob@example.com>",
+         "date": "", "size": 10, "flags": ""},
+        {"uid": 3, "subject": "Lunch", "sender": "Carol <carol@example.com>",
+         "date": "", "size": 10, "flags": ""},
+    ])
+    store.save_body("me@example.com", "INBOX", 1, 3, "Shall we go over the budget?")
+    yield store
+    store.close()
+
+
+def search(store, text):
+    return [row["uid"] for row in store.search("me@example.com", "INBOX", 1, text)]
+
+
+@pytest.mark.parametrize("text, query", [
+    ("budg", '"budg"*'),
+    ('"quarterly report"', '"quarterly report"'),
+    ('say "hi', '"say"* "hi"'),
+    ('x"y', '"x""y"*'),
+    ("report*", '"report"*'),
+    ("from:alice", 'sender : "alice"*'),
+    ('SUBJECT:"Q3 plan"', 'subject : "Q3 plan"'),
+    ("body:budget", 'body : "budget"*'),
+    ("http://example.com", '"http://example.com"*'),
+    ("to:bob", '"to:bob"*'),
+])
+def test_build_search_query(text, query):
+    assert build_search_query(text) == query
+
+
+@pytest.mark.parametrize("text", ["", "   ", "*", '""', '"'])
+def test_build_search_query_nothing_to_search(text):
+    assert build_search_query(text) is None
+
+
+def test_search_prefix_and_phrase(store):
+    assert search(store, "budg") == [3, 1]
+    assert search(store, '"quarterly report"') == [2]
+    assert search(store, '"report quarterly"') == []
+
+
+def test_search_fields(store):
+    assert search(store, "from:alice") == [1]
+    assert search(store, "subject:budget") == [1]
+    assert search(store, "body:budget") == [3]
+
+
+@pytest.mark.parametrize("text", ['x"y', "a*b*", "(budget", "budget OR", "NEAR(", "-budget", "^budget", "col:x"])
+def test_search_syntax_is_escaped(store, text, capsys):
+    # Operators, quotes and unknown prefixes are searched as text instead of breaking the MATCH
+    store.search("me@example.com", "INBOX", 1, text)
+    assert "Search failed" not in capsys.readouterr().out
+
+
+def test_search_punctuation_is_ignored(store):
+    assert search(store, "(budget") == [3, 1]
+    assert search(store, "budget OR") == []
@@ -0,0 +1,122 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import config
+
+
+class JobCancelled(Exception):
+    """Raised inside a job by check_cancelled() once the job has been cancelled."""
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(object)
+    status = pyqtSignal(str)
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    finished = pyqtSignal()
+
+
+class Job(QRunnable):
+    """Runs fn(*args, **kwargs) on the worker pool and reports back through Qt signals.
+
+    Signals are queued to the thread that created the job, normally the GUI
+    thread, so their slots may touch widgets. With pass_job=True the job is
+    passed to fn as a `job` keyword so it can report progress and notice
+    cancellation.
+    """
+
+    def __init__(self, fn, *args, pass_job=False, **kwargs):
+        super().__init__()
+        # Python keeps the job alive in _active_jobs until it has finished
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = dict(kwargs, job=self) if pass_job else kwargs
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_event(self):
+        """threading.Event set on cancel(), for code that waits or polls outside Qt."""
+        return self._cancelled
+
+    def cancel(self):
+        """Stop the job at its next check_cancelled() and drop its result."""
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def report(self, value):
+        """Send a progress update to the GUI thread."""
+        if not self._cancelled.is_set():
+            self.signals.progress.emit(value)
+
+    def set_status(self, text):
+        """Send a short human-readable status line (e.g. an expected wait) to the GUI thread."""
+        if not self._cancelled.is_set():
+            self.signals.status.emit(text)
+
+    def run(self):
+        try:
+            self.check_cancelled()
+            result = self.fn(*self.args, **self.kwargs)
+        except JobCancelled:
+            pass
+        except Exception as e:
+            if not self._cancelled.is_set():
+                self.signals.error.emit(e)
+        else:
+            if not self._cancelled.is_set():
+                self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+_active_jobs = set()
+_long_running_pool = None
+
+
+def thread_pool(long_running=False):
+    """The pool for short, interactive jobs, or the separate one for jobs that run for minutes."""
+    global _long_running_pool
+    if long_running:
+        if _long_running_pool is None:
+            _long_running_pool = QThreadPool()
+            _long_running_pool.setMaxThreadCount(config.LONG_RUNNING_THREADS)
+        return _long_running_pool
+    pool = QThreadPool.globalInstance()
+    if pool.maxThreadCount() != config.WORKER_THREADS:
+        pool.setMaxThreadCount(config.WORKER_THREADS)
+    return pool
+
+
+def run_job(fn, *args, on_result=None, on_error=None, on_progress=None, on_finished=None,
+            on_status=None, pass_job=False, long_running=False, **kwargs):
+    """Start fn(*args, **kwargs) in the background and return its Job.
+
+    Syncs, bulk sends, batch drafts and downloads pass long_running=True so they
+    never hold up logins, refreshes and body loads on the interactive threads.
+    """
+    job = Job(fn, *args, pass_job=pass_job, **kwargs)
+    if on_result:
+        job.signals.result.connect(on_result)
+    if on_error:
+        job.signals.error.connect(on_error)
+    if on_progress:
+        job.signals.progress.connect(on_progress)
+    if on_status:
+        job.signals.status.connect(on_status)
+    if on_finished:
+        job.signals.finished.connect(on_finished)
+    job.signals.finished.connect(lambda: _active_jobs.discard(job))
+
+    _active_jobs.add(job)
+    thread_pool(long_running).start(job)
+    return job